@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare rendering the Fancyplot step's figure with one `gradient_fill` per vector
+(the previous approach) against compositing every fill into a single image with
+`fancy_plot`.
+
+Reports the time to build and save each figure and the fraction of pixels that
+visibly differ between the two. With `--tile_size`, also times rendering tiles of
+vectors in parallel processes. The previous approach takes minutes for large n,
+use `--legacy_max_n` to skip it.
+
+Usage, from the repository root unless the package is installed:
+`PYTHONPATH=. python benchmarks/fancyplot_render.py --n 100000 --m 100 --save_dir /tmp`
+"""
+
+import io
+import time
+from functools import partial
+from pathlib import Path
+from typing import Optional
+
+import fire
+import matplotlib.cm
+import matplotlib.image
+import matplotlib.style
+import numpy as np
+from matplotlib.figure import Figure
+
+from example_step_workflow import transform
+from example_step_workflow.steps.fancyplot.plot_utils import fancy_plot, gradient_fill
+
+###############################################################################
+
+
+def _gradient_fill_plot(plot_matrix: np.ndarray) -> Figure:
+    # The previous approach
+    n, m = plot_matrix.shape
+    plot_matrix = plot_matrix[plot_matrix[:, m - 1].argsort()]
+    max_pm = np.amax(plot_matrix)
+    cmap = matplotlib.cm.get_cmap("gnuplot")
+    with matplotlib.style.context("seaborn-whitegrid"):
+        fig = Figure()
+        ax = fig.subplots()
+        for y in plot_matrix:
+            gradient_fill(np.arange(m), y, cmap(np.amax(y) / max_pm), ax=ax)
+
+        ax.set_xlim(1, m)
+        ax.set_ylim(0, max_pm)
+
+    return fig
+
+
+def _render(make_figure, plot_matrix: np.ndarray):
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    make_figure(plot_matrix).savefig(buffer, format="png")
+    return time.perf_counter() - start, buffer.getvalue()
+
+
+def report(
+    n: int = 100000,
+    m: int = 100,
+    seed: int = 1,
+    samples: int = 2000,
+    legacy_max_n: int = 2000,
+    tile_size: Optional[int] = None,
+    save_dir: Optional[str] = None,
+):
+    # Workflow vectors of a sample of random matrices, resampled to n vectors
+    rng = np.random.default_rng(seed)
+    sample, _ = transform(rng.random((min(n, samples), m, m)))
+    plot_matrix = sample[rng.integers(0, len(sample), n)]
+
+    print(f"Fancyplot render: n={n}, m={m}")
+    duration, composite = _render(fancy_plot, plot_matrix)
+    print(f"  composite: {duration:.2f}s")
+    if save_dir is not None:
+        Path(save_dir, "composite.png").write_bytes(composite)
+
+    if tile_size is not None:
+        duration, _ = _render(partial(fancy_plot, tile_size=tile_size), plot_matrix)
+        print(f"  composite tiled: {duration:.2f}s")
+
+    if n <= legacy_max_n:
+        duration, legacy = _render(_gradient_fill_plot, plot_matrix)
+        print(f"  per vector: {duration:.2f}s")
+        if save_dir is not None:
+            Path(save_dir, "per_vector.png").write_bytes(legacy)
+
+        # Visible differences are antialiasing along the fill edges and lines dimmed
+        # by the fills of later vectors, the composite draws every line over the fills
+        difference = np.abs(
+            matplotlib.image.imread(io.BytesIO(composite))
+            - matplotlib.image.imread(io.BytesIO(legacy))
+        ).max(axis=-1)
+        print(
+            f"Pixels differing by more than 10%: {np.mean(difference > 0.1):.2%}, "
+            f"mean difference: {difference.mean():.4f}"
+        )
+
+
+if __name__ == "__main__":
+    fire.Fire(report)
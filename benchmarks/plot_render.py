@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare rendering the Plot step's line plot as one Line2D per vector (the previous
+approach) against the single LineCollection of `line_plot`, serially or in parallel
+tiles of `--tile_size` vectors.
+
+Reports the time to build and save the figure, the peak Python memory allocated
+while doing so, the size of the saved file, and, for raster formats, the largest
+pixel difference between the two outputs.
+
+Usage, from the repository root unless the package is installed:
+`PYTHONPATH=. python benchmarks/plot_render.py --n 10000 --m 100 --fmt png`
+"""
+
+import io
+import time
+import tracemalloc
+from typing import Optional
+
+import fire
+import matplotlib.style
+import numpy as np
+from matplotlib.figure import Figure
+
+from example_step_workflow.utils.plotting import line_plot
+
+###############################################################################
+
+
+def _per_line_plot(plot_matrix: np.ndarray) -> Figure:
+    # The previous approach
+    with matplotlib.style.context("seaborn-whitegrid"):
+        fig = Figure()
+        ax = fig.subplots()
+        for vec in plot_matrix:
+            ax.plot(vec, color="r")
+
+        ax.set_xlim(1, plot_matrix.shape[1])
+        ax.set_ylim(0, np.amax(plot_matrix))
+
+    return fig
+
+
+def _render(make_figure, plot_matrix: np.ndarray, fmt: str):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fig = make_figure(plot_matrix)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt)
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return duration, peak, buffer.getvalue()
+
+
+def report(
+    n: int = 10000,
+    m: int = 100,
+    seed: int = 1,
+    fmt: str = "png",
+    tile_size: Optional[int] = None,
+):
+    # Vectors shaped like the Sum step outputs
+    rng = np.random.default_rng(seed)
+    plot_matrix = np.cumsum(np.sort(rng.random((n, m)), axis=1), axis=1)
+
+    renderers = {
+        "per line": _per_line_plot,
+        "collection": line_plot,
+        "collection rasterized": lambda pm: line_plot(pm, rasterized=True),
+    }
+    if tile_size is not None:
+        renderers["collection tiled"] = lambda pm: line_plot(pm, tile_size=tile_size)
+
+    print(f"Plot render: n={n}, m={m}, format={fmt}")
+    outputs = {}
+    for name, make_figure in renderers.items():
+        duration, peak, data = _render(make_figure, plot_matrix, fmt)
+        outputs[name] = data
+        print(
+            f"{name:>22}: {duration:.2f}s, peak memory {peak / 2**20:.1f} MiB, "
+            f"file {len(data) / 2**10:.0f} KiB"
+        )
+
+    # Check the outputs look the same
+    if fmt == "png":
+        import matplotlib.image
+
+        images = {
+            name: matplotlib.image.imread(io.BytesIO(data))
+            for name, data in outputs.items()
+        }
+        difference = np.abs(images["per line"] - images["collection"])
+        print(
+            f"Pixel difference: max={difference.max():.3f}, "
+            f"pixels differing={np.mean(difference.max(axis=-1) > 0):.4%}"
+        )
+
+
+if __name__ == "__main__":
+    fire.Fire(report)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Report the accuracy of the float32 workflow against float64.
+
+The float32 matrices are generated by `MappedRaw`, then both inverted and summed by
+the workflow kernels in single precision and, after upcasting the same matrices, in
+double precision. Any difference is therefore due to the reduced precision of the
+inversion and cumulative sum only.
+
+Usage, from the repository root unless the package is installed:
+`PYTHONPATH=. python benchmarks/precision_report.py --n 100 --m 100 --seed 1`
+"""
+
+import time
+
+import fire
+import numpy as np
+
+from example_step_workflow.steps import MappedRaw
+from example_step_workflow.utils.kernels import invert_matrix, sum_matrix
+
+###############################################################################
+
+
+def _pipeline(mat: np.ndarray):
+    inv = invert_matrix(mat)
+    vec = sum_matrix(inv)
+    return inv, vec
+
+
+def report(n: int = 100, m: int = 100, seed: int = 1):
+    inv_errors = []
+    vec_errors = []
+    conds = []
+    durations = {np.float32: 0.0, np.float64: 0.0}
+    for i in range(n):
+        mat32 = MappedRaw._generate(i, m, seed, "float32")
+        mat64 = mat32.astype(np.float64)
+
+        start = time.perf_counter()
+        inv32, vec32 = _pipeline(mat32)
+        durations[np.float32] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        inv64, vec64 = _pipeline(mat64)
+        durations[np.float64] += time.perf_counter() - start
+
+        inv_errors.append(np.linalg.norm(inv32 - inv64) / np.linalg.norm(inv64))
+        vec_errors.append(np.max(np.abs(vec32 - vec64)) / np.max(np.abs(vec64)))
+        conds.append(np.linalg.cond(mat64))
+
+    inv_errors = np.array(inv_errors)
+    vec_errors = np.array(vec_errors)
+    print(f"Standard workflow: n={n}, m={m}, seed={seed}")
+    print(f"Bytes per matrix: float64={m * m * 8}, float32={m * m * 4}")
+    print(
+        f"Invert + sum time: float64={durations[np.float64]:.3f}s, "
+        f"float32={durations[np.float32]:.3f}s"
+    )
+    print(
+        f"Matrix condition number: median={np.median(conds):.3g}, max={max(conds):.3g}"
+    )
+    for name, errors in [("Inversion", inv_errors), ("Vector", vec_errors)]:
+        print(
+            f"{name} relative error: median={np.median(errors):.3g}, "
+            f"p99={np.percentile(errors, 99):.3g}, max={errors.max():.3g}"
+        )
+
+
+if __name__ == "__main__":
+    fire.Fire(report)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare handing matrices between worker processes in Dask memory, the default of
+`--in_memory`, with handing them off in shared memory, as `--shared_memory` does.
+
+Matrices are generated on one worker process and summed on another, so every matrix
+crosses between processes. Reports the time of the consumer tasks, which includes
+fetching their inputs, the peak memory of the workers and the shared memory used.
+
+Usage, from the repository root unless the package is installed:
+`PYTHONPATH=. python benchmarks/shm_transport.py --n 64 --m 1024`
+"""
+
+import resource
+import shutil
+import time
+from functools import partial
+
+import fire
+from distributed import Client, LocalCluster, wait
+
+from example_step_workflow.steps import MappedRaw
+from example_step_workflow.utils.kernels import sum_matrix
+from example_step_workflow.utils.shm import (
+    SHM_ROOT,
+    release,
+    run_shared,
+    shared_dir,
+)
+
+###############################################################################
+
+
+def _peak_rss() -> int:
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _dask(client: Client, producer: str, consumer: str, n: int, m: int):
+    arrays = client.map(
+        MappedRaw._generate, range(n), m=m, seed=1, dtype="float64", workers=producer
+    )
+    wait(arrays)
+
+    start = time.perf_counter()
+    wait(client.map(sum_matrix, arrays, workers=consumer))
+    return time.perf_counter() - start, 0
+
+
+def _shared(client: Client, producer: str, consumer: str, n: int, m: int):
+    directory = shared_dir("benchmark")
+    kernel = partial(MappedRaw._generate, m=m, seed=1, dtype="float64")
+    names = [f"matrix_{i}.npy" for i in range(n)]
+    results = client.gather(
+        client.map(
+            run_shared,
+            [kernel for name in names],
+            names,
+            keep_dir=directory,
+            workers=producer,
+            pure=False,
+        )
+    )
+    paths = [result.shared_path for result in results]
+    shm_bytes = shutil.disk_usage(SHM_ROOT).used
+
+    start = time.perf_counter()
+    wait(
+        client.map(
+            run_shared, [sum_matrix for name in names], names, paths, workers=consumer
+        )
+    )
+    duration = time.perf_counter() - start
+
+    for path in paths:
+        release(path)
+
+    return duration, shm_bytes
+
+
+def report(n: int = 64, m: int = 1024):
+    print(f"Transport: n={n}, m={m}, {n * m * m * 8 / 1e6:.0f} MB of matrices")
+    print(f"{'path':<10}{'consume s':>12}{'peak RSS MB':>14}{'shm MB':>10}")
+    for label, func in [("dask", _dask), ("shared", _shared)]:
+        # A fresh cluster per path, so peak memory isn't carried over
+        with LocalCluster(
+            n_workers=2, threads_per_worker=1, processes=True
+        ) as cluster, Client(cluster) as client:
+            producer, consumer = list(client.scheduler_info()["workers"])
+            baseline = shutil.disk_usage(SHM_ROOT).used
+            duration, shm_bytes = func(client, producer, consumer, n, m)
+            peak = sum(client.run(_peak_rss).values())
+            shm_bytes = max(shm_bytes - baseline, 0)
+
+        print(
+            f"{label:<10}{duration:>12.3f}{peak / 1e6:>14.0f}{shm_bytes / 1e6:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    fire.Fire(report)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Report the per matrix latency of the in-process `transform` API.
+
+Usage, from the repository root unless the package is installed:
+`PYTHONPATH=. python benchmarks/transform_latency.py --n 1024 --m 100 --n_threads 1`
+"""
+
+import time
+
+import fire
+import numpy as np
+
+from example_step_workflow import transform
+
+###############################################################################
+
+
+def report(
+    n: int = 1024, m: int = 100, n_threads: int = 1, batch_size: int = 64, seed: int = 1
+):
+    matrices = np.random.default_rng(seed).random((n, m, m))
+
+    # Warm up
+    transform(matrices[:batch_size], n_threads=n_threads, batch_size=batch_size)
+
+    start = time.perf_counter()
+    transform(matrices, n_threads=n_threads, batch_size=batch_size)
+    duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for mat in matrices[:batch_size]:
+        transform(mat)
+    single = (time.perf_counter() - start) / min(n, batch_size)
+
+    print(f"Transform: n={n}, m={m}, n_threads={n_threads}, batch_size={batch_size}")
+    print(f"Batched latency per matrix: {duration / n * 1e6:.0f}us")
+    print(f"Single matrix call latency: {single * 1e6:.0f}us")
+
+
+if __name__ == "__main__":
+    fire.Fire(report)
@@ -8,6 +8,8 @@ __email__ = "jacksonb@alleninstitute.org"
 # Details in CONTRIBUTING.md
 __version__ = "0.1.0"
 
+from .api import transform  # noqa: F401
+
 
 def get_module_version():
     return __version__
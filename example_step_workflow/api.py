@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Run the workflow transform on in-memory arrays, without staging directories,
+manifests or a Dask cluster.
+"""
+
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+import numpy as np
+from matplotlib.figure import Figure
+
+from .utils.kernels import invert_matrix, sum_matrix
+from .utils.plotting import line_plot
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+def _batches(
+    matrices: Union[np.ndarray, Iterable[np.ndarray]], batch_size: int
+) -> Iterator[np.ndarray]:
+    # Slice stacks without copying
+    if isinstance(matrices, np.ndarray):
+        if matrices.ndim == 2:
+            matrices = matrices[np.newaxis]
+
+        for start in range(0, len(matrices), batch_size):
+            yield matrices[start : start + batch_size]
+
+        return
+
+    # Stack the matrices of an iterator batch by batch
+    matrices = iter(matrices)
+    while True:
+        batch = list(islice(matrices, batch_size))
+        if len(batch) == 0:
+            return
+
+        yield np.stack(batch)
+
+
+def _transform_batch(batch: np.ndarray) -> np.ndarray:
+    return sum_matrix(invert_matrix(batch))
+
+
+def transform(
+    matrices: Union[np.ndarray, Iterable[np.ndarray]],
+    n_threads: int = 1,
+    batch_size: int = 64,
+    plot: bool = False,
+) -> Tuple[np.ndarray, Optional[Figure]]:
+    """
+    Invert and sum matrices in this process, exactly as the `Invert` and `Sum` steps
+    (and their mapped versions) do, and optionally plot the vectors like `Plot`.
+
+    Nothing is written to disk.
+
+    Parameters
+    ----------
+    matrices: Union[np.ndarray, Iterable[np.ndarray]]
+        A single (m, m) matrix, a stack of shape (n, m, m), or an iterable of (m, m)
+        matrices. Iterables are consumed one batch at a time.
+    n_threads: int
+        The number of threads transforming batches concurrently. numpy releases the
+        GIL while inverting, so threads scale with the available cores; limit the
+        BLAS threads (e.g. `OMP_NUM_THREADS=1`) when using more than one.
+        Default: 1 (Transform in the calling thread)
+    batch_size: int
+        The number of matrices inverted and summed per numpy call. Larger batches
+        amortize the per call overhead that dominates for small matrices.
+        Default: 64
+    plot: bool
+        Should the vectors be plotted.
+        Default: False (Do not plot)
+
+    Returns
+    -------
+    vectors: np.ndarray
+        The cumulative vectors, one row of shape (m,) per matrix, with the precision
+        of the matrices.
+    fig: Optional[Figure]
+        The line plot of the vectors if requested.
+    """
+    batches = _batches(matrices, batch_size)
+
+    # Transform the batches in order
+    if n_threads > 1:
+        results = []
+        with ThreadPoolExecutor(n_threads) as executor:
+            # Only read a few batches ahead of the threads so iterators stay lazy
+            pending = deque()
+            for batch in batches:
+                if len(pending) >= 2 * n_threads:
+                    results.append(pending.popleft().result())
+
+                pending.append(executor.submit(_transform_batch, batch))
+
+            results += [future.result() for future in pending]
+    else:
+        results = [_transform_batch(batch) for batch in batches]
+
+    if len(results) == 0:
+        raise ValueError("No matrices provided.")
+
+    vectors = np.concatenate(results)
+
+    # Plot the vectors as red lines
+    fig = line_plot(vectors) if plot else None
+
+    return vectors, fig
@@ -8,17 +8,66 @@ When you add steps to you step workflow be sure to add them to the step list
 and configure their IO in the `run` function.
 """
 
+import inspect
+import json
 import logging
 import os
+import tempfile
+import time
 from datetime import datetime
 from pathlib import Path
+from typing import Any, Dict, Optional, Union
 
+import numpy as np
+import pandas as pd
 from dask_jobqueue import SLURMCluster
-from distributed import LocalCluster
-from prefect import Flow
+from distributed import Client, LocalCluster
+from prefect import Flow, task
 from prefect.engine.executors import DaskExecutor
 
 from example_step_workflow import steps
+from example_step_workflow.utils.blas import BlasThreads, tune_blas
+from example_step_workflow.utils.debug import (
+    StepTiming,
+    extrapolate,
+    format_extrapolation,
+)
+from example_step_workflow.utils.handoff import ArrayHandoff, unpublish
+from example_step_workflow.utils.planner import (
+    ClusterPlan,
+    format_plan,
+    local_cluster_kwargs,
+    plan_cluster,
+    slurm_cluster_kwargs,
+)
+from example_step_workflow.utils.preview import PlotPreview
+from example_step_workflow.utils.shm import SharedHandoff, release_handoff
+from example_step_workflow.utils.stream import (
+    DirectoryWatcher,
+    ManifestWatcher,
+    Stream,
+    StreamDirs,
+    parse_index,
+)
+from example_step_workflow.utils.sweep import (
+    RAW_PARAMS,
+    expand_grid,
+    first_items,
+    group_configs,
+    group_size,
+    staging_config,
+    sweep_workload,
+)
+from example_step_workflow.utils.transfer import (
+    LocalStore,
+    QuiltStore,
+    TransferEngine,
+    unique_steps,
+)
+from example_step_workflow.utils.transport import (
+    check_transport_failures,
+    transport_mode,
+)
 
 ###############################################################################
 
@@ -41,11 +90,66 @@ class All:
             steps.Fancyplot(),
         ]
 
+    @staticmethod
+    def _spawn_cluster(
+        cluster_plan: ClusterPlan,
+        distributed: bool,
+        local_directory: Optional[str] = None,
+    ) -> Union[LocalCluster, SLURMCluster]:
+        # Spawn the cluster of a plan, the local directory of SLURM workers defaults
+        # to the log directory
+        if distributed:
+            # Log dir settings
+            log_dir_name = datetime.now().isoformat().split(".")[0]  # Do not include ms
+            log_dir = Path(f".logs/{log_dir_name}/")
+            log_dir.mkdir(parents=True)
+
+            # Spawn cluster
+            cluster = SLURMCluster(
+                **slurm_cluster_kwargs(
+                    cluster_plan,
+                    log_dir=log_dir,
+                    local_directory=local_directory or log_dir,
+                )
+            )
+
+            # Set adaptive scaling
+            cluster.adapt(minimum_jobs=1, maximum_jobs=cluster_plan.workers)
+
+        else:
+            # Stop conflicts between Dask and OpenBLAS
+            # Info here:
+            # https://stackoverflow.com/questions/45086246/too-many-memory-regions-error-with-dask
+            os.environ["OMP_NUM_THREADS"] = str(cluster_plan.blas_threads)
+
+            # Spawn local cluster
+            cluster = LocalCluster(**local_cluster_kwargs(cluster_plan))
+
+        return cluster
+
     def run(
         self,
         distributed: bool = False,
         clean: bool = False,
         debug: bool = False,
+        debug_items: int = 8,
+        debug_max_m: int = 512,
+        resume: bool = False,
+        speculate: Optional[float] = None,
+        retries: int = 0,
+        failure_policy: str = "fail",
+        memoize: bool = False,
+        in_memory: bool = False,
+        locality: bool = False,
+        shared_memory: bool = False,
+        persist: bool = False,
+        plot_mode: str = "lines",
+        render_tile_size: Optional[int] = None,
+        aggregate: bool = False,
+        preview_interval: Optional[float] = None,
+        preview_items: int = 64,
+        plan: bool = False,
+        blas_threads: Union[int, str] = 1,
         **kwargs,
     ):
         """
@@ -60,9 +164,108 @@ class All:
             Should the local staging directory be cleaned prior to this run.
             Default: False (Do not clean)
         debug: bool
-            A debug flag for the developer to use to manipulate how much data runs,
-            how it is processed, etc.
-            Default: False (Do not debug)
+            Run a fast, representative sample of the workflow instead: a stratified
+            sample of debug_items of the n matrices, at most debug_max_m squared,
+            every step one after another on a single thread of this process and
+            plots without tiling. Prints the runtime of every step extrapolated to
+            the full run on its planned cluster, also stored to debug_report.json in
+            the local staging directory. The outputs of the sample replace those of
+            prior runs.
+            Default: False (Run the workflow)
+        debug_items: int
+            The number of matrices of a debug run.
+            Default: 8
+        debug_max_m: int
+            The largest squared shape of the matrices of a debug run.
+            Default: 512
+        resume: bool
+            Should each step skip the items a prior, possibly interrupted, run
+            already completed. Also allows extending a prior run by increasing n.
+            Default: False (Process all items)
+        speculate: Optional[float]
+            Should each mapped step duplicate items still running after this multiple
+            of the median item runtime on another worker, keeping whichever copy
+            finishes first. Mitigates slow or overloaded nodes at the end of a step.
+            Default: None (No duplicates)
+        retries: int
+            How many times should each mapped step retry an item after a transient
+            I/O error.
+            Default: 0
+        failure_policy: str
+            "fail" to stop the workflow at the first item that fails, or "continue"
+            to quarantine failed items to quarantine.csv in the directory of their
+            step and process every other item. Downstream steps skip quarantined
+            items, rerun with resume once their inputs are fixed. Retries and
+            "continue" don't apply with in_memory, locality or shared_memory.
+            Default: "fail"
+        memoize: bool
+            Should each step return the outputs of its last run if it had identical
+            inputs, parameters and code instead of recomputing them. Use clean to
+            force recomputation.
+            Default: False (Recompute the outputs)
+        in_memory: bool
+            Should the matrices and inversions be handed between steps in worker
+            memory instead of through the local staging directory. Only the vectors
+            are saved. Resume and memoize do not apply to in-memory steps.
+            Default: False (Save every intermediate)
+        locality: bool
+            Should the matrices and inversions be handed between steps in the
+            node-local scratch directory of the worker that produced each, with each
+            item scheduled on the worker holding its input when possible. Only the
+            vectors are saved to the local staging directory. The task locality hit
+            rates are stored to run_summary.json in the local staging directory.
+            Resume and memoize do not apply to scratch steps.
+            Default: False (Save every intermediate)
+        shared_memory: bool
+            Should the matrices and inversions be handed between steps in shared
+            memory on this machine, /dev/shm on Linux, so the worker processes map
+            them instead of pickling and copying them. Only the vectors are saved.
+            Every array is freed once the step consuming it is done, or the run
+            ends. Only for local runs, resume and memoize do not apply.
+            Default: False (Save every intermediate)
+        persist: bool
+            When handing off in memory, in scratch or in shared memory, should the
+            matrices and inversions also be saved to the local staging directory.
+            Default: False (Only keep the intermediates in memory, scratch or shared
+            memory)
+        plot_mode: str
+            The mode of the plot step, "lines", "density" or "envelope". Envelope mode
+            has the sum step also save a summary of the vectors to plot from.
+            Default: "lines"
+        render_tile_size: Optional[int]
+            Should the plots be rendered in parallel across the cluster, this many
+            vectors per task, and composited into the final images.
+            Default: None (Render each plot in a single task)
+        aggregate: bool
+            Should the sum step also stack the vectors sorted by their last value on
+            the workers, merged with a tree reduction, so the plot steps start from
+            the assembled matrix instead of reading every vector.
+            Default: False (The plot steps read every vector)
+        preview_interval: Optional[float]
+            Should the sum step save previews of the plots of the vectors completed so
+            far in place of the outputs of the plot steps while the workflow runs,
+            refreshed at most every this many seconds.
+            Default: None (No previews)
+        preview_items: int
+            When previewing, the number of leading items run through every step
+            before the others, so the first previews come once they are summed rather
+            than once every matrix is inverted. The other items then resume from
+            them. Not with memoize, as it would replace the memoized outputs, nor
+            with in_memory, locality or shared_memory, which are not previewed.
+            Default: 64
+        plan: bool
+            Print the cluster planned for this run, sized from the estimated memory
+            and compute of every step for the given n, m and dtype, and exit without
+            running. The planned cluster is used for every run, and the mapped tasks
+            are annotated with the memory they need.
+            Default: False (Run the workflow)
+        blas_threads: Union[int, str]
+            The BLAS threads of every mapped task, the cluster runs fewer tasks at
+            once to match. Use "auto" to benchmark inverting matrices of the run's m
+            with every split of the cores between BLAS threads and tasks, on this
+            machine or, when distributed, on the first SLURM worker. Decisions are
+            cached per host and m to blas_tuning.json in the local staging directory.
+            Default: 1 (Single-threaded BLAS)
 
         Notes
         -----
@@ -72,6 +275,19 @@ class All:
         Basic prefect example:
         https://docs.prefect.io/core/
         """
+        # Shared memory is local to a node
+        if shared_memory and distributed:
+            raise ValueError("Shared memory handoffs are only for local runs.")
+
+        # Handed off items aren't guarded, fail before any cluster is started
+        check_transport_failures(
+            transport_mode(
+                in_memory=in_memory, locality=locality, shared_memory=shared_memory
+            ),
+            retries,
+            failure_policy,
+        )
+
         # Initalize steps
         raw = steps.MappedRaw()
         invert = steps.MappedInvert()
@@ -79,34 +295,69 @@ class All:
         plot = steps.Plot()
         fancyplot = steps.Fancyplot()
 
-        # Choose executor
-        if distributed:
-            # Log dir settings
-            log_dir_name = datetime.now().isoformat().split(".")[0]  # Do not include ms
-            log_dir = Path(f".logs/{log_dir_name}/")
-            log_dir.mkdir(parents=True)
+        # Size the cluster from the workload, defaults as in `MappedRaw.run`
+        raw_defaults = inspect.signature(steps.MappedRaw.run).parameters
+        n = kwargs.get("n", raw_defaults["n"].default)
+        m = kwargs.get("m", raw_defaults["m"].default)
+        dtype = kwargs.get("dtype", raw_defaults["dtype"].default)
 
-            # Spawn cluster
-            cluster = SLURMCluster(
-                cores=2,
-                memory="32GB",
-                walltime="10:00:00",
-                queue="aics_cpu_general",
-                local_directory=str(log_dir),
-                log_directory=str(log_dir),
+        # Local BLAS threads are tuned on this machine, distributed ones on a worker
+        blas_cache = raw.step_local_staging_dir.parent / "blas_tuning.json"
+        tune_on_worker = blas_threads == "auto" and distributed
+        if blas_threads == "auto" and not distributed:
+            blas_threads = tune_blas(m, dtype, cache_path=blas_cache).threads
+
+        cluster_plan = plan_cluster(
+            n=n,
+            m=m,
+            dtype=dtype,
+            distributed=distributed,
+            blas_threads=1 if tune_on_worker else int(blas_threads),
+        )
+        for note in cluster_plan.notes:
+            log.warning(note)
+
+        # Dry run
+        if plan:
+            print(format_plan(cluster_plan))
+            if tune_on_worker:
+                print("BLAS threads will be tuned on the first SLURM worker")
+
+            return
+
+        # Time a sample of the workflow and estimate the full run from it
+        if debug:
+            return self._debug_run(
+                cluster_plan,
+                n=n,
+                m=m,
+                dtype=dtype,
+                debug_items=debug_items,
+                debug_max_m=debug_max_m,
+                clean=clean,
+                plot_mode=plot_mode,
+                raw_kwargs=kwargs,
             )
 
-            # Set adaptive scaling
-            cluster.adapt(minimum_jobs=1, maximum_jobs=40)
+        # Choose executor, scratch handoffs need a directory local to each node
+        cluster = self._spawn_cluster(
+            cluster_plan, distributed, tempfile.gettempdir() if locality else None
+        )
 
-        else:
-            # Stop conflicts between Dask and OpenBLAS
-            # Info here:
-            # https://stackoverflow.com/questions/45086246/too-many-memory-regions-error-with-dask
-            os.environ["OMP_NUM_THREADS"] = "1"
+        # Limit the BLAS threads of every worker, including ones that join later
+        with Client(cluster) as client:
+            if tune_on_worker:
+                layout = client.submit(
+                    tune_blas,
+                    m,
+                    dtype,
+                    cores=cluster_plan.threads_per_worker,
+                    cache_path=blas_cache,
+                    pure=False,
+                ).result()
+                cluster_plan = cluster_plan._replace(blas_threads=layout.threads)
 
-            # Spawn local cluster
-            cluster = LocalCluster()
+            client.register_plugin(BlasThreads(cluster_plan.blas_threads))
 
         # Log bokeh info
         if cluster.dashboard_link:
@@ -115,41 +366,135 @@ class All:
         # Start local dask cluster
         exe = DaskExecutor(cluster.scheduler_address)
 
+        # The plot steps start from the vectors stacked by the sum step
+        aggregate_dir = (
+            cumsum.step_local_staging_dir / "aggregate" if aggregate else None
+        )
+
+        # Previews start from leading items run through every step first
+        lead = (
+            preview_interval is not None
+            and n > preview_items
+            and not (memoize or in_memory or locality or shared_memory)
+        )
+
         # Configure your flow
         with Flow("example_step_workflow") as flow:
+            # Run the leading items through every step, the previews of their vectors
+            # are saved once they are summed
+            lead_vectors = None
+            if lead:
+                lead_matrices = raw(
+                    distributed_executor_address=cluster.scheduler_address,
+                    clean=clean,
+                    resume=resume,
+                    speculate=speculate,
+                    retries=retries,
+                    failure_policy=failure_policy,
+                    task_resources=cluster_plan.task_resources,
+                    **{**kwargs, "n": preview_items},
+                )
+                lead_inversions = invert(
+                    lead_matrices,
+                    distributed_executor_address=cluster.scheduler_address,
+                    clean=clean,
+                    resume=resume,
+                    speculate=speculate,
+                    retries=retries,
+                    failure_policy=failure_policy,
+                    task_resources=cluster_plan.task_resources,
+                )
+                lead_vectors = cumsum(
+                    lead_inversions,
+                    distributed_executor_address=cluster.scheduler_address,
+                    clean=clean,
+                    resume=resume,
+                    speculate=speculate,
+                    retries=retries,
+                    failure_policy=failure_policy,
+                    task_resources=cluster_plan.task_resources,
+                    preview_interval=preview_interval,
+                )
+
             # If your step utilizes a secondary flow with dask pass the executor address
             # If you want to clean the local staging directories pass clean
             # If you want to utilize some debugging functionality pass debug
             # If you don't utilize any of these, just pass the parameters you need.
+            # The other items resume from the leading ones
             matrices = raw(
                 distributed_executor_address=cluster.scheduler_address,
-                clean=clean,
+                clean=clean and not lead,
                 debug=debug,
+                resume=resume or lead,
+                speculate=speculate,
+                retries=retries,
+                failure_policy=failure_policy,
+                task_resources=cluster_plan.task_resources,
+                memoize=memoize,
+                in_memory=in_memory,
+                locality=locality,
+                shared_memory=shared_memory,
+                persist=persist,
                 **kwargs,  # Allows us to pass `--n {some integer}` or other params
+                upstream_tasks=[] if lead_vectors is None else [lead_vectors],
             )
             inversions = invert(
                 matrices,
                 distributed_executor_address=cluster.scheduler_address,
-                clean=clean,
+                clean=clean and not lead,
                 debug=debug,
+                resume=resume or lead,
+                speculate=speculate,
+                retries=retries,
+                failure_policy=failure_policy,
+                task_resources=cluster_plan.task_resources,
+                memoize=memoize,
+                in_memory=in_memory,
+                locality=locality,
+                shared_memory=shared_memory,
+                persist=persist,
             )
             vectors = cumsum(
                 inversions,
                 distributed_executor_address=cluster.scheduler_address,
-                clean=clean,
+                clean=clean and not lead,
                 debug=debug,
+                resume=resume or lead,
+                speculate=speculate,
+                retries=retries,
+                failure_policy=failure_policy,
+                task_resources=cluster_plan.task_resources,
+                memoize=memoize,
+                summarize=plot_mode == "envelope",
+                aggregate=aggregate,
+                preview_interval=preview_interval,
             )
             plot(
                 vectors,
                 distributed_executor_address=cluster.scheduler_address,
                 clean=clean,
                 debug=debug,
+                memoize=memoize,
+                mode=plot_mode,
+                summary=cumsum.step_local_staging_dir / "summary.npz",
+                aggregate=aggregate_dir,
+                render_tile_size=render_tile_size,
             )
             fancyplot(
                 vectors,
                 distributed_executor_address=cluster.scheduler_address,
                 clean=clean,
                 debug=debug,
+                memoize=memoize,
+                aggregate=aggregate_dir,
+                render_tile_size=render_tile_size,
+            )
+
+        # Log preview info
+        if preview_interval is not None:
+            log.info(
+                f"Previews stored to: {plot.step_local_staging_dir / 'plots'}, "
+                f"{fancyplot.step_local_staging_dir / 'fancyplots'}"
             )
 
         # Run flow and get ending state
@@ -158,30 +503,588 @@ class All:
         # Get plot location
         log.info(f"Plot stored to: {plot.get_result(state, flow)}")
 
+        # Free the shared and worker memory of steps whose consumer failed, consumed
+        # handoffs are already released
+        with Client(cluster.scheduler_address) as client:
+            for step in [raw, invert]:
+                handoff = step.get_result(state, flow)
+                if isinstance(handoff, SharedHandoff):
+                    release_handoff(handoff)
+                elif isinstance(handoff, ArrayHandoff):
+                    unpublish(client, handoff)
+
+        # Collect the locality stats of the steps run on scratch handoffs
+        if locality:
+            run_summary = {"locality": {}}
+            for step in [invert, cumsum]:
+                stats_path = step.step_local_staging_dir / "locality.json"
+                if stats_path.exists():
+                    with open(stats_path) as read_in:
+                        run_summary["locality"][step.step_name] = json.load(read_in)
+
+            run_summary_path = cumsum.step_local_staging_dir.parent / "run_summary.json"
+            with open(run_summary_path, "w") as write_out:
+                json.dump(run_summary, write_out, indent=4)
+
+            log.info(f"Run summary stored to: {run_summary_path}")
+
         # Close cluster
         if distributed:
             cluster.close()
 
-    def pull(self):
+    @staticmethod
+    def _debug_run(
+        cluster_plan: ClusterPlan,
+        n: int,
+        m: int,
+        dtype: str,
+        debug_items: int,
+        debug_max_m: int,
+        clean: bool,
+        plot_mode: str,
+        raw_kwargs: Dict[str, Any],
+    ):
+        # Initalize steps
+        raw = steps.MappedRaw()
+        invert = steps.MappedInvert()
+        cumsum = steps.MappedSum()
+        plot = steps.Plot()
+        fancyplot = steps.Fancyplot()
+
+        # Every step is timed, so nothing is reused
+        step_kwargs = dict(
+            clean=clean, debug=True, debug_items=debug_items, memoize=False
+        )
+        timings = []
+
+        # A single thread in this process, so the steps run one after another and
+        # can be stepped through with a debugger
+        with LocalCluster(
+            n_workers=1, threads_per_worker=1, processes=False
+        ) as cluster, Client(cluster) as client:
+
+            def timed(step, items, *args, **params):
+                start = time.perf_counter()
+                result = client.submit(
+                    step.run, *args, pure=False, **step_kwargs, **params
+                ).result()
+                seconds = time.perf_counter() - start
+                timings.append(StepTiming(step.step_name, items, seconds))
+                return result
+
+            sample_n, sample_m = min(n, debug_items), min(m, debug_max_m)
+            matrices = timed(
+                raw,
+                sample_n,
+                debug_max_m=debug_max_m,
+                **{**raw_kwargs, "n": n, "m": m, "dtype": dtype},
+            )
+            inversions = timed(invert, len(matrices), matrices)
+            vectors = timed(
+                cumsum, len(inversions), inversions, summarize=plot_mode == "envelope"
+            )
+            timed(
+                plot,
+                len(vectors),
+                vectors,
+                mode=plot_mode,
+                summary=cumsum.step_local_staging_dir / "summary.npz",
+            )
+            timed(fancyplot, len(vectors), vectors)
+
+        extrapolations = extrapolate(
+            timings, n, m, sample_n, sample_m, cluster_plan, dtype=dtype
+        )
+        print(format_extrapolation(extrapolations, cluster_plan))
+
+        report_path = raw.step_local_staging_dir.parent / "debug_report.json"
+        with open(report_path, "w") as write_out:
+            json.dump(
+                {
+                    "n": n,
+                    "m": m,
+                    "sample_n": sample_n,
+                    "sample_m": sample_m,
+                    "steps": [e._asdict() for e in extrapolations],
+                    "plan": cluster_plan._asdict(),
+                },
+                write_out,
+                indent=4,
+            )
+
+        log.info(f"Debug report stored to: {report_path}")
+
+    def watch(
+        self,
+        input_dir: Optional[str] = None,
+        pattern: str = "*.npy",
+        distributed: bool = False,
+        n: int = 1000,
+        m: int = 100,
+        dtype: str = "float64",
+        blas_threads: int = 1,
+        max_batch: int = 16,
+        poll_interval: float = 1.0,
+        preview_interval: float = 60.0,
+        retries: int = 0,
+        failure_policy: str = "continue",
+        idle_timeout: Optional[float] = None,
+        max_items: Optional[int] = None,
+    ):
+        """
+        Stream newly arriving matrices through the invert and sum steps on a
+        persistent cluster until interrupted.
+
+        Every new matrix is inverted and summed as soon as there is a free thread,
+        with its outputs saved and appended to the manifests of the mapped steps as
+        it completes, so the other commands see every item processed so far. Under
+        load arrivals are coalesced into batches. Previews of the plots of every
+        vector are refreshed incrementally in place of the outputs of the plot steps,
+        run the plot steps for the final plots.
+
+        Parameters
+        ----------
+        input_dir: Optional[str]
+            A directory instruments add .npy matrices to. Each matrix is copied to the
+            raw step as the next matrix, with its source recorded in the manifest so
+            restarting only processes the matrices that are new.
+            Default: None (Watch the manifest of the raw step instead)
+        pattern: str
+            The glob pattern of the matrices of the input directory.
+            Default: "*.npy"
+        distributed: bool
+            Create a SLURMCluster to use for job distribution.
+            Default: False (Create a LocalCluster)
+        n: int
+            The number of matrices expected, only used to size the cluster, see
+            `run`.
+            Default: 1000
+        m: int
+            The squared shape of the matrices expected, only used to size the
+            cluster.
+            Default: 100
+        dtype: str
+            The floating point precision of the matrices expected, only used to size
+            the cluster.
+            Default: "float64"
+        blas_threads: int
+            The BLAS threads of every task.
+            Default: 1
+        max_batch: int
+            The maximum number of matrices processed by a single task.
+            Default: 16
+        poll_interval: float
+            The number of seconds between checks for new matrices.
+            Default: 1.0
+        preview_interval: float
+            The minimum number of seconds between refreshes of the previews.
+            Default: 60.0
+        retries: int
+            How many times an item is retried after a transient I/O error.
+            Default: 0
+        failure_policy: str
+            "continue" to quarantine the matrices that fail to watch_quarantine.csv
+            in the local staging directory and carry on, they are retried on restart,
+            or "fail" to stop at the first one.
+            Default: "continue"
+        idle_timeout: Optional[float]
+            Stop once no matrix arrived for this many seconds.
+            Default: None (Run until interrupted)
+        max_items: Optional[int]
+            Stop once this many matrices arrived and were processed.
+            Default: None (Run until interrupted)
+        """
+        raw = steps.MappedRaw()
+        invert = steps.MappedInvert()
+        cumsum = steps.MappedSum()
+        manifests = {
+            "raw": raw.step_local_staging_dir / "manifest.csv",
+            "inverted": invert.step_local_staging_dir / "manifest.csv",
+            "summed": cumsum.step_local_staging_dir / "manifest.csv",
+        }
+
+        # Items of prior runs are never processed again
+        done = []
+        if manifests["summed"].is_file():
+            done = [Path(f).name for f in pd.read_csv(manifests["summed"])["filepath"]]
+
+        prior = pd.DataFrame(columns=["filepath"])
+        if manifests["raw"].is_file():
+            prior = pd.read_csv(manifests["raw"])
+
+        if input_dir is None:
+            watcher = ManifestWatcher(
+                manifests["raw"],
+                seen=[f for f in prior["filepath"] if Path(f).name in set(done)],
+            )
+            dirs = StreamDirs(
+                None,
+                invert.step_local_staging_dir / "inverted",
+                cumsum.step_local_staging_dir / "sum",
+            )
+            next_index = 0
+        else:
+            sources = prior["source"].dropna() if "source" in prior else []
+            watcher = DirectoryWatcher(input_dir, pattern, seen=sources)
+            dirs = StreamDirs(
+                raw.step_local_staging_dir / "matrices",
+                invert.step_local_staging_dir / "inverted",
+                cumsum.step_local_staging_dir / "sum",
+            )
+            next_index = max([parse_index(f) + 1 for f in prior["filepath"]] or [0])
+
+        # Previews start from the vectors of prior runs
+        preview = PlotPreview(
+            cumsum.step_local_staging_dir.parent, interval=preview_interval
+        )
+        if manifests["summed"].is_file():
+            for vector in pd.read_csv(manifests["summed"])["filepath"]:
+                preview.add(np.load(vector))
+
+        cluster_plan = plan_cluster(
+            n=n, m=m, dtype=dtype, distributed=distributed, blas_threads=blas_threads
+        )
+        for note in cluster_plan.notes:
+            log.warning(note)
+
+        cluster = self._spawn_cluster(cluster_plan, distributed)
+        if cluster.dashboard_link:
+            log.info(f"Dask UI running at: {cluster.dashboard_link}")
+
+        with Client(cluster) as client:
+            client.register_plugin(BlasThreads(cluster_plan.blas_threads))
+            stream = Stream(
+                client,
+                watcher,
+                dirs,
+                manifests,
+                next_index=next_index,
+                preview=preview,
+                quarantine_path=raw.step_local_staging_dir.parent
+                / "watch_quarantine.csv",
+                max_batch=max_batch,
+                poll_interval=poll_interval,
+                retries=retries,
+                failure_policy=failure_policy,
+                task_resources=cluster_plan.task_resources,
+            )
+            log.info(f"Watching for new matrices in: {input_dir or manifests['raw']}")
+            stream.run(idle_timeout=idle_timeout, max_items=max_items)
+
+        cluster.close()
+
+    def sweep(
+        self,
+        grid: Dict[str, Any],
+        distributed: bool = False,
+        clean: bool = False,
+        resume: bool = False,
+        speculate: Optional[float] = None,
+        retries: int = 0,
+        failure_policy: str = "fail",
+        memoize: bool = False,
+        plot_mode: str = "lines",
+        aggregate: bool = False,
+        plan: bool = False,
+        blas_threads: int = 1,
+        **kwargs,
+    ):
+        """
+        Run the workflow for every configuration of a parameter grid in a single
+        flow on a single cluster.
+
+        Every configuration's steps are staged under its own namespace of the sweep
+        directory of the local staging directory, and the mapped items of every
+        configuration are interleaved on the cluster. The matrix of an item only
+        depends on its index, m, seed and dtype, so configurations with the same m,
+        seed and dtype share their raw, invert and sum steps, run once for their
+        largest n and staged under the namespace of these parameters, e.g.
+        "sweep/m=50_seed=1_dtype=float64". Every configuration plots the vectors of
+        its first n items, with the fancy plot staged under the namespace of its raw
+        parameters, e.g. "sweep/n=100_m=50_seed=1_dtype=float64", and the plot under
+        the namespace of the full configuration. The outcome and plots of every
+        configuration are stored to sweep.csv in the sweep directory.
+
+        Parameters
+        ----------
+        grid: Dict[str, Any]
+            The values of every swept parameter: n, m, seed, dtype or plot_mode, e.g.
+            `--grid '{"n": [100, 1000], "m": [50, 100], "plot_mode": ["lines",
+            "envelope"]}'`. A single value is used for every configuration.
+        distributed: bool
+            Create a SLURMCluster to use for job distribution.
+            Default: False (Create a LocalCluster)
+        clean: bool
+            Should the local staging directories be cleaned prior to this sweep.
+            Default: False (Do not clean)
+        resume: bool
+            Should each step skip the items a prior, possibly interrupted, sweep
+            already completed, see `run`.
+            Default: False (Process all items)
+        speculate: Optional[float]
+            Should each mapped step duplicate slow items, see `run`.
+            Default: None (No duplicates)
+        retries: int
+            How many times should each mapped step retry an item after a transient
+            I/O error.
+            Default: 0
+        failure_policy: str
+            "fail" to stop a configuration at the first item that fails, or
+            "continue" to quarantine failed items, see `run`. A failed configuration
+            doesn't stop the others.
+            Default: "fail"
+        memoize: bool
+            Should each step return the outputs of a prior run with identical inputs,
+            parameters and code instead of recomputing them, so growing a grid only
+            runs the new configurations.
+            Default: False (Recompute the outputs)
+        plot_mode: str
+            The mode of the plot step when not swept, see `run`.
+            Default: "lines"
+        aggregate: bool
+            Should the sum steps also stack the vectors for the plot steps, see `run`.
+            Default: False (The plot steps read every vector)
+        plan: bool
+            Print the configurations and the cluster planned for the matrices of the
+            largest n of every group, and exit without running.
+            Default: False (Run the sweep)
+        blas_threads: int
+            The BLAS threads of every mapped task.
+            Default: 1
+        **kwargs
+            Any other parameters of the raw step, used for every configuration, as for
+            `run`. n, m, seed and dtype are the values of the parameters not swept.
+        """
+        # Parameters not swept default as in `MappedRaw.run`
+        raw_defaults = inspect.signature(steps.MappedRaw.run).parameters
+        defaults = {
+            key: kwargs.pop(key, raw_defaults[key].default) for key in RAW_PARAMS
+        }
+        configs = expand_grid(grid, {**defaults, "plot_mode": plot_mode})
+        groups = group_configs(configs)
+        sweep_dir = self.step_list[0].step_local_staging_dir.parent / "sweep"
+
+        # Size the cluster for the matrices of every group
+        cluster_plan = plan_cluster(
+            **sweep_workload(configs),
+            distributed=distributed,
+            blas_threads=blas_threads,
+        )
+        for note in cluster_plan.notes:
+            log.warning(note)
+
+        # Dry run
+        if plan:
+            print(
+                f"Sweep: {len(configs)} configuration(s) sharing "
+                f"{len(groups)} set(s) of raw matrices "
+                f"of {sum(group_size(members) for members in groups.values())} items"
+            )
+            for config in configs:
+                print(f"  {config.name}")
+
+            print(format_plan(cluster_plan))
+            return
+
+        cluster = self._spawn_cluster(cluster_plan, distributed)
+        with Client(cluster) as client:
+            client.register_plugin(BlasThreads(cluster_plan.blas_threads))
+
+        if cluster.dashboard_link:
+            log.info(f"Dask UI running at: {cluster.dashboard_link}")
+
+        exe = DaskExecutor(cluster.scheduler_address)
+        mapped_kwargs = dict(
+            distributed_executor_address=cluster.scheduler_address,
+            clean=clean,
+            resume=resume,
+            speculate=speculate,
+            retries=retries,
+            failure_policy=failure_policy,
+            task_resources=cluster_plan.task_resources,
+            memoize=memoize,
+        )
+        plot_kwargs = dict(
+            distributed_executor_address=cluster.scheduler_address,
+            clean=clean,
+            memoize=memoize,
+        )
+
+        # Configure one flow for every configuration, the steps of a group are
+        # shared by its configurations
+        tasks = {}
+        with Flow("example_step_workflow_sweep") as flow:
+            for group, members in groups.items():
+                raw = steps.MappedRaw(config=staging_config(sweep_dir, group))
+                invert = steps.MappedInvert(config=staging_config(sweep_dir, group))
+                cumsum = steps.MappedSum(config=staging_config(sweep_dir, group))
+
+                # Run the group for its largest n, and summarize and aggregate the
+                # first items of every smaller n of its configurations
+                size = group_size(members)
+                sizes = sorted({config.raw_params["n"] for config in members} - {size})
+
+                matrices = raw(
+                    **mapped_kwargs, **{**members[0].raw_params, "n": size}, **kwargs
+                )
+                inversions = invert(matrices, **mapped_kwargs)
+                vectors = cumsum(
+                    inversions,
+                    **mapped_kwargs,
+                    summarize=any(
+                        config.plot_params["plot_mode"] == "envelope"
+                        for config in members
+                    ),
+                    aggregate=aggregate,
+                    subsets=sizes,
+                )
+
+                # Every configuration plots the vectors of its first n items
+                subsets = {}
+                for config in members:
+                    n = config.raw_params["n"]
+                    suffix = "" if n == size else f"_{n}"
+                    aggregate_dir = (
+                        cumsum.step_local_staging_dir / f"aggregate{suffix}"
+                        if aggregate
+                        else None
+                    )
+                    if config.subset not in subsets:
+                        fancyplot = steps.Fancyplot(
+                            config=staging_config(sweep_dir, config.subset)
+                        )
+                        subset = vectors if n == size else task(first_items)(vectors, n)
+                        subsets[config.subset] = (
+                            subset,
+                            fancyplot(subset, **plot_kwargs, aggregate=aggregate_dir),
+                        )
+
+                    subset, fancy = subsets[config.subset]
+                    plot = steps.Plot(config=staging_config(sweep_dir, config.name))
+                    lines = plot(
+                        subset,
+                        **plot_kwargs,
+                        mode=config.plot_params["plot_mode"],
+                        summary=cumsum.step_local_staging_dir / f"summary{suffix}.npz",
+                        aggregate=aggregate_dir,
+                    )
+                    tasks[config.name] = (lines, fancy)
+
+        # Run flow and get ending state
+        state = flow.run(executor=exe)
+
+        # Record the outcome of every configuration
+        records = []
+        for config in configs:
+            lines, fancy = (state.result[task] for task in tasks[config.name])
+            records.append(
+                {
+                    "name": config.name,
+                    "group": config.group,
+                    "subset": config.subset,
+                    **config.raw_params,
+                    **config.plot_params,
+                    "succeeded": lines.is_successful() and fancy.is_successful(),
+                    "plot": lines.result if lines.is_successful() else None,
+                    "fancyplot": fancy.result if fancy.is_successful() else None,
+                }
+            )
+
+        sweep_path = sweep_dir / "sweep.csv"
+        pd.DataFrame(records).to_csv(sweep_path, index=False)
+        log.info(f"Sweep of {len(configs)} configuration(s) stored to: {sweep_path}")
+
+        cluster.close()
+
+    def _transfer_engine(
+        self, store: Optional[str] = None, max_workers: int = 4
+    ) -> TransferEngine:
+        # The quilt registry of the steps, or a directory standing in for it
+        if store is None:
+            step = self.step_list[0]
+            package_store = QuiltStore(
+                f"{step.quilt_package_owner}/{step.quilt_package_name}",
+                step.storage_bucket,
+            )
+        else:
+            package_store = LocalStore(store)
+
+        return TransferEngine(package_store, max_workers=max_workers)
+
+    def _branch(self) -> str:
+        # Normalized as in `Step.push` so names like feature/x don't nest
+        return self.step_list[0]._get_current_git_branch().replace("/", ".")
+
+    def pull(self, store: Optional[str] = None, max_workers: int = 4):
         """
         Pull all steps.
+
+        Checks out the upstream steps of every step concurrently, only fetching the
+        files that differ from the local ones.
+
+        Parameters
+        ----------
+        store: Optional[str]
+            A directory to pull from instead of the quilt registry of the steps.
+            Default: None (The quilt registry)
+        max_workers: int
+            The number of steps, and of batches of files, transferred at once.
+            Default: 4
         """
-        for step in self.step_list:
-            step.pull()
+        upstreams = unique_steps(
+            [Upstream() for step in self.step_list for Upstream in step._upstream_tasks]
+        )
+        self._transfer_engine(store, max_workers).checkout(
+            list(upstreams), self._branch()
+        )
 
-    def checkout(self):
+    def checkout(self, store: Optional[str] = None, max_workers: int = 4):
         """
         Checkout all steps.
+
+        Checks out every step concurrently, only fetching the files that differ
+        from the local ones.
+
+        Parameters
+        ----------
+        store: Optional[str]
+            A directory to check out from instead of the quilt registry of the steps.
+            Default: None (The quilt registry)
+        max_workers: int
+            The number of steps, and of batches of files, transferred at once.
+            Default: 4
         """
-        for step in self.step_list:
-            step.checkout()
+        self._transfer_engine(store, max_workers).checkout(
+            self.step_list, self._branch()
+        )
 
-    def push(self):
+    def push(self, store: Optional[str] = None, max_workers: int = 4):
         """
         Push all steps.
+
+        Pushes every step concurrently, only uploading the files whose checksums
+        differ from the last push and batching small files together.
+
+        Parameters
+        ----------
+        store: Optional[str]
+            A directory to push to instead of the quilt registry of the steps.
+            Default: None (The quilt registry)
+        max_workers: int
+            The number of steps, and of batches of files, transferred at once.
+            Default: 4
         """
-        for step in self.step_list:
-            step.push()
+        branch = self._branch()
+        message = None
+        if store is None:
+            # Data in the registry must be traceable to committed code
+            step = self.step_list[0]
+            step._check_git_status_is_clean(
+                f"{step.quilt_package_owner}/{step.quilt_package_name}/{branch}"
+            )
+            message = step._create_data_commit_message()
+
+        self._transfer_engine(store, max_workers).push(self.step_list, branch, message)
 
     def clean(self):
         """
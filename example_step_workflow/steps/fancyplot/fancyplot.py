@@ -3,18 +3,21 @@
 
 import logging
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 
 import matplotlib
 import matplotlib.pyplot as plt
-import numpy as np
 import pandas as pd
 from datastep import Step, log_run_params
-from tqdm import tqdm
+
+from example_step_workflow.utils.aggregate import load_block
+from example_step_workflow.utils.debug import subsample
+from example_step_workflow.utils.memo import StepCache
+from example_step_workflow.utils.stack import load_stack
 
 from ..sum import Sum
 
-from example_step_workflow.steps.fancyplot.plot_utils import gradient_fill
+from example_step_workflow.steps.fancyplot.plot_utils import fancy_plot
 
 matplotlib.use("agg")
 plt.style.use("seaborn-whitegrid")
@@ -31,7 +34,7 @@ class Fancyplot(Step):
     def __init__(
         self,
         direct_upstream_tasks: List["Step"] = [Sum],
-        config: Optional[Union[str, Path]] = None,
+        config: Optional[Union[str, Path, Dict[str, str]]] = None,
     ):
         super().__init__(direct_upstream_tasks=direct_upstream_tasks, config=config)
 
@@ -40,6 +43,15 @@ class Fancyplot(Step):
         self,
         vectors: Optional[Union[Union[str, Path], List[Path]]] = None,
         filepath_column: str = "filepath",
+        prefetch_depth: int = 4,
+        prefetch_max_bytes: int = 256 * 1024 * 1024,
+        mmap_min_bytes: int = 256 * 1024 * 1024,
+        render_tile_size: Optional[int] = None,
+        render_processes: Optional[int] = None,
+        aggregate: Optional[Union[str, Path]] = None,
+        debug: bool = False,
+        debug_items: int = 8,
+        memoize: bool = False,
         **kwargs,
     ) -> List[Path]:
         """
@@ -55,6 +67,42 @@ class Fancyplot(Step):
         filepath_column: str
             If providing a path to a csv manifest, the column to use for vectors.
             Default: "filepath"
+        prefetch_depth: int
+            The number of vectors to read ahead in the background while the current
+            one is processed. Use 0 to read every vector only when it is needed.
+            Default: 4
+        prefetch_max_bytes: int
+            The maximum total size of the vectors read ahead.
+            Default: 268435456 (256 MiB)
+        mmap_min_bytes: int
+            The size from which the stacked vectors are memory-mapped from disk
+            instead of held in memory.
+            Default: 268435456 (256 MiB)
+        render_tile_size: Optional[int]
+            Render the plot in parallel, this many vectors per task, on the workers of
+            the Dask cluster running the step or otherwise on a pool of processes. The
+            tiles are composited into the final image, which matches the serial render
+            to within antialiasing rounding.
+            Default: None (Render serially)
+        render_processes: Optional[int]
+            The number of processes rendering tiles when not running on a Dask worker.
+            Default: None (One per core)
+        aggregate: Optional[Union[str, Path]]
+            The directory of the vectors stacked and sorted by `MappedSum` with
+            aggregate, see `save_block`. Used instead of reading every vector if it
+            was built from exactly these vectors.
+            Default: None (Read every vector)
+        debug: bool
+            Only plot a deterministic, stratified sample of debug_items of the
+            vectors, see `subsample`, in a single task.
+            Default: False (Plot all vectors)
+        debug_items: int
+            The number of vectors plotted when debugging.
+            Default: 8
+        memoize: bool
+            Return the outputs of the last run if it had identical inputs, parameters
+            and code and they are still intact, instead of recomputing them.
+            Default: False (Recompute the outputs)
 
         Returns
         -------
@@ -76,53 +124,54 @@ class Fancyplot(Step):
             # Convert the specified column into a list of paths
             vectors = [Path(f) for f in raw_data[filepath_column]]
 
+        # Debug plots a stratified sample of the vectors, without tiling
+        if debug:
+            vectors = subsample(vectors, debug_items)
+            render_tile_size = None
+
+        # Return the outputs of an identical prior run if they are intact
+        cache = StepCache(self)
+        cache_key = cache.fingerprint(
+            {"render_tile_size": render_tile_size, **kwargs}, inputs=vectors
+        )
+        if memoize and cache.restore(cache_key):
+            return Path(self.manifest.at[0, "filepath"])
+
         # Storage dir
         plot_dir = self.step_local_staging_dir / "fancyplots"
         plot_dir.mkdir(exist_ok=True)
 
-        # First make matrix from plotting vectors
-        plot_matrix = np.nan
-        for i, vec in tqdm(enumerate(vectors), desc="Plotting vectors"):
-            # Load vector
-            vec = np.load(vec)
-
-            # check length of vector and make plotting matrix
-            if np.any(np.isnan(plot_matrix)):
-                n = len(vectors)
-                m = len(vec)
-                plot_matrix = np.zeros([n, m])
-
-            # fill plotting matrix
-            plot_matrix[i, :] = vec
-
-        # reorder the matrix
-        plot_matrix = plot_matrix[plot_matrix[:, m - 1].argsort()]
-        max_pm = np.amax(plot_matrix)
-
-        # Plot the vectors as fancy fills
-        fig_fill, ax_fill = plt.subplots()  # the second figure, fancy fill plot
-        cmap = plt.cm.get_cmap("gnuplot")
-        for i in range(n):
-            y = plot_matrix[i, :]
-            max_y = np.amax(y)
-
-            # Fancy plotting
-            x = np.arange(m)
-            lc = cmap(max_y / max_pm)
-            gradient_fill(x, y, lc, ax=ax_fill)
-
-        # set axes limits
-        plt.sca(ax_fill)
-        plt.xlim(1, m)
-        plt.ylim(0, np.amax(plot_matrix))
+        # Start from the vectors sorted on the workers if aggregated
+        block = None if aggregate is None else load_block(aggregate, vectors)
+        if block is not None:
+            fig_fill = fancy_plot(
+                block.vectors,
+                tile_size=render_tile_size,
+                processes=render_processes,
+                maxima=block.maxima,
+                presorted=True,
+            )
+        else:
+            # First make matrix from plotting vectors
+            plot_matrix = load_stack(
+                vectors,
+                cache_dir=self.step_local_staging_dir.parent / "vector_stacks",
+                prefetch_depth=prefetch_depth,
+                prefetch_max_bytes=prefetch_max_bytes,
+                mmap_min_bytes=mmap_min_bytes,
+            )
+
+            # Plot the vectors as fancy fills
+            fig_fill = fancy_plot(
+                plot_matrix, tile_size=render_tile_size, processes=render_processes
+            )
 
         # Configure manifest dataframe for storage tracking
         self.manifest = pd.DataFrame(index=range(1), columns=["filepath"])
 
         # Configure save path and save
         plot_save_path = plot_dir / "plot_fancy.png"
-        plt.sca(ax_fill)
-        plt.savefig(plot_save_path, format="png")
+        fig_fill.savefig(plot_save_path, format="png")
 
         # Add the path to manifest
         self.manifest.at[0, "filepath"] = plot_save_path
@@ -130,4 +179,7 @@ class Fancyplot(Step):
         # Save the manifest
         self.manifest.to_csv(self.step_local_staging_dir / "manifest.csv", index=False)
 
+        # Remember the outputs of this run
+        cache.store(cache_key, self.manifest)
+
         return plot_save_path
@@ -1,12 +1,25 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from functools import partial
+from typing import Optional, Tuple
+
 import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
+from matplotlib.figure import Figure
 from matplotlib.patches import Polygon
 import numpy as np
 
+from example_step_workflow.utils.plotting import line_collection, line_layer
+from example_step_workflow.utils.tiles import (
+    axes_image,
+    axes_pixels,
+    map_tiles,
+    over,
+    tile_slices,
+)
+
 matplotlib.use("agg")
 plt.style.use("seaborn-whitegrid")
 
@@ -75,3 +88,299 @@ def gradient_fill(x, y, line_color, fill_color=None, ax=None, **kwargs):
 
     ax.autoscale(True)
     return line, im
+
+
+def _fill_rows(
+    plot_matrix: np.ndarray, x: np.ndarray, top: float, dy: float, height: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    # The curve of every vector at the center of every pixel column
+    n, m = plot_matrix.shape
+    j = np.minimum(np.floor(x).astype(int), max(m - 2, 0))
+    f = x - j
+    curve = plot_matrix[:, j] * (1 - f) + plot_matrix[:, np.minimum(j + 1, m - 1)] * f
+
+    # Fill from the curve down to the minimum of the vector
+    # The filled rows are the pixel rows whose center lies in that range
+    y_min = plot_matrix.min(axis=1)
+    row_start = np.ceil((top - curve) / dy - 0.5).astype(int)
+    row_end = np.floor((top - y_min[:, None]) / dy - 0.5).astype(int)
+    row_start = np.clip(row_start, 0, height)
+    row_end = np.clip(row_end, -1, height - 1)
+    counts = np.maximum(row_end - row_start + 1, 0)
+
+    # Flat vectors have no gradient to draw
+    counts[plot_matrix.max(axis=1) == y_min] = 0
+
+    return row_start, counts
+
+
+def _over_block(
+    plot_matrix: np.ndarray,
+    colors: np.ndarray,
+    row_start: np.ndarray,
+    counts: np.ndarray,
+    columns: np.ndarray,
+    top: float,
+    dy: float,
+    width: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Composite the gradient fills of a block of vectors in order, each over the ones
+    before it.
+
+    Returns the flat index of every pixel filled and their premultiplied color and
+    alpha.
+    """
+    y_min = plot_matrix.min(axis=1)
+    y_max = plot_matrix.max(axis=1)
+
+    # One entry per filled pixel, ordered by vector
+    counts = counts.ravel()
+    pairs = np.repeat(np.arange(counts.size), counts)
+    offsets = np.arange(len(pairs)) - np.repeat(np.cumsum(counts) - counts, counts)
+    vector = pairs // len(columns)
+    rows = row_start.ravel()[pairs] + offsets
+    pixels = rows * width + columns[pairs % len(columns)]
+    if len(pixels) == 0:
+        return pixels, np.zeros((0, 3)), np.zeros(0)
+
+    # The alpha ramps linearly from the minimum to the maximum of each vector
+    y = top - (rows + 0.5) * dy
+    alpha = (y - y_min[vector]) / (y_max[vector] - y_min[vector])
+    alpha = np.clip(alpha, 0, 1 - 1e-6)
+
+    # Group the entries by pixel, keeping the vector order within each pixel
+    order = np.argsort(pixels, kind="stable")
+    pixels, vector, alpha = pixels[order], vector[order], alpha[order]
+    starts = np.flatnonzero(np.r_[True, pixels[1:] != pixels[:-1]])
+    lengths = np.diff(np.r_[starts, len(pixels)])
+
+    # Each fill is attenuated by the transmittance of the fills drawn over it
+    log_transmittance = np.log1p(-alpha)
+    cumulative = np.cumsum(log_transmittance)
+    pixel_log_transmittance = np.add.reduceat(log_transmittance, starts)
+    below = np.repeat(cumulative[starts] - log_transmittance[starts], lengths)
+    above = np.repeat(pixel_log_transmittance, lengths) - (cumulative - below)
+    weight = alpha * np.exp(above)
+
+    premultiplied = np.add.reduceat(weight[:, None] * colors[vector, :3], starts)
+    return pixels[starts], premultiplied, 1 - np.exp(pixel_log_transmittance)
+
+
+def composite_gradient_fills(
+    plot_matrix: np.ndarray,
+    colors: np.ndarray,
+    extent: Tuple[float, float, float, float],
+    shape: Tuple[int, int],
+    max_pixels: int = 4 * 1024 * 1024,
+) -> np.ndarray:
+    """
+    Rasterize the gradient fill of every vector into a single RGBA buffer.
+
+    Equivalent to calling `gradient_fill` for every vector in order: each vector is
+    filled from its curve down to its minimum in its color, with an alpha ramping
+    linearly from 0 at its minimum to 1 at its maximum, over the fills before it.
+    Pixels are filled if their center lies under the curve.
+
+    Parameters
+    ----------
+    plot_matrix: np.ndarray
+        The vectors to fill under, one per row, plotted against their index.
+    colors: np.ndarray
+        The RGB(A) color of every vector, alpha is ignored.
+    extent: Tuple[float, float, float, float]
+        The data limits the buffer covers, (left, right, bottom, top).
+    shape: Tuple[int, int]
+        The (height, width) of the buffer in pixels.
+    max_pixels: int
+        The maximum number of filled pixels composited at once, bounding the memory
+        used. A single vector filling more pixels is still composited on its own.
+        Default: 4194304
+
+    Returns
+    -------
+    rgba: np.ndarray
+        The (height, width, 4) image, straight (not premultiplied) alpha, with the
+        first row at the top.
+    """
+    height, width = shape
+    left, right, bottom, top = extent
+    n, m = plot_matrix.shape
+    dy = (top - bottom) / height
+
+    # Only the pixel columns whose centers lie within the vectors
+    x = left + (np.arange(width) + 0.5) * (right - left) / width
+    columns = np.flatnonzero((x >= 0) & (x <= m - 1))
+    x = x[columns]
+
+    # Skip vectors too flat to cover the center of any pixel row
+    y_min = plot_matrix.min(axis=1)
+    y_max = plot_matrix.max(axis=1)
+    visible = (y_max > y_min) & (
+        np.ceil((top - y_max) / dy - 0.5) <= np.floor((top - y_min) / dy - 0.5)
+    )
+    plot_matrix, colors = plot_matrix[visible], colors[visible]
+    n = len(plot_matrix)
+
+    premultiplied = np.zeros((height * width, 3))
+    alpha = np.zeros(height * width)
+    scan = max(1, max_pixels // max(len(columns), 1))
+    for scan_start in range(0, n if len(columns) > 0 else 0, scan):
+        scan_matrix = plot_matrix[scan_start : scan_start + scan]
+        scan_colors = colors[scan_start : scan_start + scan]
+        row_start, counts = _fill_rows(scan_matrix, x, top, dy, height)
+
+        # Split into blocks of at most max_pixels filled pixels
+        filled = np.cumsum(counts.sum(axis=1))
+        start = 0
+        while start < len(scan_matrix):
+            done = filled[start - 1] if start > 0 else 0
+            end = max(np.searchsorted(filled, done + max_pixels, "right"), start + 1)
+            pixels, block_color, block_alpha = _over_block(
+                scan_matrix[start:end],
+                scan_colors[start:end],
+                row_start[start:end],
+                counts[start:end],
+                columns,
+                top,
+                dy,
+                width,
+            )
+
+            # Later blocks are drawn over earlier ones
+            transmittance = (1 - block_alpha)[:, None]
+            premultiplied[pixels] = block_color + transmittance * premultiplied[pixels]
+            alpha[pixels] = block_alpha + transmittance[:, 0] * alpha[pixels]
+            start = end
+
+    # Straight alpha for display
+    rgba = np.zeros((height * width, 4))
+    filled = alpha > 0
+    rgba[filled, :3] = np.clip(premultiplied[filled] / alpha[filled, None], 0, 1)
+    rgba[:, 3] = alpha
+
+    return rgba.reshape(height, width, 4)
+
+
+def fancy_tile(
+    tile: Tuple[np.ndarray, np.ndarray],
+    xlim: Tuple[float, float],
+    ylim: Tuple[float, float],
+    extent: Tuple[float, float, float, float],
+    shape: Tuple[int, int],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Render the lines and composite the fills of a tile of vectors, intended to run
+    on a worker.
+
+    Returns
+    -------
+    lines: np.ndarray
+        The lines alone on a transparent canvas, see `line_layer`.
+    fills: np.ndarray
+        The fills, see `composite_gradient_fills`.
+    """
+    plot_matrix, colors = tile
+    lines = line_layer(tile, xlim=xlim, ylim=ylim)
+    fills = composite_gradient_fills(plot_matrix, colors, extent, shape)
+    return lines, fills.astype(np.float32)
+
+
+def fancy_plot(
+    plot_matrix: np.ndarray,
+    cmap: str = "gnuplot",
+    tile_size: Optional[int] = None,
+    processes: Optional[int] = None,
+    maxima: Optional[np.ndarray] = None,
+    presorted: bool = False,
+) -> Figure:
+    """
+    Plot each vector as a line with a gradient fill beneath it, colored by its
+    maximum and drawn in order of its last value.
+
+    All of the fills are composited into a single image by `composite_gradient_fills`
+    sized to the axes in pixels, with the lines overlaid as a single collection, so
+    the figure holds two artists whatever the number of vectors. Unlike drawing one
+    `gradient_fill` per vector, where the fills of later vectors dim the lines drawn
+    before them, every line is drawn at full strength over every fill.
+
+    With a `tile_size`, consecutive tiles of vectors are instead rendered in
+    parallel by `fancy_tile`, see `map_tiles`. The fills of every tile, then the
+    lines of every tile, are composited in order into a single image.
+
+    Parameters
+    ----------
+    plot_matrix: np.ndarray
+        The vectors to plot, one per row.
+    cmap: str
+        The colormap used to color the vectors by their maximum.
+        Default: "gnuplot"
+    tile_size: Optional[int]
+        The number of vectors rendered by each parallel task.
+        Default: None (Render every vector at once, in this process)
+    processes: Optional[int]
+        The number of local processes rendering tiles when not running on a Dask
+        worker.
+        Default: None (One per core)
+    maxima: Optional[np.ndarray]
+        The maximum of every vector, if already known, in the order of the rows.
+        Default: None (Compute them)
+    presorted: bool
+        Whether the rows are already sorted by their last value, see `VectorBlock`.
+        Default: False (Sort them)
+
+    Returns
+    -------
+    fig: Figure
+        The fancy plot.
+    """
+    n, m = plot_matrix.shape
+
+    # reorder the matrix
+    if not presorted:
+        order = plot_matrix[:, m - 1].argsort()
+        plot_matrix = plot_matrix[order]
+        if maxima is not None:
+            maxima = maxima[order]
+
+    if maxima is None:
+        maxima = np.amax(plot_matrix, axis=1)
+
+    max_pm = np.amax(maxima)
+    colors = plt.cm.get_cmap(cmap)(maxima / max_pm)
+    xlim, ylim = (1, m), (0, max_pm)
+
+    with matplotlib.style.context("seaborn-whitegrid"):
+        fig = Figure()
+        ax = fig.subplots()
+
+        # Render the fills at the pixels of the axes
+        ax.set_xlim(*xlim)
+        ax.set_ylim(*ylim)
+        (rows, columns), extent = axes_pixels(ax)
+        shape = (rows.stop - rows.start, columns.stop - columns.start)
+
+        if tile_size is None:
+            # The lines are overlaid on the image of the fills
+            ax.add_collection(line_collection(plot_matrix, colors=colors))
+            rgba = composite_gradient_fills(plot_matrix, colors, extent, shape)
+        else:
+            # Render tiles in parallel, every line is over every fill
+            tiles = [
+                (plot_matrix[tile], colors[tile]) for tile in tile_slices(n, tile_size)
+            ]
+            layers = map_tiles(
+                partial(fancy_tile, xlim=xlim, ylim=ylim, extent=extent, shape=shape),
+                tiles,
+                processes=processes,
+            )
+            rgba = over([fills for _, fills in layers] + [lines for lines, _ in layers])
+
+        # Beneath the lines of the collection
+        axes_image(ax, rgba, zorder=1)
+
+        # set axes limits
+        ax.set_xlim(*xlim)
+        ax.set_ylim(*ylim)
+
+    return fig
@@ -3,13 +3,18 @@
 
 import logging
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 
-import numpy as np
 import pandas as pd
 from datastep import Step, log_run_params
 from tqdm import tqdm
 
+from example_step_workflow.utils.journal import Journal
+from example_step_workflow.utils.kernels import invert_matrix
+from example_step_workflow.utils.memo import StepCache
+from example_step_workflow.utils.prefetch import prefetch
+from example_step_workflow.utils.writer import AsyncWriter
+
 from ..raw import Raw
 
 ###############################################################################
@@ -20,14 +25,23 @@ log = logging.getLogger(__name__)
 
 
 class Invert(Step):
-    def __init__(self, direct_upstream_tasks: List["Step"] = [Raw]):
-        super().__init__(direct_upstream_tasks=direct_upstream_tasks)
+    def __init__(
+        self,
+        direct_upstream_tasks: List["Step"] = [Raw],
+        config: Optional[Union[str, Path, Dict[str, str]]] = None,
+    ):
+        super().__init__(direct_upstream_tasks=direct_upstream_tasks, config=config)
 
     @log_run_params
     def run(
         self,
         matrices: Optional[Union[Union[str, Path], List[Path]]] = None,
         filepath_column: str = "filepath",
+        prefetch_depth: int = 4,
+        prefetch_max_bytes: int = 256 * 1024 * 1024,
+        write_behind_bytes: int = 256 * 1024 * 1024,
+        resume: bool = False,
+        memoize: bool = False,
         **kwargs
     ) -> List[Path]:
         """
@@ -46,6 +60,24 @@ class Invert(Step):
         filepath_column: str
             If providing a path to a csv manifest, the column to use for matrices.
             Default: "filepath"
+        prefetch_depth: int
+            The number of matrices to read ahead in the background while the current
+            one is processed. Use 0 to read every matrix only when it is needed.
+            Default: 4
+        prefetch_max_bytes: int
+            The maximum total size of the matrices read ahead.
+            Default: 268435456 (256 MiB)
+        write_behind_bytes: int
+            The maximum total size of outputs waiting to be written in the background
+            while computation continues. Use 0 to write every output before moving on.
+            Default: 268435456 (256 MiB)
+        resume: bool
+            Skip the inversions a prior run already saved for unchanged inputs.
+            Default: False (Invert all matrices)
+        memoize: bool
+            Return the outputs of the last run if it had identical inputs, parameters
+            and code and they are still intact, instead of recomputing them.
+            Default: False (Recompute the outputs)
 
         Returns
         -------
@@ -70,32 +102,57 @@ class Invert(Step):
         # Configure manifest dataframe for storage tracking
         self.manifest = pd.DataFrame(index=range(len(matrices)), columns=["filepath"])
 
+        # Return the outputs of an identical prior run if they are intact
+        cache = StepCache(self)
+        cache_key = cache.fingerprint(kwargs, inputs=matrices)
+        if memoize and cache.restore(cache_key):
+            return [Path(f) for f in self.manifest["filepath"]]
+
         # Storage dir
         inverted_dir = self.step_local_staging_dir / "inverted"
         inverted_dir.mkdir(exist_ok=True)
 
-        # Invert the matrices
-        inversions = []
-        for i, matrix in tqdm(
-            enumerate(matrices), desc="Loading, inverting and saving matrices"
-        ):
-            # Load matrix
-            mat = np.load(matrix)
-
-            # Invert
-            inv = np.linalg.inv(mat)
-
-            # Configure save path and save
-            inv_save_path = inverted_dir / matrix.name
-            np.save(inv_save_path, inv)
+        # Track completed inversions so an interrupted run can be resumed
+        journal = Journal(self.step_local_staging_dir / "journal.jsonl", resume=resume)
+        done = [journal.lookup(i, source=matrix) for i, matrix in enumerate(matrices)]
 
-            # Add the path to manifest
-            self.manifest.at[i, "filepath"] = inv_save_path
+        # Read the matrices that still need processing ahead of time
+        loaded = prefetch(
+            [matrix for matrix, path in zip(matrices, done) if path is None],
+            depth=prefetch_depth,
+            max_bytes=prefetch_max_bytes,
+        )
 
-            # Append the inversion save path to the list of inversions
-            inversions.append(inv_save_path)
+        # Invert the matrices
+        inversions = []
+        with journal, AsyncWriter(max_bytes=write_behind_bytes) as writer:
+            for i, matrix in tqdm(
+                enumerate(matrices), desc="Loading, inverting and saving matrices"
+            ):
+                # Skip matrices already inverted by a prior run
+                inv_save_path = done[i]
+                if inv_save_path is None:
+                    # Load matrix
+                    _, mat = next(loaded)
+
+                    # Invert
+                    inv = invert_matrix(mat)
+
+                    # Configure save path and save
+                    inv_save_path = inverted_dir / matrix.name
+                    nbytes, checksum = writer.save(inv_save_path, inv)
+                    journal.record(i, inv_save_path, nbytes, checksum, source=matrix)
+
+                # Add the path to manifest
+                self.manifest.at[i, "filepath"] = inv_save_path
+
+                # Append the inversion save path to the list of inversions
+                inversions.append(inv_save_path)
 
         # Save the manifest
         self.manifest.to_csv(self.step_local_staging_dir / "manifest.csv", index=False)
 
+        # Remember the outputs of this run
+        cache.store(cache_key, self.manifest)
+
         return inversions
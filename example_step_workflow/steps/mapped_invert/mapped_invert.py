@@ -3,13 +3,38 @@
 
 import logging
 from pathlib import Path
-from typing import List, Optional, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 from datastep import Step, log_run_params
 from distributed import worker_client
 
+from example_step_workflow.utils.debug import subsample
+from example_step_workflow.utils.failures import (
+    Guarded,
+    ItemFailure,
+    check_failure_policy,
+    guarded_write_behind,
+    save_quarantine,
+)
+from example_step_workflow.utils.handoff import ArrayHandoff
+from example_step_workflow.utils.journal import Journal
+from example_step_workflow.utils.kernels import invert_matrix
+from example_step_workflow.utils.locality import ScratchHandoff
+from example_step_workflow.utils.memo import StepCache
+from example_step_workflow.utils.planner import annotate_resources
+from example_step_workflow.utils.shm import SharedHandoff
+from example_step_workflow.utils.speculate import map_completed
+from example_step_workflow.utils.transport import (
+    check_transport_failures,
+    handoff_names,
+    map_transport,
+    save_manifest,
+    transport_mode,
+)
+from example_step_workflow.utils.writer import flush_process_writer, process_writer
+
 from ..mapped_raw import MappedRaw
 
 ###############################################################################
@@ -20,21 +45,28 @@ log = logging.getLogger(__name__)
 
 
 class MappedInvert(Step):
-    def __init__(self, direct_upstream_tasks: List["Step"] = [MappedRaw]):
-        super().__init__(direct_upstream_tasks=direct_upstream_tasks)
+    def __init__(
+        self,
+        direct_upstream_tasks: List["Step"] = [MappedRaw],
+        config: Optional[Union[str, Path, Dict[str, str]]] = None,
+    ):
+        super().__init__(direct_upstream_tasks=direct_upstream_tasks, config=config)
 
     @staticmethod
-    def _invert_array(read_path: Path, save_dir: Path) -> Tuple[int, Path]:
+    def _invert_array(
+        read_path: Path, save_dir: Path, write_behind_bytes: int = 0
+    ) -> Tuple[int, Path, int, str]:
         # Load matrix
         mat = np.load(read_path)
 
         # Invert
-        inv = np.linalg.inv(mat)
+        inv = invert_matrix(mat)
 
         # Configure save path and save
-        save_dir.mkdir(parents=True, exist_ok=True)
         inv_save_path = save_dir / read_path.name
-        np.save(inv_save_path, inv)
+        nbytes, checksum = process_writer(save_dir, write_behind_bytes).save(
+            inv_save_path, inv
+        )
 
         # Important:
         # Because we are running in a distributed fashion, we need to track
@@ -46,15 +78,36 @@ class MappedInvert(Step):
         # Then split by the datalabel and the index
         i = int(read_path.name.split(".")[0].split("_")[1])
 
-        return i, inv_save_path
+        return i, inv_save_path, nbytes, checksum
 
     @log_run_params
     def run(
         self,
-        matrices: Optional[Union[Union[str, Path], List[Path]]] = None,
+        matrices: Optional[
+            Union[
+                Union[str, Path],
+                List[Path],
+                ArrayHandoff,
+                ScratchHandoff,
+                SharedHandoff,
+            ]
+        ] = None,
         filepath_column: str = "filepath",
+        write_behind_bytes: int = 256 * 1024 * 1024,
+        in_memory: bool = False,
+        locality: bool = False,
+        shared_memory: bool = False,
+        persist: bool = False,
+        resume: bool = False,
+        speculate: Optional[float] = None,
+        retries: int = 0,
+        failure_policy: str = "fail",
+        task_resources: Optional[Dict[str, float]] = None,
+        debug: bool = False,
+        debug_items: int = 8,
+        memoize: bool = False,
         **kwargs
-    ) -> List[Path]:
+    ) -> Union[List[Path], ArrayHandoff, ScratchHandoff, SharedHandoff]:
         """
         Invert the list of matrices provided.
 
@@ -64,19 +117,96 @@ class MappedInvert(Step):
 
         Parameters
         ----------
-        matrices: Optional[Union[Union[str, Path], List[Path]]]
-            A path to a csv manifest to use or directly a list of paths of serialized
-            arrays to invert.
+        matrices: Optional[
+            Union[
+                Union[str, Path],
+                List[Path],
+                ArrayHandoff,
+                ScratchHandoff,
+                SharedHandoff,
+            ]
+        ]
+            A path to a csv manifest to use, directly a list of paths of serialized
+            arrays to invert, or the handoff of arrays kept in worker memory, in
+            worker scratch or in shared memory by `MappedRaw`. A shared memory handoff
+            is released once every matrix is inverted.
             Default: self.step_local_staging_dir.parent / "mappedraw" / manifest.csv
         filepath_column: str
             If providing a path to a csv manifest, the column to use for matrices.
             Default: "filepath"
+        write_behind_bytes: int
+            The maximum total size of outputs waiting to be written in the background
+            while computation continues. Use 0 to write every output before moving on.
+            Items that may be retried or quarantined always write before moving on.
+            Default: 268435456 (256 MiB)
+        in_memory: bool
+            Keep the inverted matrices in worker memory and return a handoff for the
+            next mapped step instead of saving them. Resuming and memoization do not
+            apply to in-memory inputs or outputs.
+            Default: False (Save the inverted matrices to the staging directory)
+        locality: bool
+            Invert each matrix on the worker holding it in scratch, save the inverted
+            matrices to its node-local scratch directory and return a handoff for the
+            next mapped step. Resuming and memoization do not apply to scratch inputs
+            or outputs.
+            Default: False (Save the inverted matrices to the staging directory)
+        shared_memory: bool
+            Keep the inverted matrices in shared memory on the node of a local cluster
+            and return a handoff for the next mapped step, whose tasks map them
+            without copying, see `SharedHandoff`. Resuming and memoization do not
+            apply to shared memory inputs or outputs.
+            Default: False (Save the inverted matrices to the staging directory)
+        persist: bool
+            When keeping the inverted matrices in memory, in scratch or in shared
+            memory, also save them and their manifest to the staging directory.
+            Default: False (Only keep the inverted matrices in memory, scratch or
+            shared memory)
+        resume: bool
+            Skip the inversions a prior run already saved for unchanged inputs.
+            Default: False (Process all matrices)
+        speculate: Optional[float]
+            Launch a duplicate of any item still running after this multiple of the
+            median item runtime, once every item has started, and keep whichever copy
+            finishes first, see `map_completed`.
+            Default: None (No duplicates)
+        retries: int
+            The number of times an item is retried after a transient I/O error.
+            Default: 0
+        failure_policy: str
+            "fail" to stop at the first item that fails, or "continue" to quarantine
+            failed items to quarantine.csv in the step directory, with their error,
+            and carry on. Quarantined items are left out of the manifest, so
+            downstream steps skip them, and are retried by the next resumed run.
+            Retries and "continue" don't apply to items handed off in memory, in
+            scratch or in shared memory.
+            Default: "fail"
+        task_resources: Optional[Dict[str, float]]
+            Annotate the mapped tasks with the Dask resources each needs, such as
+            the bytes of MEMORY and the BLAS threads as CPU, so the scheduler never
+            runs more of them at once on a worker than it declares, see
+            `plan_cluster`. Only use it with workers that declare these resources,
+            tasks needing an undeclared resource never run.
+            Default: None (No annotation)
+        debug: bool
+            Only process a deterministic, stratified sample of debug_items of the
+            matrices, see `subsample`.
+            Default: False (Process all matrices)
+        debug_items: int
+            The number of matrices processed when debugging.
+            Default: 8
+        memoize: bool
+            Return the outputs of the last run if it had identical inputs, parameters
+            and code and they are still intact, instead of recomputing them.
+            Default: False (Recompute the outputs)
 
         Returns
         -------
-        inverted: List[Path]
-            The list of paths to the inverted matrices.
+        inverted: Union[List[Path], ArrayHandoff, ScratchHandoff, SharedHandoff]
+            The list of paths to the inverted matrices or, if kept in memory, in
+            scratch or in shared memory, their handoff.
         """
+        check_failure_policy(failure_policy)
+
         # Default matrices value
         if matrices is None:
             matrices = self.step_local_staging_dir.parent / "mappedraw" / "manifest.csv"
@@ -92,28 +222,111 @@ class MappedInvert(Step):
             # Convert the specified column into a list of paths
             matrices = [Path(f) for f in raw_data[filepath_column]]
 
+        # Debug runs a stratified sample of the matrices
+        if debug and isinstance(matrices, list):
+            matrices = subsample(matrices, debug_items)
+
+        transport = transport_mode(
+            matrices,
+            in_memory=in_memory,
+            locality=locality,
+            shared_memory=shared_memory,
+        )
+        check_transport_failures(transport, retries, failure_policy)
+
         # Storage dir
         inverted_dir = self.step_local_staging_dir / "inverted"
 
-        # Connect to an executor
-        with worker_client() as client:
-            # Create random arrays
-            futures = client.map(
-                self._invert_array,
-                matrices,
-                [inverted_dir for i in range(len(matrices))],
-            )
+        # Work on arrays handed off in worker memory, scratch or shared memory
+        if transport is not None:
+            keep = in_memory or locality or shared_memory
+            with annotate_resources(task_resources), worker_client() as client:
+                handoff, saved = map_transport(
+                    client,
+                    transport,
+                    invert_matrix,
+                    handoff_names(matrices),
+                    self.step_name,
+                    sources=matrices,
+                    keep=keep,
+                    save_dir=inverted_dir if persist or not keep else None,
+                    write_behind_bytes=write_behind_bytes,
+                    stats_path=self.step_local_staging_dir / "locality.json",
+                )
+
+            # Save the manifest of the saved matrices
+            if len(saved) > 0:
+                save_manifest(self, saved)
+
+            if handoff is not None:
+                return handoff
+
+            return list(self.manifest["filepath"])
 
-            # Blocking until all are done
-            inversion_infos = client.gather(futures)
+        # Return the outputs of an identical prior run if they are intact
+        cache = StepCache(self)
+        cache_key = cache.fingerprint(kwargs, inputs=matrices)
+        if memoize and cache.restore(cache_key):
+            save_quarantine(self.step_local_staging_dir / "quarantine.csv", [])
+            return [Path(f) for f in self.manifest["filepath"]]
 
         # Configure manifest dataframe for storage tracking
         self.manifest = pd.DataFrame(index=range(len(matrices)), columns=["filepath"])
-        for i, path in inversion_infos:
-            self.manifest.at[i, "filepath"] = path
+
+        # Track completed items so an interrupted run can be resumed
+        journal = Journal(self.step_local_staging_dir / "journal.jsonl", resume=resume)
+
+        # Only process the matrices that aren't already done
+        # Index parsing mirrors `_invert_array`, the index is part of the filename
+        todo = []
+        sources = {}
+        for matrix in matrices:
+            i = int(Path(matrix).name.split(".")[0].split("_")[1])
+            path = journal.lookup(i, source=matrix)
+            if path is None:
+                todo.append(matrix)
+                sources[i] = matrix
+            else:
+                self.manifest.at[i, "filepath"] = path
+
+        # Connect to an executor
+        with journal, annotate_resources(task_resources), worker_client() as client:
+            results = map_completed(
+                client,
+                Guarded(self._invert_array, retries, failure_policy),
+                list(sources),
+                todo,
+                [inverted_dir for i in range(len(todo))],
+                speculate=speculate,
+                write_behind_bytes=guarded_write_behind(
+                    write_behind_bytes, retries, failure_policy
+                ),
+            )
+
+            # Record each item as soon as it is done
+            failures = []
+            for result in results:
+                if isinstance(result, ItemFailure):
+                    failures.append(result)
+                    continue
+
+                i, path, nbytes, checksum = result
+                journal.record(i, path, nbytes, checksum, source=sources[i])
+                self.manifest.at[i, "filepath"] = path
+
+            # Wait for every worker to finish writing before saving the manifest
+            client.run(flush_process_writer, inverted_dir)
+
+        # Quarantine the failed items, they are retried when resuming
+        save_quarantine(self.step_local_staging_dir / "quarantine.csv", failures)
+        self.manifest = self.manifest.dropna(subset=["filepath"])
 
         # Save the manifest
         self.manifest.to_csv(self.step_local_staging_dir / "manifest.csv", index=False)
 
+        # Remember the outputs of this run, unless some items are missing
+        if len(failures) == 0:
+            cache.store(cache_key, self.manifest)
+
         # Return list of paths
         return list(self.manifest["filepath"])
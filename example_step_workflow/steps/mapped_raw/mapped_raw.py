@@ -2,14 +2,38 @@
 # -*- coding: utf-8 -*-
 
 import logging
+from functools import partial
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 from datastep import Step, log_run_params
 from distributed import worker_client
 
+from example_step_workflow.utils.debug import subsample
+from example_step_workflow.utils.failures import (
+    Guarded,
+    ItemFailure,
+    check_failure_policy,
+    guarded_write_behind,
+    save_quarantine,
+)
+from example_step_workflow.utils.handoff import ArrayHandoff
+from example_step_workflow.utils.journal import Journal
+from example_step_workflow.utils.locality import ScratchHandoff
+from example_step_workflow.utils.memo import StepCache
+from example_step_workflow.utils.planner import annotate_resources
+from example_step_workflow.utils.shm import SharedHandoff
+from example_step_workflow.utils.speculate import map_completed
+from example_step_workflow.utils.transport import (
+    check_transport_failures,
+    map_transport,
+    save_manifest,
+    transport_mode,
+)
+from example_step_workflow.utils.writer import flush_process_writer, process_writer
+
 ###############################################################################
 
 log = logging.getLogger(__name__)
@@ -19,19 +43,54 @@ log = logging.getLogger(__name__)
 
 class MappedRaw(Step):
     @staticmethod
-    def _generate_array(i: int, m: int, save_dir: Path) -> Tuple[int, Path]:
+    def _generate(i: int, m: int, seed: int, dtype: str) -> np.ndarray:
+        # Seed per array so any array can be (re)generated on any worker
+        rng = np.random.default_rng([seed, i])
+        return rng.random((m, m), dtype=dtype)
+
+    @staticmethod
+    def _generate_array(
+        i: int,
+        m: int,
+        seed: int,
+        dtype: str,
+        save_dir: Path,
+        write_behind_bytes: int = 0,
+    ) -> Tuple[int, Path, int, str]:
         # Generate array
-        x = np.random.rand(m, m)
+        x = MappedRaw._generate(i, m, seed, dtype)
 
         # Configure save path
-        save_dir.mkdir(parents=True, exist_ok=True)
         matrix_save_path = save_dir / f"matrix_{i}.npy"
-        np.save(matrix_save_path, x)
+        nbytes, checksum = process_writer(save_dir, write_behind_bytes).save(
+            matrix_save_path, x
+        )
 
-        return i, matrix_save_path
+        return i, matrix_save_path, nbytes, checksum
 
     @log_run_params
-    def run(self, n: int = 100, m: int = 100, seed: int = 1, **kwargs) -> List[Path]:
+    def run(
+        self,
+        n: int = 100,
+        m: int = 100,
+        seed: int = 1,
+        dtype: str = "float64",
+        write_behind_bytes: int = 256 * 1024 * 1024,
+        in_memory: bool = False,
+        locality: bool = False,
+        shared_memory: bool = False,
+        persist: bool = False,
+        resume: bool = False,
+        speculate: Optional[float] = None,
+        retries: int = 0,
+        failure_policy: str = "fail",
+        task_resources: Optional[Dict[str, float]] = None,
+        debug: bool = False,
+        debug_items: int = 8,
+        debug_max_m: int = 512,
+        memoize: bool = False,
+        **kwargs,
+    ) -> Union[List[Path], ArrayHandoff, ScratchHandoff, SharedHandoff]:
         """
         Generates n random arrays of shape (m, m) and saves them to /matrices
 
@@ -45,38 +104,198 @@ class MappedRaw(Step):
             Default: 100 (100 x 100)
         seed: int
             Seed for numpy's random number generator
+        dtype: str
+            The floating point precision of the arrays, "float64" or "float32".
+            Downstream steps keep the precision of the arrays they are given, so
+            "float32" halves the bytes stored and held in worker memory.
+            Default: "float64"
+        write_behind_bytes: int
+            The maximum total size of outputs waiting to be written in the background
+            while computation continues. Use 0 to write every output before moving on.
+            Items that may be retried or quarantined always write before moving on.
+            Default: 268435456 (256 MiB)
+        in_memory: bool
+            Keep the arrays in worker memory and return a handoff for the next mapped
+            step instead of saving them. Dask spills them to the worker local
+            directory if memory runs low. Resuming and memoization do not apply.
+            Default: False (Save the arrays to the staging directory)
+        locality: bool
+            Save the arrays to the node-local scratch directory of the worker
+            generating each, and return a handoff for the next mapped step to process
+            each array on the worker holding it. Resuming and memoization do not
+            apply.
+            Default: False (Save the arrays to the staging directory)
+        shared_memory: bool
+            Keep the arrays in shared memory on the node of a local cluster and return
+            a handoff for the next mapped step, whose tasks map them without copying,
+            see `SharedHandoff`. Resuming and memoization do not apply.
+            Default: False (Save the arrays to the staging directory)
+        persist: bool
+            When keeping the arrays in memory, in scratch or in shared memory, also
+            save them and their manifest to the staging directory.
+            Default: False (Only keep the arrays in memory, scratch or shared memory)
+        resume: bool
+            Skip the arrays a prior run with the same m, seed and dtype already saved.
+            Running again with a larger n only generates the new arrays.
+            Default: False (Generate all arrays)
+        speculate: Optional[float]
+            Launch a duplicate of any item still running after this multiple of the
+            median item runtime, once every item has started, and keep whichever copy
+            finishes first, see `map_completed`.
+            Default: None (No duplicates)
+        retries: int
+            The number of times an item is retried after a transient I/O error.
+            Default: 0
+        failure_policy: str
+            "fail" to stop at the first item that fails, or "continue" to quarantine
+            failed items to quarantine.csv in the step directory, with their error,
+            and carry on. Quarantined items are left out of the manifest, so
+            downstream steps skip them, and are retried by the next resumed run.
+            Retries and "continue" don't apply to items handed off in memory, in
+            scratch or in shared memory.
+            Default: "fail"
+        task_resources: Optional[Dict[str, float]]
+            Annotate the mapped tasks with the Dask resources each needs, such as
+            the bytes of MEMORY and the BLAS threads as CPU, so the scheduler never
+            runs more of them at once on a worker than it declares, see
+            `plan_cluster`. Only use it with workers that declare these resources,
+            tasks needing an undeclared resource never run.
+            Default: None (No annotation)
+        debug: bool
+            Only generate a deterministic, stratified sample of debug_items of the n
+            arrays, see `subsample`, of at most debug_max_m squared. Arrays are
+            seeded per index, so the sample is part of the full run unless m shrinks.
+            Default: False (Generate all arrays)
+        debug_items: int
+            The number of arrays generated when debugging.
+            Default: 8
+        debug_max_m: int
+            The largest squared shape of the arrays generated when debugging.
+            Default: 512
+        memoize: bool
+            Return the outputs of the last run if it had identical inputs, parameters
+            and code and they are still intact, instead of recomputing them.
+            Default: False (Recompute the outputs)
 
         Returns
         -------
-        arrays: List[Path]
-            The paths to the generated arrays.
+        arrays: Union[List[Path], ArrayHandoff, ScratchHandoff, SharedHandoff]
+            The paths to the generated arrays or, if kept in memory, in scratch or in
+            shared memory, their handoff.
         """
-        # Configure random seed
-        np.random.seed(seed=seed)
+        check_failure_policy(failure_policy)
+
+        # Check precision
+        if np.dtype(dtype) not in (np.float32, np.float64):
+            raise ValueError(
+                f"Unsupported dtype: '{dtype}'. Use either 'float64' or 'float32'."
+            )
+
+        transport = transport_mode(
+            in_memory=in_memory, locality=locality, shared_memory=shared_memory
+        )
+        check_transport_failures(transport, retries, failure_policy)
+
+        # Debug runs a stratified sample of the arrays
+        indices = list(range(n))
+        if debug:
+            indices = subsample(indices, debug_items)
+            m = min(m, debug_max_m)
 
         # Storage dir
         matrices_dir = self.step_local_staging_dir / "matrices"
 
+        # Keep the arrays in worker memory, scratch or shared memory for the next step
+        if transport is not None:
+            with annotate_resources(task_resources), worker_client() as client:
+                handoff, saved = map_transport(
+                    client,
+                    transport,
+                    partial(self._generate, m=m, seed=seed, dtype=dtype),
+                    [f"matrix_{i}.npy" for i in indices],
+                    self.step_name,
+                    save_dir=matrices_dir if persist else None,
+                    write_behind_bytes=write_behind_bytes,
+                )
+
+            # Save the manifest of the persisted arrays
+            if persist:
+                save_manifest(self, saved)
+
+            return handoff
+
+        # Return the outputs of an identical prior run if they are intact
+        cache = StepCache(self)
+        params = {"n": n, "m": m, "seed": seed, "dtype": dtype, **kwargs}
+        if debug:
+            params["indices"] = indices
+
+        cache_key = cache.fingerprint(params)
+        if memoize and cache.restore(cache_key):
+            save_quarantine(self.step_local_staging_dir / "quarantine.csv", [])
+            return [Path(f) for f in self.manifest["filepath"]]
+
+        # Configure manifest dataframe for storage tracking
+        self.manifest = pd.DataFrame(index=indices, columns=["filepath"])
+
+        # Track completed arrays so an interrupted run can be resumed
+        journal = Journal(
+            self.step_local_staging_dir / "journal.jsonl",
+            params={"m": m, "seed": seed, "dtype": dtype},
+            resume=resume,
+        )
+
+        # Only generate the arrays that aren't already done
+        todo = []
+        for i in indices:
+            path = journal.lookup(i)
+            if path is None:
+                todo.append(i)
+            else:
+                self.manifest.at[i, "filepath"] = path
+
         # Connect to an executor
-        with worker_client() as client:
+        with journal, annotate_resources(task_resources), worker_client() as client:
             # Create random arrays
-            futures = client.map(
-                self._generate_array,
-                range(n),
-                [m for i in range(n)],  # Must have an arg for every n
-                [matrices_dir for i in range(n)],  # Must have an arg for every n
+            results = map_completed(
+                client,
+                Guarded(self._generate_array, retries, failure_policy),
+                todo,
+                todo,
+                [m for i in todo],  # Must have an arg for every item
+                [seed for i in todo],  # Must have an arg for every item
+                [dtype for i in todo],  # Must have an arg for every item
+                [matrices_dir for i in todo],  # Must have an arg for every item
+                speculate=speculate,
+                write_behind_bytes=guarded_write_behind(
+                    write_behind_bytes, retries, failure_policy
+                ),
             )
 
-            # Blocking until all are done
-            array_infos = client.gather(futures)
+            # Record each array as soon as it is done
+            failures = []
+            for result in results:
+                if isinstance(result, ItemFailure):
+                    failures.append(result)
+                    continue
 
-        # Configure manifest dataframe for storage tracking
-        self.manifest = pd.DataFrame(index=range(n), columns=["filepath"])
-        for i, path in array_infos:
-            self.manifest.at[i, "filepath"] = path
+                i, path, nbytes, checksum = result
+                journal.record(i, path, nbytes, checksum)
+                self.manifest.at[i, "filepath"] = path
+
+            # Wait for every worker to finish writing before saving the manifest
+            client.run(flush_process_writer, matrices_dir)
+
+        # Quarantine the failed items, they are retried when resuming
+        save_quarantine(self.step_local_staging_dir / "quarantine.csv", failures)
+        self.manifest = self.manifest.dropna(subset=["filepath"])
 
         # Save the manifest
         self.manifest.to_csv(self.step_local_staging_dir / "manifest.csv", index=False)
 
+        # Remember the outputs of this run, unless some items are missing
+        if len(failures) == 0:
+            cache.store(cache_key, self.manifest)
+
         # Return list of paths
         return list(self.manifest["filepath"])
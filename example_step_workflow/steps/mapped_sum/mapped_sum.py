@@ -2,13 +2,56 @@
 # -*- coding: utf-8 -*-
 
 import logging
+from functools import partial
 from pathlib import Path
-from typing import List, Optional, Tuple, Union
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 from datastep import Step, log_run_params
-from distributed import worker_client
+from distributed import Client, worker_client
+
+from example_step_workflow.utils.aggregate import (
+    aggregate_key,
+    block_from_arrays,
+    block_from_files,
+    load_block,
+    merge_blocks,
+    save_block,
+)
+from example_step_workflow.utils.debug import subsample
+from example_step_workflow.utils.failures import (
+    Guarded,
+    ItemFailure,
+    check_failure_policy,
+    guarded_write_behind,
+    save_quarantine,
+)
+from example_step_workflow.utils.handoff import ArrayHandoff, index_from_name
+from example_step_workflow.utils.journal import Journal
+from example_step_workflow.utils.kernels import sum_matrix
+from example_step_workflow.utils.locality import ScratchHandoff
+from example_step_workflow.utils.memo import StepCache
+from example_step_workflow.utils.planner import annotate_resources
+from example_step_workflow.utils.preview import PlotPreview
+from example_step_workflow.utils.reduce import tree_reduce
+from example_step_workflow.utils.shm import SharedHandoff
+from example_step_workflow.utils.summary import (
+    VectorSummary,
+    merge_summaries,
+    summarize_files,
+    summary_matches,
+)
+from example_step_workflow.utils.speculate import map_completed
+from example_step_workflow.utils.sweep import first_items
+from example_step_workflow.utils.transport import (
+    check_transport_failures,
+    handoff_names,
+    map_transport,
+    save_manifest,
+    transport_mode,
+)
+from example_step_workflow.utils.writer import flush_process_writer, process_writer
 
 from ..mapped_invert import MappedInvert
 
@@ -20,23 +63,31 @@ log = logging.getLogger(__name__)
 
 
 class MappedSum(Step):
-    def __init__(self, direct_upstream_tasks: List["Step"] = [MappedInvert]):
-        super().__init__(direct_upstream_tasks=direct_upstream_tasks)
+    def __init__(
+        self,
+        direct_upstream_tasks: List["Step"] = [MappedInvert],
+        config: Optional[Union[str, Path, Dict[str, str]]] = None,
+    ):
+        super().__init__(direct_upstream_tasks=direct_upstream_tasks, config=config)
 
     @staticmethod
-    def _sum_array(read_path: Path, save_dir: Path) -> Tuple[int, Path]:
+    def _sum_array(
+        read_path: Path,
+        save_dir: Path,
+        write_behind_bytes: int = 0,
+        return_vector: bool = False,
+    ) -> Tuple[int, Path, int, str, Optional[np.ndarray]]:
         # Load matrix
         mat = np.load(read_path)
 
         # Sum
-        vec = np.amax(mat, 0)
-        vec = np.sort(vec)
-        vec = np.cumsum(vec)
+        vec = sum_matrix(mat)
 
         # Configure save path and save
-        save_dir.mkdir(parents=True, exist_ok=True)
         vec_save_path = save_dir / read_path.name
-        np.save(vec_save_path, vec)
+        nbytes, checksum = process_writer(save_dir, write_behind_bytes).save(
+            vec_save_path, vec
+        )
 
         # Important:
         # Because we are running in a distributed fashion, we need to track
@@ -48,13 +99,155 @@ class MappedSum(Step):
         # Then split by the datalabel and the index
         i = int(read_path.name.split(".")[0].split("_")[1])
 
-        return i, vec_save_path
+        # The vector itself is only sent back for previews, summaries and aggregates
+        return i, vec_save_path, nbytes, checksum, vec if return_vector else None
+
+    @staticmethod
+    def _summarize(
+        client: Client,
+        summarize: Callable[..., VectorSummary],
+        vectors: List,
+        bins: int,
+        chunk_size: int = 1024,
+    ) -> VectorSummary:
+        # Summarize chunks of vectors and merge the partial summaries on the workers
+        # so only the final summary is sent back
+        partials = [
+            client.submit(summarize, vectors[start : start + chunk_size], bins=bins)
+            for start in range(0, len(vectors), chunk_size)
+        ]
+        return tree_reduce(client, partials, merge_summaries).result()
+
+    @staticmethod
+    def _subsets(vectors: List, subsets: Optional[List[int]]) -> List[Tuple[str, List]]:
+        # The suffix of the outputs of all the vectors and of every leading subset
+        return [("", vectors)] + [
+            (f"_{n}", first_items(vectors, n)) for n in subsets or []
+        ]
+
+    @staticmethod
+    def _collect_item(
+        summaries: Optional[Dict[str, VectorSummary]],
+        arrays: Optional[Dict[int, np.ndarray]],
+        subsets: Optional[List[int]],
+        bins: int,
+        i: int,
+        vec: np.ndarray,
+    ):
+        # Keep a vector sent back from the workers for the aggregates
+        if arrays is not None:
+            arrays[i] = vec
+
+        # Add it to the summary of all the vectors and of every subset it is in
+        if summaries is None:
+            return
+
+        for suffix, n in [("", None)] + [(f"_{n}", n) for n in subsets or []]:
+            if n is not None and i >= n:
+                continue
+
+            if suffix not in summaries:
+                summaries[suffix] = VectorSummary(len(vec), bins=bins)
+
+            summaries[suffix].append(vec)
+
+    def _save_summaries(
+        self,
+        client: Client,
+        vectors: List[Path],
+        subsets: Optional[List[int]],
+        bins: int,
+        key: Optional[str] = None,
+        reuse: bool = False,
+        streamed: Optional[Dict[str, VectorSummary]] = None,
+    ):
+        for suffix, subset in self._subsets(vectors, subsets):
+            # The summary may already be of these vectors, e.g. for a memoized run
+            summary_path = self.step_local_staging_dir / f"summary{suffix}.npz"
+            if reuse and summary_matches(summary_path, key, bins):
+                continue
+
+            # Only the vectors that weren't streamed are read back
+            summary = (streamed or {}).get(suffix)
+            if summary is None or len(subset) > 0:
+                read = self._summarize(client, summarize_files, subset, bins)
+                summary = read if summary is None else merge_summaries(summary, read)
+
+            summary.save(summary_path, key=key)
+
+    def _save_aggregate(
+        self,
+        vectors: List[Path],
+        chunk_size: int = 1024,
+        subsets: Optional[List[int]] = None,
+        arrays: Optional[Dict[int, np.ndarray]] = None,
+    ):
+        for suffix, subset in self._subsets(vectors, subsets):
+            # The aggregate may already be of these vectors, e.g. for a memoized run
+            aggregate_dir = self.step_local_staging_dir / f"aggregate{suffix}"
+            if load_block(aggregate_dir, subset) is not None:
+                continue
+
+            # Stack and sort the vectors sent back from the workers, only reading
+            # back those of resumed items
+            key = aggregate_key(subset)
+            if arrays is not None:
+                stacked = []
+                for path in subset:
+                    i = index_from_name(Path(path).name)
+                    stacked.append(arrays[i] if i in arrays else np.load(path))
+
+                block = block_from_arrays(stacked, list(range(len(subset))))
+                save_block(block, aggregate_dir, key)
+                log.info(f"Aggregate of the vectors stored to: {aggregate_dir}")
+                continue
+
+            # Otherwise stack and sort chunks of vectors, merge them on the workers
+            # and save the result where it ends up, so the vectors are never sent
+            # back
+            # Not annotated, the last merges need far more memory than a mapped task
+            with worker_client() as client:
+                blocks = [
+                    client.submit(
+                        block_from_files,
+                        subset[start : start + chunk_size],
+                        list(range(start, min(start + chunk_size, len(subset)))),
+                    )
+                    for start in range(0, len(subset), chunk_size)
+                ]
+                merged = tree_reduce(client, blocks, merge_blocks)
+                client.submit(save_block, merged, aggregate_dir, key).result()
+
+            log.info(f"Aggregate of the vectors stored to: {aggregate_dir}")
 
     @log_run_params
     def run(
         self,
-        matrices: Optional[Union[Union[str, Path], List[Path]]] = None,
+        matrices: Optional[
+            Union[
+                Union[str, Path],
+                List[Path],
+                ArrayHandoff,
+                ScratchHandoff,
+                SharedHandoff,
+            ]
+        ] = None,
         filepath_column: str = "filepath",
+        write_behind_bytes: int = 256 * 1024 * 1024,
+        resume: bool = False,
+        speculate: Optional[float] = None,
+        retries: int = 0,
+        failure_policy: str = "fail",
+        task_resources: Optional[Dict[str, float]] = None,
+        debug: bool = False,
+        debug_items: int = 8,
+        summarize: bool = False,
+        summary_bins: int = 1024,
+        aggregate: bool = False,
+        aggregate_chunk_size: int = 1024,
+        subsets: Optional[List[int]] = None,
+        preview_interval: Optional[float] = None,
+        memoize: bool = False,
         **kwargs,
     ) -> List[Path]:
         """
@@ -66,20 +259,109 @@ class MappedSum(Step):
 
         Parameters
         ----------
-        matrices: Optional[Union[Union[str, Path], List[Path]]]
-            A path to a csv manifest to use or directly a list of paths of serialized
-            arrays to sum.
+        matrices: Optional[
+            Union[
+                Union[str, Path],
+                List[Path],
+                ArrayHandoff,
+                ScratchHandoff,
+                SharedHandoff,
+            ]
+        ]
+            A path to a csv manifest to use, directly a list of paths of serialized
+            arrays to sum, or the handoff of arrays kept in worker memory, in worker
+            scratch or in shared memory by `MappedInvert`. Scratch arrays are summed
+            on the worker holding them, shared memory arrays are released once
+            summed. Resuming, memoization and previews do not apply to a handoff.
             Default: self.step_local_staging_dir.parent / "mappedinvert" / manifest.csv
 
         filepath_column: str
             If providing a path to a csv manifest, the column to use for matrices.
             Default: "filepath"
+        write_behind_bytes: int
+            The maximum total size of outputs waiting to be written in the background
+            while computation continues. Use 0 to write every output before moving on.
+            Items that may be retried or quarantined always write before moving on.
+            Default: 268435456 (256 MiB)
+        resume: bool
+            Skip the vectors a prior run already saved for unchanged inputs.
+            Default: False (Process all matrices)
+        speculate: Optional[float]
+            Launch a duplicate of any item still running after this multiple of the
+            median item runtime, once every item has started, and keep whichever copy
+            finishes first, see `map_completed`.
+            Default: None (No duplicates)
+        retries: int
+            The number of times an item is retried after a transient I/O error.
+            Default: 0
+        failure_policy: str
+            "fail" to stop at the first item that fails, or "continue" to quarantine
+            failed items to quarantine.csv in the step directory, with their error,
+            and carry on. Quarantined items are left out of the manifest, so
+            downstream steps skip them, and are retried by the next resumed run.
+            Retries and "continue" don't apply to items handed off in memory, in
+            scratch or in shared memory.
+            Default: "fail"
+        task_resources: Optional[Dict[str, float]]
+            Annotate the mapped tasks with the Dask resources each needs, such as
+            the bytes of MEMORY and the BLAS threads as CPU, so the scheduler never
+            runs more of them at once on a worker than it declares, see
+            `plan_cluster`. Only use it with workers that declare these resources,
+            tasks needing an undeclared resource never run.
+            Default: None (No annotation)
+        debug: bool
+            Only process a deterministic, stratified sample of debug_items of the
+            matrices, see `subsample`.
+            Default: False (Process all matrices)
+        debug_items: int
+            The number of matrices processed when debugging.
+            Default: 8
+        summarize: bool
+            Also save a summary of the vectors to summary.npz in the step directory:
+            the minimum, maximum, mean, variance and approximate quantiles at every
+            index, see `VectorSummary`. The vectors are sent back from the workers
+            and summarized as they complete, only the vectors of resumed items, or
+            of a memoized run, are read back to be summarized on the workers.
+            Default: False (Only save the vectors)
+        summary_bins: int
+            The number of bins used to approximate the quantiles, must be even.
+            Default: 1024
+        aggregate: bool
+            Also save the vectors stacked and sorted by their last value, with the
+            maximum of each, to the aggregate directory of the step, see
+            `VectorBlock`, so the plot steps can start from the assembled matrix
+            rather than reading every vector. The vectors are sent back from the
+            workers as they complete and stacked by the step, only the vectors of
+            resumed items are read back. The vectors of a memoized run are stacked
+            and sorted on the workers in chunks and merged with a tree reduction.
+            Default: False (Only save the vectors)
+        aggregate_chunk_size: int
+            The number of vectors stacked by each task when reading them back.
+            Default: 1024
+        subsets: Optional[List[int]]
+            Also summarize and aggregate the vectors of the first n items, for each n,
+            to summary_<n>.npz and the aggregate_<n> directory of the step, so runs of
+            fewer items can share the vectors of the largest, see `first_items`.
+            Default: None (Only summarize and aggregate all the vectors)
+        preview_interval: Optional[float]
+            Save approximate previews of the line and fancy plots of the vectors
+            completed so far in place of the plot.png and plot_fancy.png of the plot
+            steps, refreshed at most every this many seconds, see `PlotPreview`. The
+            vectors are sent back from the workers as they complete, those of resumed
+            items are read back to start from.
+            Default: None (No previews)
+        memoize: bool
+            Return the outputs of the last run if it had identical inputs, parameters
+            and code and they are still intact, instead of recomputing them.
+            Default: False (Recompute the outputs)
 
         Returns
         -------
         vectors: List[Path]
             The list of paths to the produced vectors.
         """
+        check_failure_policy(failure_policy)
+
         # Default matrices value
         if matrices is None:
             matrices = (
@@ -97,26 +379,167 @@ class MappedSum(Step):
             # Convert the specified column into a list of paths
             matrices = [Path(f) for f in raw_data[filepath_column]]
 
+        # Debug runs a stratified sample of the matrices
+        if debug and isinstance(matrices, list):
+            matrices = subsample(matrices, debug_items)
+
         # Storage dir
         sum_dir = self.step_local_staging_dir / "sum"
 
-        # Connect to an executor
-        with worker_client() as client:
-            # Create random arrays
-            futures = client.map(
-                self._sum_array, matrices, [sum_dir for i in range(len(matrices))],
-            )
+        # Sum arrays handed off in worker memory, scratch or shared memory, the
+        # vectors are final outputs so they are always saved to the staging directory
+        transport = transport_mode(matrices)
+        check_transport_failures(transport, retries, failure_policy)
+        if transport is not None:
+            with annotate_resources(task_resources), worker_client() as client:
+                summaries = {} if summarize else None
+                arrays = {} if aggregate else None
+                _, saved = map_transport(
+                    client,
+                    transport,
+                    sum_matrix,
+                    handoff_names(matrices),
+                    self.step_name,
+                    sources=matrices,
+                    keep=False,
+                    save_dir=sum_dir,
+                    write_behind_bytes=write_behind_bytes,
+                    stats_path=self.step_local_staging_dir / "locality.json",
+                    on_array=(
+                        partial(
+                            self._collect_item, summaries, arrays, subsets, summary_bins
+                        )
+                        if summarize or aggregate
+                        else None
+                    ),
+                )
+                vectors = [path for _, path in saved]
+                if summarize:
+                    self._save_summaries(
+                        client, [], subsets, summary_bins, streamed=summaries
+                    )
+
+            # Save the manifest
+            save_manifest(self, saved)
+
+            if aggregate:
+                self._save_aggregate(vectors, aggregate_chunk_size, subsets, arrays)
+
+            return vectors
+
+        # Return the outputs of an identical prior run if they are intact
+        cache = StepCache(self)
+        cache_key = cache.fingerprint(kwargs, inputs=matrices)
+        if memoize and cache.restore(cache_key):
+            save_quarantine(self.step_local_staging_dir / "quarantine.csv", [])
+            vectors = [Path(f) for f in self.manifest["filepath"]]
 
-            # Blocking until all are done
-            sum_infos = client.gather(futures)
+            # The summaries may belong to another cached run
+            if summarize:
+                with annotate_resources(task_resources), worker_client() as client:
+                    self._save_summaries(
+                        client, vectors, subsets, summary_bins, cache_key, reuse=True
+                    )
+
+            if aggregate:
+                self._save_aggregate(vectors, aggregate_chunk_size, subsets)
+
+            return vectors
 
         # Configure manifest dataframe for storage tracking
         self.manifest = pd.DataFrame(index=range(len(matrices)), columns=["filepath"])
-        for i, path in sum_infos:
-            self.manifest.at[i, "filepath"] = path
+
+        # Track completed items so an interrupted run can be resumed
+        journal = Journal(self.step_local_staging_dir / "journal.jsonl", resume=resume)
+
+        # Only process the matrices that aren't already done
+        # Index parsing mirrors `_sum_array`, the index is part of the filename
+        todo = []
+        sources = {}
+        resumed = []
+        for matrix in matrices:
+            i = int(Path(matrix).name.split(".")[0].split("_")[1])
+            path = journal.lookup(i, source=matrix)
+            if path is None:
+                todo.append(matrix)
+                sources[i] = matrix
+            else:
+                self.manifest.at[i, "filepath"] = path
+                resumed.append(path)
+
+        # Previews of the vectors completed so far
+        preview = None
+        if preview_interval is not None:
+            preview = PlotPreview(
+                self.step_local_staging_dir.parent, interval=preview_interval
+            )
+            for path in resumed:
+                preview.add(np.load(path))
+
+        # Connect to an executor
+        with journal, annotate_resources(task_resources), worker_client() as client:
+            results = map_completed(
+                client,
+                Guarded(self._sum_array, retries, failure_policy),
+                list(sources),
+                todo,
+                [sum_dir for i in range(len(todo))],
+                speculate=speculate,
+                write_behind_bytes=guarded_write_behind(
+                    write_behind_bytes, retries, failure_policy
+                ),
+                return_vector=preview is not None or summarize or aggregate,
+            )
+
+            # Record each item as soon as it is done, and summarize or keep it
+            summaries = {} if summarize else None
+            arrays = {} if aggregate else None
+            failures = []
+            for result in results:
+                if isinstance(result, ItemFailure):
+                    failures.append(result)
+                    continue
+
+                i, path, nbytes, checksum, vec = result
+                journal.record(i, path, nbytes, checksum, source=sources[i])
+                self.manifest.at[i, "filepath"] = path
+                if summarize or aggregate:
+                    self._collect_item(summaries, arrays, subsets, summary_bins, i, vec)
+                if preview is not None:
+                    preview.add(vec)
+
+            # Wait for every worker to finish writing before saving the manifest
+            client.run(flush_process_writer, sum_dir)
+
+            # Quarantine the failed items, they are retried when resuming
+            save_quarantine(self.step_local_staging_dir / "quarantine.csv", failures)
+            self.manifest = self.manifest.dropna(subset=["filepath"])
+
+            if preview is not None:
+                preview.refresh()
+
+            # Complete the summaries with the vectors of the resumed items
+            if summarize:
+                self._save_summaries(
+                    client,
+                    resumed,
+                    subsets,
+                    summary_bins,
+                    cache_key,
+                    streamed=summaries,
+                )
 
         # Save the manifest
         self.manifest.to_csv(self.step_local_staging_dir / "manifest.csv", index=False)
 
+        # Remember the outputs of this run, unless some items are missing
+        if len(failures) == 0:
+            cache.store(cache_key, self.manifest)
+
+        # Stack and sort the saved vectors for the plots
+        vectors = list(self.manifest["filepath"])
+        if aggregate:
+            self._save_aggregate(vectors, aggregate_chunk_size, subsets, arrays)
+
         # Return list of paths
-        return list(self.manifest["filepath"])
+        return vectors
@@ -3,14 +3,20 @@
 
 import logging
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 
 import matplotlib
 import matplotlib.pyplot as plt
-import numpy as np
 import pandas as pd
 from datastep import Step, log_run_params
-from tqdm import tqdm
+
+from example_step_workflow.utils.aggregate import load_block
+from example_step_workflow.utils.debug import subsample
+from example_step_workflow.utils.density import density_from_files
+from example_step_workflow.utils.memo import StepCache
+from example_step_workflow.utils.plotting import density_plot, envelope_plot, line_plot
+from example_step_workflow.utils.stack import load_stack
+from example_step_workflow.utils.summary import VectorSummary
 
 from ..sum import Sum
 
@@ -26,14 +32,31 @@ log = logging.getLogger(__name__)
 
 
 class Plot(Step):
-    def __init__(self, direct_upstream_tasks: List["Step"] = [Sum]):
-        super().__init__(direct_upstream_tasks=direct_upstream_tasks)
+    def __init__(
+        self,
+        direct_upstream_tasks: List["Step"] = [Sum],
+        config: Optional[Union[str, Path, Dict[str, str]]] = None,
+    ):
+        super().__init__(direct_upstream_tasks=direct_upstream_tasks, config=config)
 
     @log_run_params
     def run(
         self,
         vectors: Optional[Union[Union[str, Path], List[Path]]] = None,
         filepath_column: str = "filepath",
+        prefetch_depth: int = 4,
+        prefetch_max_bytes: int = 256 * 1024 * 1024,
+        mmap_min_bytes: int = 256 * 1024 * 1024,
+        rasterized: bool = False,
+        render_tile_size: Optional[int] = None,
+        render_processes: Optional[int] = None,
+        mode: str = "lines",
+        density_bins: int = 256,
+        summary: Optional[Union[str, Path]] = None,
+        aggregate: Optional[Union[str, Path]] = None,
+        debug: bool = False,
+        debug_items: int = 8,
+        memoize: bool = False,
         **kwargs,
     ) -> List[Path]:
         """
@@ -53,18 +76,86 @@ class Plot(Step):
         filepath_column: str
             If providing a path to a csv manifest, the column to use for vectors.
             Default: "filepath"
+        prefetch_depth: int
+            The number of vectors to read ahead in the background while the current
+            one is processed. Use 0 to read every vector only when it is needed.
+            Default: 4
+        prefetch_max_bytes: int
+            The maximum total size of the vectors read ahead.
+            Default: 268435456 (256 MiB)
+        mmap_min_bytes: int
+            The size from which the stacked vectors are memory-mapped from disk
+            instead of held in memory.
+            Default: 268435456 (256 MiB)
+        rasterized: bool
+            Should the lines be rasterized when the plot is saved to a vector format.
+            Default: False (Keep the lines as vectors)
+        render_tile_size: Optional[int]
+            In lines mode, render the lines in parallel, this many vectors per task,
+            on the workers of the Dask cluster running the step or otherwise on a pool
+            of processes. The tiles are composited into the final image, which matches
+            the serial render to within antialiasing rounding.
+            Default: None (Render serially)
+        render_processes: Optional[int]
+            The number of processes rendering tiles when not running on a Dask worker.
+            Default: None (One per core)
+        mode: str
+            "lines" to draw every vector as a red line, "density" to bin the
+            values of every vector by index into a 2-D histogram and draw it as a
+            single image, or "envelope" to draw the median and percentile bands at
+            every index from the summary saved by the sum step. Density mode reads the
+            vectors in chunks, so its memory use and drawing time do not grow with the
+            number of vectors. Envelope mode does not read the vectors at all.
+            Default: "lines"
+        density_bins: int
+            In density mode, the number of value bins, must be even.
+            Default: 256
+        summary: Optional[Union[str, Path]]
+            In envelope mode, the path to the summary of the vectors saved by the sum
+            step when run with `summarize`.
+            Default: self.step_local_staging_dir.parent / "sum" / summary.npz
+        aggregate: Optional[Union[str, Path]]
+            The directory of the vectors stacked and sorted by `MappedSum` with
+            aggregate, see `save_block`. Used instead of reading every vector if it
+            was built from exactly these vectors.
+            Default: None (Read every vector)
+        debug: bool
+            Only plot a deterministic, stratified sample of debug_items of the
+            vectors, see `subsample`, in a single task.
+            Default: False (Plot all vectors)
+        debug_items: int
+            The number of vectors plotted when debugging.
+            Default: 8
+        memoize: bool
+            Return the outputs of the last run if it had identical inputs, parameters
+            and code and they are still intact, instead of recomputing them.
+            Default: False (Recompute the outputs)
 
         Returns
         -------
         plots: List[Path]
             The list of paths to the produced plots.
         """
+        # Check the plotting mode
+        if mode not in ("lines", "density", "envelope"):
+            raise ValueError(
+                f"Unknown mode: '{mode}'. Use 'lines', 'density' or 'envelope'."
+            )
+
         # Default vectors value
         if vectors is None:
             vectors = self.step_local_staging_dir.parent / "sum" / "manifest.csv"
 
+        # The summary replaces the vectors in envelope mode
+        if mode == "envelope":
+            if summary is None:
+                summary = self.step_local_staging_dir.parent / "sum" / "summary.npz"
+
+            summary = Path(summary).resolve(strict=True)
+            vectors = [summary]
+
         # Get the matrices from the csv if provided a path
-        if isinstance(vectors, (str, Path)):
+        elif isinstance(vectors, (str, Path)):
             # Resolve the filepath and check for existance
             vectors = Path(vectors).resolve(strict=True)
 
@@ -74,41 +165,72 @@ class Plot(Step):
             # Convert the specified column into a list of paths
             vectors = [Path(f) for f in raw_data[filepath_column]]
 
+        # Debug plots a stratified sample of the vectors, without tiling
+        if debug:
+            vectors = subsample(vectors, debug_items)
+            render_tile_size = None
+
+        # Return the outputs of an identical prior run if they are intact
+        cache = StepCache(self)
+        cache_key = cache.fingerprint(
+            {
+                "rasterized": rasterized,
+                "render_tile_size": render_tile_size,
+                "mode": mode,
+                "density_bins": density_bins,
+                **kwargs,
+            },
+            inputs=vectors,
+        )
+        if memoize and cache.restore(cache_key):
+            return Path(self.manifest.at[0, "filepath"])
+
         # Storage dir
         plot_dir = self.step_local_staging_dir / "plots"
         plot_dir.mkdir(exist_ok=True)
 
-        # Plot the vectors as red lines
-        fig_line, ax_line = plt.subplots()  # the first figure, normal line plot
-        plot_matrix = np.nan
-        for i, vec in tqdm(enumerate(vectors), desc="Plotting vectors"):
-            # Load vector
-            vec = np.load(vec)
-
-            # check length of vector and make plotting matrix
-            if np.any(np.isnan(plot_matrix)):
-                n = len(vectors)
-                m = len(vec)
-                plot_matrix = np.zeros([n, m])
-
-            # fill plotting matrix
-            plot_matrix[i, :] = vec
-
-            # Append axPlot
-            ax_line.plot(vec, color="r")
-
-        # set axes limits
-        plt.sca(ax_line)
-        plt.xlim(1, m)
-        plt.ylim(0, np.amax(plot_matrix))
+        if mode == "envelope":
+            # Plot the distribution of the vectors from their summary
+            fig_line = envelope_plot(VectorSummary.load(summary)[0])
+        elif mode == "density":
+            # Bin the vectors chunk by chunk
+            histogram = density_from_files(
+                vectors,
+                bins=density_bins,
+                prefetch_depth=prefetch_depth,
+                prefetch_max_bytes=prefetch_max_bytes,
+            )
+
+            # Plot the density as an image
+            fig_line = density_plot(histogram)
+        else:
+            # Collect the vectors, already stacked on the workers if aggregated
+            block = None if aggregate is None else load_block(aggregate, vectors)
+            if block is not None:
+                plot_matrix = block.vectors
+            else:
+                plot_matrix = load_stack(
+                    vectors,
+                    cache_dir=self.step_local_staging_dir.parent / "vector_stacks",
+                    prefetch_depth=prefetch_depth,
+                    prefetch_max_bytes=prefetch_max_bytes,
+                    mmap_min_bytes=mmap_min_bytes,
+                )
+
+            # Plot the vectors as red lines
+            fig_line = line_plot(
+                plot_matrix,
+                rasterized=rasterized,
+                tile_size=render_tile_size,
+                processes=render_processes,
+            )
 
         # Configure manifest dataframe for storage tracking
         self.manifest = pd.DataFrame(index=range(1), columns=["filepath"])
 
         # Configure save path and save
         plot_save_path = plot_dir / "plot.png"
-        plt.sca(ax_line)
-        plt.savefig(plot_save_path, format="png")
+        fig_line.savefig(plot_save_path, format="png")
 
         # Add the path to manifest
         self.manifest.at[0, "filepath"] = plot_save_path
@@ -116,4 +238,7 @@ class Plot(Step):
         # Save the manifest
         self.manifest.to_csv(self.step_local_staging_dir / "manifest.csv", index=False)
 
+        # Remember the outputs of this run
+        cache.store(cache_key, self.manifest)
+
         return plot_save_path
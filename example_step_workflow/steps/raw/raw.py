@@ -11,6 +11,10 @@ from tqdm import tqdm
 
 from datastep import Step, log_run_params
 
+from example_step_workflow.utils.journal import Journal
+from example_step_workflow.utils.memo import StepCache
+from example_step_workflow.utils.writer import AsyncWriter
+
 ###############################################################################
 
 log = logging.getLogger(__name__)
@@ -20,7 +24,17 @@ log = logging.getLogger(__name__)
 
 class Raw(Step):
     @log_run_params
-    def run(self, n: int = 100, m: int = 100, seed: int = 1, **kwargs) -> List[Path]:
+    def run(
+        self,
+        n: int = 100,
+        m: int = 100,
+        seed: int = 1,
+        dtype: str = "float64",
+        write_behind_bytes: int = 256 * 1024 * 1024,
+        resume: bool = False,
+        memoize: bool = False,
+        **kwargs,
+    ) -> List[Path]:
         """
         Generates n random arrays of shape (m, m) and saves them to /matrices
 
@@ -34,12 +48,43 @@ class Raw(Step):
             Default: 100 (100 x 100)
         seed: int
             Seed for numpy's random number generator
+        dtype: str
+            The floating point precision of the arrays, "float64" or "float32".
+            Downstream steps keep the precision of the arrays they are given, so
+            "float32" halves the bytes stored and held in memory.
+            Default: "float64"
+        write_behind_bytes: int
+            The maximum total size of outputs waiting to be written in the background
+            while computation continues. Use 0 to write every output before moving on.
+            Default: 268435456 (256 MiB)
+        resume: bool
+            Skip the arrays a prior run with the same m, seed and dtype already saved.
+            Running again with a larger n only saves the new arrays.
+            Default: False (Generate and save all arrays)
+        memoize: bool
+            Return the outputs of the last run if it had identical inputs, parameters
+            and code and they are still intact, instead of recomputing them.
+            Default: False (Recompute the outputs)
 
         Returns
         -------
         arrays: List[Path]
             The paths to the generated arrays.
         """
+        # Check precision
+        if np.dtype(dtype) not in (np.float32, np.float64):
+            raise ValueError(
+                f"Unsupported dtype: '{dtype}'. Use either 'float64' or 'float32'."
+            )
+
+        # Return the outputs of an identical prior run if they are intact
+        cache = StepCache(self)
+        cache_key = cache.fingerprint(
+            {"n": n, "m": m, "seed": seed, "dtype": dtype, **kwargs}
+        )
+        if memoize and cache.restore(cache_key):
+            return [Path(f) for f in self.manifest["filepath"]]
+
         # Configure random seed
         np.random.seed(seed=seed)
 
@@ -50,23 +95,38 @@ class Raw(Step):
         matrices_dir = self.step_local_staging_dir / "matrices"
         matrices_dir.mkdir(exist_ok=True)
 
+        # Track completed arrays so an interrupted run can be resumed
+        journal = Journal(
+            self.step_local_staging_dir / "journal.jsonl",
+            params={"m": m, "seed": seed, "dtype": dtype},
+            resume=resume,
+        )
+
         # Generate random arrays
         arrs = []
-        for i in tqdm(range(n), desc="Creating and saving matrices"):
-            # Generate random m by m array
-            x = np.random.rand(m, m)
+        with journal, AsyncWriter(max_bytes=write_behind_bytes) as writer:
+            for i in tqdm(range(n), desc="Creating and saving matrices"):
+                # Generate random m by m array
+                # Always generate so the random stream matches an uninterrupted run
+                x = np.random.rand(m, m).astype(dtype, copy=False)
 
-            # Configure save path and save
-            matrix_save_path = matrices_dir / f"matrix_{i}.npy"
-            np.save(matrix_save_path, x)
+                # Configure save path and save if not already done
+                matrix_save_path = journal.lookup(i)
+                if matrix_save_path is None:
+                    matrix_save_path = matrices_dir / f"matrix_{i}.npy"
+                    nbytes, checksum = writer.save(matrix_save_path, x)
+                    journal.record(i, matrix_save_path, nbytes, checksum)
 
-            # Add the path to the manifest
-            self.manifest.at[i, "filepath"] = matrix_save_path
+                # Add the path to the manifest
+                self.manifest.at[i, "filepath"] = matrix_save_path
 
-            # Append the array save path to the list of arrays
-            arrs.append(matrix_save_path)
+                # Append the array save path to the list of arrays
+                arrs.append(matrix_save_path)
 
         # Save the manifest
         self.manifest.to_csv(self.step_local_staging_dir / "manifest.csv", index=False)
 
+        # Remember the outputs of this run
+        cache.store(cache_key, self.manifest)
+
         return arrs
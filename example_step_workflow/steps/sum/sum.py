@@ -3,7 +3,7 @@
 
 import logging
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 
 import numpy as np
 import pandas as pd
@@ -11,6 +11,18 @@ from tqdm import tqdm
 
 from datastep import Step, log_run_params
 
+from example_step_workflow.utils.journal import Journal
+from example_step_workflow.utils.kernels import sum_matrix
+from example_step_workflow.utils.memo import StepCache
+from example_step_workflow.utils.prefetch import prefetch
+from example_step_workflow.utils.preview import PlotPreview
+from example_step_workflow.utils.summary import (
+    VectorSummary,
+    summarize_files,
+    summary_matches,
+)
+from example_step_workflow.utils.writer import AsyncWriter
+
 from ..invert import Invert
 
 ###############################################################################
@@ -21,14 +33,26 @@ log = logging.getLogger(__name__)
 
 
 class Sum(Step):
-    def __init__(self, direct_upstream_tasks: List["Step"] = [Invert]):
-        super().__init__(direct_upstream_tasks=direct_upstream_tasks)
+    def __init__(
+        self,
+        direct_upstream_tasks: List["Step"] = [Invert],
+        config: Optional[Union[str, Path, Dict[str, str]]] = None,
+    ):
+        super().__init__(direct_upstream_tasks=direct_upstream_tasks, config=config)
 
     @log_run_params
     def run(
         self,
         matrices: Optional[Union[Union[str, Path], List[Path]]] = None,
         filepath_column: str = "filepath",
+        prefetch_depth: int = 4,
+        prefetch_max_bytes: int = 256 * 1024 * 1024,
+        write_behind_bytes: int = 256 * 1024 * 1024,
+        resume: bool = False,
+        summarize: bool = False,
+        summary_bins: int = 1024,
+        preview_interval: Optional[float] = None,
+        memoize: bool = False,
         **kwargs,
     ) -> List[Path]:
         """
@@ -48,6 +72,38 @@ class Sum(Step):
         filepath_column: str
             If providing a path to a csv manifest, the column to use for matrices.
             Default: "filepath"
+        prefetch_depth: int
+            The number of matrices to read ahead in the background while the current
+            one is processed. Use 0 to read every matrix only when it is needed.
+            Default: 4
+        prefetch_max_bytes: int
+            The maximum total size of the matrices read ahead.
+            Default: 268435456 (256 MiB)
+        write_behind_bytes: int
+            The maximum total size of outputs waiting to be written in the background
+            while computation continues. Use 0 to write every output before moving on.
+            Default: 268435456 (256 MiB)
+        resume: bool
+            Skip the vectors a prior run already saved for unchanged inputs.
+            Default: False (Sum all matrices)
+        summarize: bool
+            Also save a summary of the vectors to summary.npz in the step directory:
+            the minimum, maximum, mean, variance and approximate quantiles at every
+            index, see `VectorSummary`. Its size does not depend on the number of
+            vectors.
+            Default: False (Only save the vectors)
+        summary_bins: int
+            The number of bins used to approximate the quantiles, must be even.
+            Default: 1024
+        preview_interval: Optional[float]
+            Save approximate previews of the line and fancy plots of the vectors
+            completed so far in place of the plot.png and plot_fancy.png of the plot
+            steps, refreshed at most every this many seconds, see `PlotPreview`.
+            Default: None (No previews)
+        memoize: bool
+            Return the outputs of the last run if it had identical inputs, parameters
+            and code and they are still intact, instead of recomputing them.
+            Default: False (Recompute the outputs)
 
         Returns
         -------
@@ -72,32 +128,90 @@ class Sum(Step):
         # Configure manifest dataframe for storage tracking
         self.manifest = pd.DataFrame(index=range(len(matrices)), columns=["filepath"])
 
+        # Return the outputs of an identical prior run if they are intact
+        cache = StepCache(self)
+        cache_key = cache.fingerprint(kwargs, inputs=matrices)
+        summary_path = self.step_local_staging_dir / "summary.npz"
+        if memoize and cache.restore(cache_key):
+            sums = [Path(f) for f in self.manifest["filepath"]]
+
+            # The summary may belong to another cached run
+            if summarize and not summary_matches(summary_path, cache_key, summary_bins):
+                summary = summarize_files(sums, bins=summary_bins)
+                summary.save(summary_path, key=cache_key)
+
+            return sums
+
         # Storage dir
         vector_dir = self.step_local_staging_dir / "vectors"
         vector_dir.mkdir(exist_ok=True)
 
+        # Track completed vectors so an interrupted run can be resumed
+        journal = Journal(self.step_local_staging_dir / "journal.jsonl", resume=resume)
+        done = [journal.lookup(i, source=matrix) for i, matrix in enumerate(matrices)]
+
+        # Read the matrices that still need processing ahead of time
+        loaded = prefetch(
+            [matrix for matrix, path in zip(matrices, done) if path is None],
+            depth=prefetch_depth,
+            max_bytes=prefetch_max_bytes,
+        )
+
         # Sum the matrices
         sums = []
-        for i, matrix in tqdm(enumerate(matrices), desc="Sum and sort matrices"):
-            # Load matrix
-            mat = np.load(matrix)
-
-            # Process
-            vec = np.amax(mat, 0)
-            vec = np.sort(vec)
-            vec = np.cumsum(vec)
+        summary = None
+        preview = None
+        if preview_interval is not None:
+            preview = PlotPreview(
+                self.step_local_staging_dir.parent, interval=preview_interval
+            )
+
+        with journal, AsyncWriter(max_bytes=write_behind_bytes) as writer:
+            for i, matrix in tqdm(enumerate(matrices), desc="Sum and sort matrices"):
+                # Skip matrices already summed by a prior run
+                vec_save_path = done[i]
+                if vec_save_path is None:
+                    # Load matrix
+                    _, mat = next(loaded)
+
+                    # Process
+                    vec = sum_matrix(mat)
+
+                    # Configure save path and save
+                    vec_save_path = vector_dir / f"vector_{i}.npy"
+                    nbytes, checksum = writer.save(vec_save_path, vec)
+                    journal.record(i, vec_save_path, nbytes, checksum, source=matrix)
+                elif summarize or preview is not None:
+                    vec = np.load(vec_save_path)
+
+                # Add the vector to the summary
+                if summarize:
+                    if summary is None:
+                        summary = VectorSummary(len(vec), bins=summary_bins)
+                    summary.append(vec)
+
+                # Draw the vector on the previews
+                if preview is not None:
+                    preview.add(vec)
+
+                # Add the path to manifest
+                self.manifest.at[i, "filepath"] = vec_save_path
+
+                # Append the sum save path to the list of sums
+                sums.append(vec_save_path)
 
-            # Configure save path and save
-            vec_save_path = vector_dir / f"vector_{i}.npy"
-            np.save(vec_save_path, vec)
+        # Save the manifest
+        self.manifest.to_csv(self.step_local_staging_dir / "manifest.csv", index=False)
 
-            # Add the path to manifest
-            self.manifest.at[i, "filepath"] = vec_save_path
+        # Save the final previews
+        if preview is not None:
+            preview.refresh()
 
-            # Append the sum save path to the list of sums
-            sums.append(vec_save_path)
+        # Save the summary
+        if summary is not None:
+            summary.save(summary_path, key=cache_key)
 
-        # Save the manifest
-        self.manifest.to_csv(self.step_local_staging_dir / "manifest.csv", index=False)
+        # Remember the outputs of this run
+        cache.store(cache_key, self.manifest)
 
         return sums
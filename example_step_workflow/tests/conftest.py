@@ -0,0 +1,10 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+
+@pytest.fixture
+def config(tmp_path):
+    # Stage step outputs in the test's directory rather than the cwd
+    return {"project_local_staging_dir": str(tmp_path / "local_staging")}
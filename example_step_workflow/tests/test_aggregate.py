@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import shutil
+
+import numpy as np
+from distributed import Client, LocalCluster
+
+from example_step_workflow.steps import MappedInvert, MappedRaw, MappedSum
+from example_step_workflow.steps.mapped_sum import mapped_sum
+from example_step_workflow.utils.aggregate import (
+    aggregate_key,
+    block_from_arrays,
+    block_from_files,
+    load_block,
+    merge_blocks,
+    save_block,
+)
+
+
+def test_merged_blocks_match_a_single_sort(tmp_path):
+    vectors = np.cumsum(np.random.default_rng(3).random((20, 5)), axis=1)
+    paths = []
+    for i, vec in enumerate(vectors):
+        paths.append(tmp_path / f"matrix_{i}.npy")
+        np.save(paths[-1], vec)
+
+    # Blocks of consecutive vectors, merged as by a tree reduction
+    blocks = [
+        block_from_files(paths[start : start + 6], list(range(start, start + 6)))
+        for start in range(0, 20, 6)
+    ]
+    merged = merge_blocks(merge_blocks(blocks[0], blocks[1]), blocks[2], blocks[3])
+
+    order = np.argsort(vectors[:, -1], kind="stable")
+    np.testing.assert_array_equal(merged.indices, order)
+    np.testing.assert_array_equal(merged.vectors, vectors[order])
+    np.testing.assert_array_equal(merged.maxima, np.amax(vectors[order], axis=1))
+    np.testing.assert_array_equal(
+        block_from_arrays(list(vectors), list(range(20))).vectors, merged.vectors
+    )
+
+    # Only the vectors the block was built from load it
+    save_block(merged, tmp_path / "aggregate", aggregate_key(paths))
+    loaded = load_block(tmp_path / "aggregate", paths)
+    np.testing.assert_array_equal(loaded.vectors, merged.vectors)
+    assert load_block(tmp_path / "aggregate", paths[:-1]) is None
+
+
+def test_mapped_sum_aggregates_the_vectors_sent_back(config, monkeypatch):
+    def no_reads(paths, indices):
+        raise AssertionError("The vectors were read back")
+
+    monkeypatch.setattr(mapped_sum, "block_from_files", no_reads)
+
+    with LocalCluster(n_workers=2, processes=False) as cluster, Client(
+        cluster
+    ) as client:
+        cumsum = MappedSum(config=config)
+        aggregate_dir = cumsum.step_local_staging_dir / "aggregate"
+        matrices = client.submit(
+            MappedRaw(config=config).run, n=7, m=4, seed=3
+        ).result()
+        inversions = client.submit(MappedInvert(config=config).run, matrices).result()
+        vectors = client.submit(
+            cumsum.run, inversions, aggregate=True, memoize=False
+        ).result()
+
+        data = np.stack([np.load(vector) for vector in vectors])
+        order = np.argsort(data[:, -1], kind="stable")
+        block = load_block(aggregate_dir, vectors)
+        np.testing.assert_array_equal(block.indices, order)
+        np.testing.assert_array_equal(block.vectors, data[order])
+
+        # The vectors of resumed items are read back by the step
+        shutil.rmtree(aggregate_dir)
+        client.submit(
+            cumsum.run, inversions, aggregate=True, resume=True, memoize=False
+        ).result()
+        np.testing.assert_array_equal(
+            load_block(aggregate_dir, vectors).vectors, data[order]
+        )
+
+        # Handed off vectors are kept as they complete too
+        handoff = client.submit(
+            MappedInvert(config=config).run, matrices, in_memory=True
+        ).result()
+        vectors = client.submit(cumsum.run, handoff, aggregate=True).result()
+        np.testing.assert_array_equal(
+            load_block(aggregate_dir, vectors).vectors, data[order]
+        )
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from example_step_workflow import transform
+from example_step_workflow.steps import Invert, Raw, Sum
+
+
+def test_transform_matches_steps(config):
+    matrices = Raw(config=config).run(n=5, m=4, seed=3, memoize=False)
+    inversions = Invert(config=config).run(matrices, memoize=False)
+    vectors = Sum(config=config).run(inversions, memoize=False)
+    expected = np.stack([np.load(vector) for vector in vectors])
+
+    stack = np.stack([np.load(matrix) for matrix in matrices])
+    result, fig = transform(stack)
+    np.testing.assert_array_equal(result, expected)
+    assert fig is None
+
+
+@pytest.mark.parametrize("n_threads, batch_size", [(1, 1), (2, 2), (3, 64)])
+def test_transform_iterator_keeps_order(n_threads, batch_size):
+    stack = np.random.default_rng(0).random((7, 5, 5))
+    expected, _ = transform(stack)
+
+    result, fig = transform(
+        iter(list(stack)), n_threads=n_threads, batch_size=batch_size, plot=True
+    )
+    np.testing.assert_array_equal(result, expected)
+    assert len(fig.axes[0].collections[0].get_segments()) == 7
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+from example_step_workflow.utils import blas
+from example_step_workflow.utils.blas import blas_splits, tune_blas
+from example_step_workflow.utils.planner import GB, plan_cluster
+
+
+def test_blas_splits():
+    assert blas_splits(1) == [(1, 1)]
+    assert blas_splits(6) == [(1, 6), (2, 3), (4, 1), (6, 1)]
+
+
+def test_tuning_is_cached_per_host_and_m(tmp_path, monkeypatch):
+    cache_path = tmp_path / "blas_tuning.json"
+    layout = tune_blas(32, cores=2, cache_path=cache_path, seconds=0.05)
+    assert (layout.threads, layout.tasks) in blas_splits(2)
+    assert len(json.loads(cache_path.read_text())) == 1
+
+    # Cached decisions are reused without benchmarking
+    def fail(*args, **kwargs):
+        raise AssertionError("Benchmarked a cached decision")
+
+    monkeypatch.setattr(blas, "benchmark_split", fail)
+    assert tune_blas(32, cores=2, cache_path=cache_path) == layout
+
+
+def test_plans_leave_cores_for_blas_threads():
+    plan = plan_cluster(n=100, m=100, cores=8, memory=8 * GB, blas_threads=4)
+    assert plan.workers == 2
+    assert plan.task_resources["CPU"] == plan.worker_resources["CPU"] == 4
+
+    # SLURM jobs run as many tasks at once as they have cores for
+    plan = plan_cluster(n=100, m=100, distributed=True, job_cores=4, blas_threads=2)
+    assert plan.worker_resources["CPU"] // plan.task_resources["CPU"] == 2
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from example_step_workflow.utils.debug import StepTiming, extrapolate, subsample
+from example_step_workflow.utils.planner import plan_cluster
+
+
+def test_subsample_is_stratified():
+    assert subsample(list(range(100)), 4) == [12, 37, 62, 87]
+    assert subsample(list(range(100)), 4) == subsample(list(range(100)), 4)
+    assert subsample(list(range(3)), 8) == [0, 1, 2]
+
+
+def test_extrapolate():
+    plan = plan_cluster(n=1000, m=100, cores=4, memory=16 * 1000**3)
+    timings = [StepTiming("mappedinvert", 8, 1.0), StepTiming("plot", 8, 1.0)]
+    invert, plot = extrapolate(timings, 1000, 100, 8, 50, plan)
+
+    # Inverting scales with the items and m cubed, spread over every worker
+    assert invert.serial_seconds == pytest.approx(125 * 8)
+    assert invert.wall_seconds == pytest.approx(125 * 8 / plan.workers)
+
+    # Plotting scales with the points drawn, in a single task
+    assert plot.serial_seconds == pytest.approx(125 * 2)
+    assert plot.wall_seconds == plot.serial_seconds
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from example_step_workflow.steps import Invert, Plot, Raw, Sum
+from example_step_workflow.utils.density import DensityHistogram
+
+
+def _expected_counts(histogram, data):
+    # Count every value in its bin one at a time
+    counts = np.zeros_like(histogram.counts)
+    rows = np.floor(data / histogram.width).astype(int) - histogram.start
+    np.add.at(counts, (np.broadcast_to(np.arange(data.shape[1]), data.shape), rows), 1)
+    return counts
+
+
+def test_density_histogram_chunks_and_merges_exactly():
+    rng = np.random.default_rng(0)
+    data = np.cumsum(rng.standard_cauchy((400, 7)), axis=1)
+
+    # Accumulate four parts chunk by chunk, then merge them out of order
+    parts = [DensityHistogram(7, bins=16) for _ in range(4)]
+    for i, part in enumerate(parts):
+        for chunk in np.array_split(data[i::4], 3):
+            part.add(chunk)
+
+    merged = DensityHistogram(7, bins=16)
+    for i in [2, 0, 3, 1]:
+        merged.merge(parts[i])
+
+    assert merged.n == 400
+    assert merged.lo <= data.min() and merged.hi > data.max()
+    np.testing.assert_array_equal(merged.counts, _expected_counts(merged, data))
+
+
+def test_plot_density_mode(config):
+    matrices = Raw(config=config).run(n=4, m=5, seed=4, memoize=False)
+    vectors = Sum(config=config).run(
+        Invert(config=config).run(matrices, memoize=False), memoize=False
+    )
+
+    plot = Plot(config=config).run(
+        vectors, mode="density", density_bins=8, memoize=False
+    )
+    assert plot.is_file()
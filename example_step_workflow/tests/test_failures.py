@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+from distributed import Client, LocalCluster
+
+from example_step_workflow.steps import MappedInvert, MappedRaw, MappedSum
+from example_step_workflow.utils.failures import Guarded, ItemFailure
+
+
+class _Flaky:
+    def __init__(self, errors):
+        self.errors = list(errors)
+
+    def __call__(self):
+        if len(self.errors) > 0:
+            raise self.errors.pop(0)
+
+        return "done"
+
+
+def test_guarded_retries_transient_errors_only():
+    flaky = _Flaky([OSError("stale file handle"), OSError("stale file handle")])
+    assert Guarded(flaky, retries=2, delay=0)(0) == "done"
+
+    flaky = _Flaky([OSError("stale file handle"), ValueError("bad input")])
+    failure = Guarded(flaky, retries=2, failure_policy="continue", delay=0)(3)
+    assert isinstance(failure, ItemFailure)
+    assert failure.index == 3
+    assert failure.attempts == 2
+    assert failure.error == "ValueError: bad input"
+
+    with pytest.raises(ValueError):
+        Guarded(_Flaky([ValueError("bad input")]), retries=2, delay=0)(0)
+
+
+def test_singular_matrix_is_quarantined_and_skipped(tmp_path, config):
+    matrices = []
+    for i in range(3):
+        mat = np.zeros((3, 3)) if i == 1 else np.eye(3) * (i + 1)
+        matrices.append(tmp_path / f"matrix_{i}.npy")
+        np.save(matrices[-1], mat)
+
+    with LocalCluster(n_workers=2, processes=False) as cluster, Client(
+        cluster
+    ) as client:
+        invert, cumsum = MappedInvert(config=config), MappedSum(config=config)
+        with pytest.raises(np.linalg.LinAlgError):
+            client.submit(invert.run, matrices, memoize=False).result()
+
+        inversions = client.submit(
+            invert.run, matrices, memoize=False, failure_policy="continue"
+        ).result()
+        quarantine = pd.read_csv(invert.step_local_staging_dir / "quarantine.csv")
+        assert list(quarantine["index"]) == [1]
+        assert quarantine["error"][0].startswith("LinAlgError")
+
+        # Downstream only sees the items that succeeded
+        assert [path.name for path in inversions] == ["matrix_0.npy", "matrix_2.npy"]
+        vectors = client.submit(cumsum.run, inversions, memoize=False).result()
+        assert [path.name for path in vectors] == ["matrix_0.npy", "matrix_2.npy"]
+        np.testing.assert_array_equal(np.load(vectors[1]), np.cumsum([1 / 3] * 3))
+
+
+def test_write_error_is_quarantined_with_its_own_item(tmp_path, config):
+    matrices = []
+    for i in range(4):
+        matrices.append(tmp_path / f"matrix_{i}.npy")
+        np.save(matrices[-1], np.eye(3) * (i + 1))
+
+    with LocalCluster(n_workers=1, processes=False) as cluster, Client(
+        cluster
+    ) as client:
+        invert = MappedInvert(config=config)
+
+        # The output of item 2 can't be written over a directory
+        (invert.step_local_staging_dir / "inverted" / "matrix_2.npy").mkdir(
+            parents=True
+        )
+        inversions = client.submit(
+            invert.run, matrices, failure_policy="continue"
+        ).result()
+
+        quarantine = pd.read_csv(invert.step_local_staging_dir / "quarantine.csv")
+        assert list(quarantine["index"]) == [2]
+        assert [path.name for path in inversions] == [
+            "matrix_0.npy",
+            "matrix_1.npy",
+            "matrix_3.npy",
+        ]
+        assert all(path.is_file() for path in inversions)
+
+
+def test_handoffs_reject_failure_handling(config):
+    with LocalCluster(n_workers=1, processes=False) as cluster, Client(
+        cluster
+    ) as client:
+        raw = MappedRaw(config=config)
+        for kwargs in [dict(failure_policy="continue"), dict(retries=2)]:
+            with pytest.raises(ValueError):
+                # Bound, retries is also a keyword of submit
+                run = partial(raw.run, n=2, m=3, in_memory=True, **kwargs)
+                client.submit(run).result()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+
+import matplotlib.image
+import numpy as np
+import pytest
+
+from example_step_workflow.steps.fancyplot.plot_utils import (
+    composite_gradient_fills,
+    fancy_plot,
+)
+
+
+def _composite_pixel_by_pixel(plot_matrix, colors, extent, shape):
+    # Draw each fill over the previous ones one pixel at a time
+    height, width = shape
+    left, right, bottom, top = extent
+    n, m = plot_matrix.shape
+    image = np.zeros((height, width, 4))
+    for vec, color in zip(plot_matrix, colors):
+        for col in range(width):
+            x = left + (col + 0.5) * (right - left) / width
+            if x < 0 or x > m - 1 or vec.max() == vec.min():
+                continue
+
+            for row in range(height):
+                y = top - (row + 0.5) * (top - bottom) / height
+                if vec.min() <= y <= np.interp(x, np.arange(m), vec):
+                    alpha = min((y - vec.min()) / (vec.max() - vec.min()), 1 - 1e-6)
+                    image[row, col, :3] = (
+                        alpha * color[:3] + (1 - alpha) * image[row, col, :3]
+                    )
+                    image[row, col, 3] = alpha + (1 - alpha) * image[row, col, 3]
+
+    # Straight alpha
+    filled = image[:, :, 3] > 0
+    image[filled, :3] /= image[filled, 3:]
+    return image
+
+
+@pytest.mark.parametrize("max_pixels", [1, 50, 4 * 1024 * 1024])
+def test_composite_gradient_fills_matches_pixel_by_pixel(max_pixels):
+    rng = np.random.default_rng(1)
+    plot_matrix = np.cumsum(rng.normal(size=(12, 6)), axis=1)
+    plot_matrix[3] = 1.0
+    colors = rng.random((12, 4))
+    extent = (1, 6, plot_matrix.min() - 0.5, plot_matrix.max())
+
+    rgba = composite_gradient_fills(
+        plot_matrix, colors, extent, (23, 31), max_pixels=max_pixels
+    )
+    expected = _composite_pixel_by_pixel(plot_matrix, colors, extent, (23, 31))
+    np.testing.assert_allclose(rgba, expected, atol=1e-9)
+
+
+def _png(fig) -> np.ndarray:
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    return matplotlib.image.imread(io.BytesIO(buffer.getvalue()))
+
+
+def test_fancy_plot_overlays_the_lines_on_the_fills():
+    rng = np.random.default_rng(0)
+    plot_matrix = np.cumsum(rng.random((50, 30)), axis=1)
+
+    fig = fancy_plot(plot_matrix)
+    (image,) = fig.axes[0].images
+    (lines,) = fig.axes[0].collections
+    assert image.get_zorder() < lines.get_zorder()
+
+    # Tiles are composited with their lines over the fills of every tile too
+    tiled = fancy_plot(plot_matrix, tile_size=10, processes=1)
+    difference = np.abs(_png(fig) - _png(tiled)).max(axis=-1)
+    assert np.mean(difference > 0.1) < 0.01
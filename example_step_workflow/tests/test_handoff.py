@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from distributed import Client, LocalCluster
+
+from example_step_workflow.steps import MappedInvert, MappedRaw, MappedSum
+from example_step_workflow.utils.handoff import ArrayHandoff, unpublish
+
+
+def test_in_memory_handoff_matches_saved_outputs(config):
+    with LocalCluster(n_workers=2, processes=False) as cluster, Client(
+        cluster
+    ) as client:
+        raw, invert, cumsum = (
+            MappedRaw(config=config),
+            MappedInvert(config=config),
+            MappedSum(config=config),
+        )
+
+        # Only the vectors are saved when handing off in memory
+        matrices = client.submit(raw.run, n=4, m=3, seed=2, in_memory=True).result()
+        assert isinstance(matrices, ArrayHandoff)
+        inversions = client.submit(invert.run, matrices, in_memory=True).result()
+        assert isinstance(inversions, ArrayHandoff)
+        vectors = client.submit(cumsum.run, inversions).result()
+
+        for i, vector in enumerate(vectors):
+            mat = MappedRaw._generate(i, 3, 2, "float64")
+            expected = np.cumsum(np.sort(np.amax(np.linalg.inv(mat), 0)))
+            np.testing.assert_array_equal(np.load(vector), expected)
+
+
+def test_unconsumed_handoff_is_unpublished(config):
+    with LocalCluster(n_workers=1, processes=False) as cluster, Client(
+        cluster
+    ) as client:
+        raw = MappedRaw(config=config)
+        matrices = client.submit(raw.run, n=2, m=3, in_memory=True).result()
+        assert matrices.dataset in client.list_datasets()
+
+        # As after a failed consumer, the arrays are released
+        unpublish(client, matrices)
+        assert matrices.dataset not in client.list_datasets()
+        unpublish(client, matrices)
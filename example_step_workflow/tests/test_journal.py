@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from example_step_workflow.steps import Raw
+from example_step_workflow.utils.journal import Journal
+
+
+def test_raw_resume_appends_new_items(config):
+    raw = Raw(config=config)
+    first = raw.run(n=2, m=3, seed=4)
+    first_mtimes = [p.stat().st_mtime_ns for p in first]
+
+    # Increasing n while resuming only saves the new arrays
+    second = raw.run(n=4, m=3, seed=4, resume=True)
+    assert len(second) == 4
+    assert [p.stat().st_mtime_ns for p in second[:2]] == first_mtimes
+
+    # The appended arrays match those of an uninterrupted run
+    resumed = [np.load(p) for p in second]
+    full = [np.load(p) for p in raw.run(n=4, m=3, seed=4, memoize=False)]
+    for a, b in zip(resumed, full):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_journal_rejects_changed_outputs(tmp_path):
+    output = tmp_path / "out.npy"
+    output.write_bytes(b"abc")
+
+    with Journal(tmp_path / "journal.jsonl", params={"m": 1}) as journal:
+        journal.record(0, output, 3, "checksum")
+
+    assert Journal(tmp_path / "journal.jsonl", {"m": 1}, resume=True).lookup(0)
+    assert Journal(tmp_path / "journal.jsonl", {"m": 2}, resume=True).lookup(0) is None
+
+    output.write_bytes(b"abcd")
+    assert Journal(tmp_path / "journal.jsonl", {"m": 2}, resume=True).lookup(0) is None
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+from pathlib import Path
+
+import numpy as np
+from distributed import Client, LocalCluster
+
+from example_step_workflow.steps import MappedInvert, MappedRaw, MappedSum
+from example_step_workflow.utils.locality import ScratchHandoff
+
+
+def test_scratch_handoff_matches_saved_outputs(config):
+    with LocalCluster(n_workers=2, processes=False) as cluster, Client(
+        cluster
+    ) as client:
+        raw, invert, cumsum = (
+            MappedRaw(config=config),
+            MappedInvert(config=config),
+            MappedSum(config=config),
+        )
+
+        # Only the vectors are saved when handing off in scratch
+        matrices = client.submit(raw.run, n=4, m=3, seed=2, locality=True).result()
+        assert isinstance(matrices, ScratchHandoff)
+        assert set(matrices.workers) <= set(client.scheduler_info()["workers"])
+        inversions = client.submit(invert.run, matrices, locality=True).result()
+        assert isinstance(inversions, ScratchHandoff)
+        vectors = client.submit(cumsum.run, inversions).result()
+
+        for i, vector in enumerate(vectors):
+            mat = MappedRaw._generate(i, 3, 2, "float64")
+            expected = np.cumsum(np.sort(np.amax(np.linalg.inv(mat), 0)))
+            np.testing.assert_array_equal(np.load(vector), expected)
+
+        for step in [invert, cumsum]:
+            with open(Path(step.step_local_staging_dir) / "locality.json") as read_in:
+                stats = json.load(read_in)
+
+            assert stats["tasks"] == 4
+            assert 0 <= stats["hit_rate"] <= 1
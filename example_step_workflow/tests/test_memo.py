@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from pathlib import Path
+
+import numpy as np
+
+from example_step_workflow.steps import Raw
+from example_step_workflow.utils import memo
+
+
+def test_raw_memoized_run_reuses_outputs(config):
+    raw = Raw(config=config)
+    first = raw.run(n=3, m=3, seed=5, memoize=False)
+    first_mtimes = [p.stat().st_mtime_ns for p in first]
+
+    # An identical run returns the prior outputs without rewriting them
+    second = raw.run(n=3, m=3, seed=5, memoize=True)
+    assert second == first
+    assert [p.stat().st_mtime_ns for p in second] == first_mtimes
+    assert len(raw.manifest) == 3
+
+
+def test_raw_memo_eviction_removes_unreferenced_outputs(config):
+    raw = Raw(config=config)
+    first = raw.run(n=3, m=3, seed=6, memoize=False)
+
+    # Only the most recent run is kept, so the array only the first run made is gone
+    second = raw.run(n=2, m=3, seed=6, memoize=True)
+    assert all(p.is_file() for p in second)
+    assert not first[2].is_file()
+
+
+def test_raw_memo_only_keeps_the_last_run(config):
+    raw = Raw(config=config)
+    first = [np.load(p) for p in raw.run(n=2, m=3, seed=1, memoize=True)]
+
+    # The second run overwrites the outputs of the first, which is recomputed
+    raw.run(n=2, m=3, seed=2, memoize=True)
+    third = raw.run(n=2, m=3, seed=1, memoize=True)
+    for path, arr in zip(third, first):
+        np.testing.assert_array_equal(np.load(path), arr)
+
+    cache = memo.StepCache(raw)
+    assert len(cache._read_index()) == 1
+    assert len(list(cache.cache_dir.glob("*.csv"))) == 1
+
+
+def test_code_version_covers_the_kernels(monkeypatch):
+    original = memo.code_version()
+    read_bytes = Path.read_bytes
+
+    def edited(path):
+        data = read_bytes(path)
+        return data + b"# edited\n" if path.name == "kernels.py" else data
+
+    # A change to a kernel the steps delegate to changes the fingerprints
+    memo.code_version.cache_clear()
+    monkeypatch.setattr(Path, "read_bytes", edited)
+    try:
+        assert memo.code_version() != original
+    finally:
+        memo.code_version.cache_clear()
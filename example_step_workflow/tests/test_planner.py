@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from dask_jobqueue import SLURMCluster
+from distributed import Client, LocalCluster
+
+from example_step_workflow.utils.planner import (
+    GB,
+    annotate_resources,
+    local_cluster_kwargs,
+    plan_cluster,
+    slurm_cluster_kwargs,
+)
+
+
+def test_local_plan_runs_annotated_tasks():
+    plan = plan_cluster(n=100, m=100, cores=2, memory=4 * GB)
+    assert plan.workers == 2
+    assert plan.threads_per_worker == 1
+    assert plan.task_memory <= plan.worker_resources["MEMORY"]
+    assert plan.task_resources["CPU"] == plan.worker_resources["CPU"] == 1
+    assert plan.notes == []
+
+    with LocalCluster(processes=False, **local_cluster_kwargs(plan)) as cluster, Client(
+        cluster
+    ) as client:
+        assert len(client.scheduler_info()["workers"]) == 2
+        with annotate_resources(plan.task_resources):
+            futures = client.map(abs, range(-4, 0))
+
+        assert client.gather(futures) == [4, 3, 2, 1]
+
+
+def test_local_plan_is_limited_by_memory():
+    # Each inversion of a 10000 x 10000 float64 matrix needs 3.2 GB
+    plan = plan_cluster(n=100, m=10000, cores=8, memory=8 * GB)
+    assert plan.workers == 2
+    assert plan.notes == []
+
+    # Too large for a single worker
+    plan = plan_cluster(n=100, m=20000, cores=8, memory=8 * GB)
+    assert plan.workers == 1
+    assert len(plan.notes) == 1
+
+
+def test_slurm_job_spec(tmp_path):
+    small = plan_cluster(n=10, m=100, distributed=True)
+    assert small.workers == 1
+
+    plan = plan_cluster(n=100000, m=1000, distributed=True, max_jobs=40)
+    assert plan.workers == 40
+    kwargs = slurm_cluster_kwargs(plan, log_dir=tmp_path, local_directory=tmp_path)
+    with SLURMCluster(**kwargs) as cluster:
+        script = cluster.job_script()
+
+    assert "--cpus-per-task=2" in script
+    assert f"--mem={plan.memory_per_worker // GB}G" in script
+    assert f"--resources MEMORY={plan.worker_resources['MEMORY']}" in script
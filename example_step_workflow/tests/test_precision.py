@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from example_step_workflow.steps import Invert, MappedRaw, Raw, Sum
+
+
+def test_float32_is_kept_end_to_end(config):
+    matrices = Raw(config=config).run(n=3, m=4, seed=2, dtype="float32")
+    inversions = Invert(config=config).run(matrices)
+    vectors = Sum(config=config).run(inversions)
+
+    for paths in [matrices, inversions, vectors]:
+        assert all(np.load(path).dtype == np.float32 for path in paths)
+
+
+@pytest.mark.parametrize("step", [Raw, MappedRaw])
+def test_unsupported_dtype_raises(config, step):
+    with pytest.raises(ValueError):
+        step(config=config).run(n=2, m=3, dtype="float16")
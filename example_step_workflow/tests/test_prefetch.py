@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from example_step_workflow.utils.prefetch import prefetch
+
+
+@pytest.mark.parametrize("depth, max_bytes", [(0, None), (3, None), (3, 1)])
+def test_prefetch_keeps_order(tmp_path, depth, max_bytes):
+    paths = []
+    for i in range(10):
+        paths.append(tmp_path / f"vector_{i}.npy")
+        np.save(paths[-1], np.full(4, i))
+
+    loaded = prefetch(paths, depth=depth, max_bytes=max_bytes)
+    assert [(path, int(arr[0])) for path, arr in loaded] == list(zip(paths, range(10)))
+
+
+def test_prefetch_raises_at_failed_item(tmp_path):
+    np.save(tmp_path / "vector_0.npy", np.zeros(4))
+    paths = [tmp_path / "vector_0.npy", tmp_path / "missing.npy"]
+
+    loaded = prefetch(paths, depth=2)
+    next(loaded)
+    with pytest.raises(FileNotFoundError):
+        next(loaded)
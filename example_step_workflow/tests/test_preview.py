@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from distributed import Client, LocalCluster
+
+from example_step_workflow.steps import Invert, MappedInvert, MappedRaw, MappedSum
+from example_step_workflow.steps import Raw, Sum
+from example_step_workflow.utils.preview import PlotPreview
+
+
+def test_preview_grows_axis_without_redrawing(tmp_path):
+    preview = PlotPreview(tmp_path, interval=0)
+    preview.add(np.linspace(0, 3, 10))
+    assert preview.top == 4
+    assert (tmp_path / "plot" / "plots" / "plot.png").is_file()
+    assert (tmp_path / "fancyplot" / "fancyplots" / "plot_fancy.png").is_file()
+
+    # Drawn lines are squeezed into the bottom of the taller axis
+    drawn = preview.lines[..., 3].sum()
+    preview.add(np.linspace(0, 9, 10))
+    assert preview.top == 16
+    assert preview.lines[: len(preview.lines) // 2, :, 3].sum() > 0
+    assert preview.lines[..., 3].sum() > drawn
+    assert preview.n == 2
+
+
+def test_sum_saves_previews(config):
+    matrices = Raw(config=config).run(n=4, m=5, seed=6, memoize=False)
+    cumsum = Sum(config=config)
+    cumsum.run(
+        Invert(config=config).run(matrices, memoize=False),
+        preview_interval=0.0,
+        memoize=False,
+    )
+
+    # The previews stand in for the outputs of the plot steps
+    staging_dir = cumsum.step_local_staging_dir.parent
+    assert (staging_dir / "plot" / "plots" / "plot.png").is_file()
+    assert (staging_dir / "fancyplot" / "fancyplots" / "plot_fancy.png").is_file()
+
+
+def test_mapped_sum_previews_start_from_resumed_items(config, monkeypatch):
+    added = []
+    monkeypatch.setattr(PlotPreview, "add", lambda self, vec: added.append(vec))
+
+    with LocalCluster(n_workers=2, processes=False) as cluster, Client(
+        cluster
+    ) as client:
+        raw = MappedRaw(config=config)
+        invert = MappedInvert(config=config)
+        cumsum = MappedSum(config=config)
+
+        # Leading items first, then the others resuming from them
+        inversions = client.submit(
+            invert.run, client.submit(raw.run, n=2, m=4).result()
+        ).result()
+        client.submit(cumsum.run, inversions, preview_interval=0.0).result()
+        assert len(added) == 2
+
+        added.clear()
+        inversions = client.submit(
+            invert.run, client.submit(raw.run, n=5, m=4, resume=True).result()
+        ).result()
+        vectors = client.submit(
+            cumsum.run, inversions, preview_interval=0.0, resume=True
+        ).result()
+
+    assert len(added) == 5
+    np.testing.assert_array_equal(
+        sorted(vec[-1] for vec in added), sorted(np.load(v)[-1] for v in vectors)
+    )
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from pathlib import Path
+
+import numpy as np
+from distributed import Client, LocalCluster
+
+from example_step_workflow.steps import MappedInvert, MappedRaw, MappedSum
+from example_step_workflow.utils.shm import (
+    SharedHandoff,
+    attach,
+    references,
+    release,
+    retain,
+    share_array,
+    shared_dir,
+)
+
+
+def test_shared_array_is_freed_with_its_last_reference():
+    directory = shared_dir("test")
+    arr = np.arange(12, dtype=np.float32).reshape(3, 4)
+    path = share_array(arr, directory / "matrix_0.npy")
+    other = retain(path)
+    assert references(path) == 2
+
+    # Releasing one reference leaves the array to the other
+    release(path)
+    np.testing.assert_array_equal(attach(other), arr)
+
+    release(other)
+    assert not Path(other).exists()
+    assert not directory.exists()
+
+
+def test_shared_memory_handoff_matches_saved_outputs(config):
+    with LocalCluster(n_workers=2, processes=False) as cluster, Client(
+        cluster
+    ) as client:
+        raw, invert, cumsum = (
+            MappedRaw(config=config),
+            MappedInvert(config=config),
+            MappedSum(config=config),
+        )
+
+        # Each step releases the arrays it consumed
+        matrices = client.submit(raw.run, n=4, m=3, seed=2, shared_memory=True)
+        matrices = matrices.result()
+        assert isinstance(matrices, SharedHandoff)
+        inversions = client.submit(invert.run, matrices, shared_memory=True).result()
+        assert not any(Path(path).exists() for path in matrices.paths)
+        vectors = client.submit(cumsum.run, inversions).result()
+        assert not any(Path(path).exists() for path in inversions.paths)
+
+        for i, vector in enumerate(vectors):
+            mat = MappedRaw._generate(i, 3, 2, "float64")
+            expected = np.cumsum(np.sort(np.amax(np.linalg.inv(mat), 0)))
+            np.testing.assert_array_equal(np.load(vector), expected)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from distributed import Client, LocalCluster
+
+from example_step_workflow.utils.speculate import map_completed
+
+_seen = set()
+_lock = threading.Lock()
+
+
+def _straggle_once(i: int) -> int:
+    # The first attempt at item 0 hangs, as if its node were overloaded
+    with _lock:
+        first = i not in _seen
+        _seen.add(i)
+
+    time.sleep(5 if i == 0 and first else 0.05)
+    return i
+
+
+def test_duplicate_of_straggler_finishes_first():
+    with LocalCluster(
+        n_workers=2, threads_per_worker=1, processes=False
+    ) as cluster, Client(cluster) as client:
+        start = time.monotonic()
+        results = list(
+            map_completed(
+                client, _straggle_once, range(8), speculate=2.0, interval=0.05
+            )
+        )
+
+        assert sorted(results) == list(range(8))
+        assert time.monotonic() - start < 4
+
+
+def test_intervals_without_completions_keep_waiting():
+    with LocalCluster(
+        n_workers=1, threads_per_worker=2, processes=False
+    ) as cluster, Client(cluster) as client:
+        # Every item outlasts many intervals, nothing finishes in most of them
+        results = map_completed(
+            client, time.sleep, [0.5, 0.5, 0.5], speculate=2.0, interval=0.01
+        )
+        assert list(results) == [None, None, None]
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from example_step_workflow.utils.stack import load_stack
+
+
+@pytest.fixture
+def vectors(tmp_path):
+    paths = []
+    for i, vec in enumerate(np.random.default_rng(0).random((5, 4))):
+        paths.append(tmp_path / f"vector_{i}.npy")
+        np.save(paths[-1], vec)
+
+    return paths
+
+
+@pytest.mark.parametrize("mmap_min_bytes", [0, 1024 * 1024])
+def test_load_stack_reuses_cached_matrix(tmp_path, vectors, mmap_min_bytes):
+    expected = np.stack([np.load(vector) for vector in vectors])
+    cache_dir = tmp_path / "stacks"
+
+    first = load_stack(vectors, cache_dir=cache_dir, mmap_min_bytes=mmap_min_bytes)
+    np.testing.assert_array_equal(first, expected)
+    assert isinstance(first, np.memmap) == (mmap_min_bytes == 0)
+
+    # The second load maps the stored matrix instead of reading the vectors
+    second = load_stack(vectors, cache_dir=cache_dir, mmap_min_bytes=mmap_min_bytes)
+    assert isinstance(second, np.memmap)
+    np.testing.assert_array_equal(second, expected)
+    assert len(list(cache_dir.glob("*.npy"))) == 1
+
+
+def test_load_stack_rejects_mismatched_vector(tmp_path, vectors):
+    np.save(vectors[3], np.zeros(5))
+    with pytest.raises(ValueError):
+        load_stack(vectors, cache_dir=tmp_path / "stacks")
+
+    # Nothing is cached for a failed load
+    assert list((tmp_path / "stacks").glob("*")) == []
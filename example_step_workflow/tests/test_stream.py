@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+from distributed import Client, LocalCluster
+
+from example_step_workflow.utils.kernels import invert_matrix, sum_matrix
+from example_step_workflow.utils.stream import (
+    DirectoryWatcher,
+    Stream,
+    StreamDirs,
+    batch_sizes,
+)
+
+
+def test_batch_sizes():
+    # Single items while there are free threads, coalesced under load
+    assert batch_sizes(3, 4, 16) == [1, 1, 1]
+    assert batch_sizes(10, 4, 16) == [3, 3, 3, 1]
+    assert batch_sizes(100, 2, 16) == [16, 16]
+    assert batch_sizes(5, 0, 16) == []
+
+
+def test_stream_from_directory(tmp_path):
+    input_dir = tmp_path / "incoming"
+    input_dir.mkdir()
+    dirs = StreamDirs(tmp_path / "raw", tmp_path / "inverted", tmp_path / "sum")
+    manifests = {
+        "raw": tmp_path / "raw.csv",
+        "inverted": tmp_path / "inverted.csv",
+        "summed": tmp_path / "summed.csv",
+    }
+    rng = np.random.default_rng(0)
+    matrices = {f"a{i}.npy": rng.random((4, 4)) for i in range(5)}
+    matrices["singular.npy"] = np.zeros((4, 4))
+    for name, mat in matrices.items():
+        np.save(input_dir / name, mat)
+
+    with LocalCluster(n_workers=2, processes=False) as cluster, Client(
+        cluster
+    ) as client:
+        stream = Stream(
+            client,
+            DirectoryWatcher(input_dir),
+            dirs,
+            manifests,
+            quarantine_path=tmp_path / "quarantine.csv",
+            poll_interval=0.1,
+        )
+        stats = stream.run(max_items=6)
+        assert stats.processed == 5
+        assert stats.failed == 1
+        assert pd.read_csv(tmp_path / "quarantine.csv")["source"][0].endswith(
+            "singular.npy"
+        )
+
+        # Every output is listed, with the source it came from
+        raw = pd.read_csv(manifests["raw"])
+        summed = pd.read_csv(manifests["summed"])
+        assert len(raw) == len(summed) == len(pd.read_csv(manifests["inverted"])) == 5
+        for source, vector in zip(raw["source"], summed["filepath"]):
+            expected = sum_matrix(invert_matrix(np.load(source)))
+            np.testing.assert_array_equal(np.load(vector), expected)
+
+        # Restarting only processes the new arrivals, numbered after the prior ones,
+        # and retries the quarantined ones
+        np.save(input_dir / "b.npy", rng.random((4, 4)))
+        stream = Stream(
+            client,
+            DirectoryWatcher(input_dir, seen=raw["source"]),
+            dirs,
+            manifests,
+            next_index=6,
+            poll_interval=0.1,
+        )
+        stats = stream.run(idle_timeout=1.0)
+        assert (stats.processed, stats.failed) == (1, 1)
+
+    raw = pd.read_csv(manifests["raw"])
+    assert len(raw) == 6
+    assert raw["filepath"].iloc[-1].endswith("matrix_7.npy")
+
+
+def test_items_outlasting_a_poll_interval(tmp_path):
+    input_dir = tmp_path / "incoming"
+    input_dir.mkdir()
+    dirs = StreamDirs(tmp_path / "raw", tmp_path / "inverted", tmp_path / "sum")
+    manifests = {key: tmp_path / f"{key}.csv" for key in ["raw", "inverted", "summed"]}
+    rng = np.random.default_rng(0)
+    for i in range(2):
+        np.save(input_dir / f"a{i}.npy", rng.random((400, 400)))
+
+    # Waits time out between polls while the items are processed
+    with LocalCluster(n_workers=1, processes=False) as cluster, Client(
+        cluster
+    ) as client:
+        stream = Stream(
+            client,
+            DirectoryWatcher(input_dir),
+            dirs,
+            manifests,
+            poll_interval=0.001,
+        )
+        stats = stream.run(max_items=2)
+
+    assert (stats.processed, stats.failed) == (2, 0)
+    assert len(pd.read_csv(manifests["summed"])) == 2
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from distributed import Client, LocalCluster
+
+from example_step_workflow.steps import Invert, MappedInvert, MappedRaw, MappedSum
+from example_step_workflow.steps import Plot, Raw, Sum
+from example_step_workflow.utils.summary import VectorSummary, merge_summaries
+
+
+def test_summary_merges_moments_exactly_and_approximates_quantiles():
+    rng = np.random.default_rng(0)
+    data = np.cumsum(rng.lognormal(size=(3000, 6)), axis=1)
+
+    # Stream some vectors one at a time, add the rest in chunks, then merge
+    streamed = VectorSummary(6, bins=256, chunk_size=100)
+    for vec in data[:1000]:
+        streamed.append(vec)
+    chunked = VectorSummary(6, bins=256)
+    for chunk in np.array_split(data[1000:], 5):
+        chunked.add(chunk)
+    summary = merge_summaries(chunked, streamed)
+
+    assert summary.n == 3000
+    np.testing.assert_array_equal(summary.min, data.min(axis=0))
+    np.testing.assert_array_equal(summary.max, data.max(axis=0))
+    np.testing.assert_allclose(summary.mean, data.mean(axis=0))
+    np.testing.assert_allclose(summary.var, data.var(axis=0, ddof=1))
+
+    q = [0.05, 0.5, 0.95]
+    np.testing.assert_allclose(
+        summary.quantile(q), np.quantile(data, q, axis=0), rtol=0.05
+    )
+
+
+def test_sum_summary_and_envelope_plot(config):
+    matrices = Raw(config=config).run(n=6, m=5, seed=5, memoize=False)
+    cumsum = Sum(config=config)
+    vectors = cumsum.run(
+        Invert(config=config).run(matrices, memoize=False), summarize=True
+    )
+
+    summary, _ = VectorSummary.load(cumsum.step_local_staging_dir / "summary.npz")
+    data = np.stack([np.load(vector) for vector in vectors])
+    assert summary.n == 6
+    np.testing.assert_allclose(summary.mean, data.mean(axis=0))
+
+    plot = Plot(config=config).run(mode="envelope", memoize=False)
+    assert plot.is_file()
+
+
+def test_mapped_sum_summary_is_merged_on_workers(config):
+    with LocalCluster(n_workers=2, processes=False) as cluster, Client(
+        cluster
+    ) as client:
+        cumsum = MappedSum(config=config)
+        matrices = client.submit(
+            MappedRaw(config=config).run, n=5, m=4, seed=3
+        ).result()
+        inversions = client.submit(MappedInvert(config=config).run, matrices).result()
+        vectors = client.submit(
+            cumsum.run, inversions, summarize=True, memoize=False
+        ).result()
+
+        summary, _ = VectorSummary.load(cumsum.step_local_staging_dir / "summary.npz")
+        data = np.stack([np.load(vector) for vector in vectors])
+        assert summary.n == 5
+        np.testing.assert_array_equal(summary.max, data.max(axis=0))
+
+
+def test_mapped_sum_summarizes_vectors_as_they_complete(config, monkeypatch):
+    # Record the vectors read back to be summarized
+    read = []
+    summarize = MappedSum._summarize
+
+    def recording_summarize(client, summarize_files, vectors, bins):
+        read.extend(vectors)
+        return summarize(client, summarize_files, vectors, bins)
+
+    monkeypatch.setattr(MappedSum, "_summarize", staticmethod(recording_summarize))
+
+    with LocalCluster(n_workers=2, processes=False) as cluster, Client(
+        cluster
+    ) as client:
+        cumsum = MappedSum(config=config)
+        summary_path = cumsum.step_local_staging_dir / "summary.npz"
+        matrices = client.submit(
+            MappedRaw(config=config).run, n=5, m=4, seed=3
+        ).result()
+        inversions = client.submit(MappedInvert(config=config).run, matrices).result()
+        vectors = client.submit(
+            cumsum.run, inversions, summarize=True, memoize=False
+        ).result()
+        data = np.stack([np.load(vector) for vector in vectors])
+
+        assert read == []
+        summary, _ = VectorSummary.load(summary_path)
+        assert summary.n == 5
+        np.testing.assert_allclose(summary.mean, data.mean(axis=0))
+
+        # Only the vectors of resumed items are read back
+        client.submit(
+            cumsum.run, inversions, summarize=True, resume=True, memoize=False
+        ).result()
+        assert sorted(map(str, read)) == sorted(map(str, vectors))
+        assert VectorSummary.load(summary_path)[0].n == 5
+
+        # Handed off vectors are summarized as they complete too
+        read.clear()
+        handoff = client.submit(
+            MappedInvert(config=config).run, matrices, in_memory=True
+        ).result()
+        client.submit(cumsum.run, handoff, summarize=True).result()
+        assert read == []
+        np.testing.assert_allclose(
+            VectorSummary.load(summary_path)[0].mean, data.mean(axis=0)
+        )
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from distributed import Client, LocalCluster
+
+from example_step_workflow.steps import MappedInvert, MappedRaw, MappedSum
+from example_step_workflow.utils.aggregate import load_block
+from example_step_workflow.utils.summary import VectorSummary
+from example_step_workflow.utils.sweep import (
+    expand_grid,
+    first_items,
+    group_configs,
+    group_size,
+    sweep_workload,
+)
+
+DEFAULTS = {"n": 100, "m": 100, "seed": 1, "dtype": "float64", "plot_mode": "lines"}
+
+
+def test_configurations_differing_by_n_or_downstream_share_their_group():
+    configs = expand_grid(
+        {
+            "n": [10, 20, 10],
+            "seed": [1, 2],
+            "dtype": "float32",
+            "plot_mode": ["lines", "density"],
+        },
+        DEFAULTS,
+    )
+
+    # Repeated values are a single configuration
+    assert len(configs) == 8
+    groups = group_configs(configs)
+    assert list(groups) == [
+        "m=100_seed=1_dtype=float32",
+        "m=100_seed=2_dtype=float32",
+    ]
+    assert [len(members) for members in groups.values()] == [4, 4]
+    assert [config.subset for config in groups["m=100_seed=1_dtype=float32"]] == [
+        "n=10_m=100_seed=1_dtype=float32",
+        "n=10_m=100_seed=1_dtype=float32",
+        "n=20_m=100_seed=1_dtype=float32",
+        "n=20_m=100_seed=1_dtype=float32",
+    ]
+
+    # Only the matrices of the largest n of every group are generated
+    assert [group_size(members) for members in groups.values()] == [20, 20]
+    assert sweep_workload(configs) == {"n": 40, "m": 100, "dtype": "float32"}
+
+    with pytest.raises(ValueError):
+        expand_grid({"blas_threads": [1, 2]}, DEFAULTS)
+
+
+def test_mapped_sum_summarizes_and_aggregates_the_first_items(config):
+    with LocalCluster(n_workers=2, processes=False) as cluster, Client(
+        cluster
+    ) as client:
+        cumsum = MappedSum(config=config)
+        matrices = client.submit(
+            MappedRaw(config=config).run, n=6, m=4, seed=3
+        ).result()
+        inversions = client.submit(MappedInvert(config=config).run, matrices).result()
+        vectors = client.submit(
+            cumsum.run,
+            inversions,
+            summarize=True,
+            aggregate=True,
+            subsets=[2],
+            memoize=False,
+        ).result()
+
+    # The matrices of the first items don't depend on n
+    subset = first_items(vectors, 2)
+    assert [path.name for path in subset] == ["matrix_0.npy", "matrix_1.npy"]
+    np.testing.assert_array_equal(
+        np.load(matrices[1]), MappedRaw._generate(1, 4, 3, "float64")
+    )
+
+    summary, _ = VectorSummary.load(cumsum.step_local_staging_dir / "summary_2.npz")
+    data = np.stack([np.load(vector) for vector in subset])
+    assert summary.n == 2
+    np.testing.assert_array_equal(summary.max, data.max(axis=0))
+    assert VectorSummary.load(cumsum.step_local_staging_dir / "summary.npz")[0].n == 6
+
+    block = load_block(cumsum.step_local_staging_dir / "aggregate_2", subset)
+    assert sorted(block.indices) == [0, 1]
+    assert load_block(cumsum.step_local_staging_dir / "aggregate", vectors) is not None
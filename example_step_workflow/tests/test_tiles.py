@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+
+import matplotlib.image
+import numpy as np
+from distributed import Client, LocalCluster
+
+from example_step_workflow.steps.fancyplot.plot_utils import fancy_plot
+from example_step_workflow.utils.plotting import line_plot
+from example_step_workflow.utils.tiles import over
+
+
+def _pixels(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    buffer.seek(0)
+    return matplotlib.image.imread(buffer)
+
+
+def _differing(fig, other):
+    # The fraction of pixels visibly differing
+    return np.mean(np.abs(_pixels(fig) - _pixels(other)).max(axis=-1) > 0.1)
+
+
+def test_over_matches_drawing_in_order():
+    rng = np.random.default_rng(0)
+    layers = rng.random((3, 4, 5, 4))
+
+    # Draw each layer over an opaque background in turn
+    expected = np.ones((4, 5, 3))
+    for layer in layers:
+        expected = layer[..., :3] * layer[..., 3:] + (1 - layer[..., 3:]) * expected
+
+    rgba = over([np.ones((4, 5, 4)), *layers])
+    np.testing.assert_allclose(rgba[..., :3], expected)
+    np.testing.assert_allclose(rgba[..., 3], 1)
+
+
+def test_tiled_line_plot_matches_serial():
+    rng = np.random.default_rng(1)
+    plot_matrix = np.cumsum(rng.lognormal(size=(200, 20)), axis=1)
+
+    tiled = line_plot(plot_matrix, tile_size=64, processes=2)
+    assert _differing(line_plot(plot_matrix), tiled) < 0.001
+
+
+def test_tiled_fancy_plot_on_workers_matches_serial():
+    rng = np.random.default_rng(2)
+    plot_matrix = np.cumsum(rng.lognormal(size=(200, 20)), axis=1)
+
+    with LocalCluster(n_workers=2, processes=False) as cluster, Client(
+        cluster
+    ) as client:
+        tiled = client.submit(fancy_plot, plot_matrix, tile_size=64).result()
+
+    assert _differing(fancy_plot(plot_matrix), tiled) < 0.001
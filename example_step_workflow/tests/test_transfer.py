@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+from pathlib import Path
+from types import SimpleNamespace
+
+import pandas as pd
+import quilt3
+
+from example_step_workflow.utils.transfer import (
+    LocalStore,
+    QuiltStore,
+    TransferEngine,
+    batch_files,
+    chunked_checksum,
+)
+
+
+def _fake_step(root: Path, name: str, n: int):
+    # The parts of a step the transfer engine relies on
+    step_dir = root / name
+    (step_dir / "vectors").mkdir(parents=True)
+    paths = []
+    for i in range(n):
+        path = step_dir / "vectors" / f"{i}.npy"
+        path.write_bytes(bytes([i]) * 100)
+        paths.append(str(path))
+
+    manifest = pd.DataFrame({"filepath": paths})
+    manifest.to_csv(step_dir / "manifest.csv", index=False)
+    return SimpleNamespace(
+        step_name=name,
+        step_local_staging_dir=step_dir,
+        manifest=manifest,
+        filepath_columns=["filepath"],
+        metadata_columns=[],
+        _quilt_package_name="project",
+        _get_git_origin_url=lambda: "https://github.com/owner/project.git",
+        _get_current_git_branch=lambda: "master",
+        _get_current_git_commit_hash=lambda: "0" * 40,
+    )
+
+
+def test_batch_files():
+    batches = batch_files({"a": 10, "b": 10, "c": 10, "d": 100}, batch_bytes=25)
+    assert batches == [["a", "b"], ["c"], ["d"]]
+    assert batch_files({str(i): 0 for i in range(5)}, max_files=2) == [
+        ["0", "1"],
+        ["2", "3"],
+        ["4"],
+    ]
+
+
+def test_push_and_checkout_are_incremental(tmp_path):
+    store = LocalStore(tmp_path / "store")
+    engine = TransferEngine(store, max_workers=2, batch_bytes=250)
+    steps = [_fake_step(tmp_path / "a", "raw", 4), _fake_step(tmp_path / "a", "sum", 2)]
+
+    # Small files are pushed in batches, the manifests and READMEs are larger
+    stats = engine.push(steps, "master")
+    assert [s.transferred for s in stats] == [7, 5]
+    assert all(s.batches < s.transferred for s in stats)
+
+    # Nothing changed, nothing is uploaded
+    stats = engine.push(steps, "master")
+    assert [s.transferred for s in stats] == [0, 0]
+    assert [s.skipped for s in stats] == [7, 5]
+
+    # Only the changed file is uploaded
+    (steps[0].step_local_staging_dir / "vectors" / "2.npy").write_bytes(b"x" * 100)
+    stats = engine.push(steps, "master")
+    assert [s.transferred for s in stats] == [1, 0]
+
+    # A fresh copy is fully fetched, falling back to master, then only what changed
+    others = [
+        _fake_step(tmp_path / "b", "raw", 4),
+        _fake_step(tmp_path / "b", "sum", 2),
+    ]
+    stats = engine.checkout(others, "feature")
+    assert [s.package for s in stats] == ["master/raw", "master/sum"]
+    assert [s.transferred for s in stats] == [4, 3]
+    assert [s.skipped for s in stats] == [3, 2]
+    for step, other in zip(steps, others):
+        for path in step.manifest["filepath"]:
+            path = Path(path)
+            relative = path.relative_to(step.step_local_staging_dir)
+            assert (other.step_local_staging_dir / relative).read_bytes() == (
+                path.read_bytes()
+            )
+
+    stats = engine.checkout(others, "master")
+    assert [s.transferred for s in stats] == [0, 0]
+
+
+def _quilt_registry(tmp_path: Path, monkeypatch) -> str:
+    registry = (tmp_path / "registry").as_uri()
+
+    def push(self, name, registry=None, message=None, selector_fn=None):
+        # Quilt only pushes to S3, copy the files and build in a local registry
+        remote = quilt3.Package()
+        for logical_key, entry in self.walk():
+            path = tmp_path / "bucket" / logical_key
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(entry.get_bytes())
+            remote.set(logical_key, path)
+
+        remote.build(name, registry=registry, message=message)
+        return quilt3.Package.browse(name, registry)
+
+    monkeypatch.setattr(quilt3.Package, "push", push)
+    return registry
+
+
+def test_chunked_checksum_matches_quilt(tmp_path):
+    # Just over one 8 MiB part
+    path = tmp_path / "large.bin"
+    path.write_bytes(bytes(range(256)) * (33 * 1024))
+    package = quilt3.Package().set("large.bin", path)
+    package.build("owner/large", registry=(tmp_path / "registry").as_uri())
+    assert package["large.bin"].hash == {
+        "type": "sha2-256-chunked",
+        "value": chunked_checksum(path),
+    }
+
+
+def test_quilt_store_push_and_checkout_are_incremental(tmp_path, monkeypatch):
+    registry = _quilt_registry(tmp_path, monkeypatch)
+    engine = TransferEngine(QuiltStore("owner/project", registry))
+    steps = [_fake_step(tmp_path / "a", "raw", 4)]
+    assert [s.transferred for s in engine.push(steps, "master")] == [7]
+
+    # Nothing changed, nothing is uploaded
+    stats = engine.push(steps, "master")
+    assert [(s.transferred, s.skipped) for s in stats] == [(0, 7)]
+
+    # A fresh copy falls back to master and only fetches what differs from it
+    engine = TransferEngine(QuiltStore("owner/project", registry))
+    others = [_fake_step(tmp_path / "b", "raw", 4)]
+    stats = engine.checkout(others, "feature")
+    assert [(s.package, s.transferred, s.skipped) for s in stats] == [
+        ("master/raw", 3, 4)
+    ]
+    assert (others[0].step_local_staging_dir / "manifest.parquet").is_file()
+    stats = engine.checkout(others, "master")
+    assert [s.transferred for s in stats] == [0]
+
+
+def test_quilt_store_keeps_the_step_push_layout(tmp_path, monkeypatch):
+    registry = _quilt_registry(tmp_path, monkeypatch)
+    engine = TransferEngine(QuiltStore("owner/project", registry))
+    steps = [_fake_step(tmp_path / "a", "raw", 2), _fake_step(tmp_path / "a", "sum", 1)]
+    engine.push(steps, "master")
+
+    # Pushing a step again keeps the manifest and README of every step
+    engine.push(steps[:1], "master")
+    project = quilt3.Package.browse("owner/project", registry)
+    for step in steps:
+        package = project[f"master/{step.step_name}"]
+        vectors = [f"vectors/{i}.npy" for i in range(len(step.manifest))]
+        assert sorted(key for key, _ in package.walk()) == [
+            "README.md",
+            "manifest.csv",
+            "manifest.parquet",
+            *vectors,
+        ]
+
+        # As with `Step.push` the manifest a checkout reads is relative to the step
+        manifest = pd.read_parquet(io.BytesIO(package["manifest.parquet"].get_bytes()))
+        assert manifest["filepath"].tolist() == vectors
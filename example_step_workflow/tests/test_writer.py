@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from example_step_workflow.utils.writer import (
+    AsyncWriter,
+    flush_process_writer,
+    process_writer,
+)
+
+
+@pytest.mark.parametrize("max_bytes", [0, 1, 1024 * 1024])
+def test_writer_flushes_all_outputs(tmp_path, max_bytes):
+    with AsyncWriter(max_bytes=max_bytes, max_workers=2) as writer:
+        for i in range(10):
+            nbytes, _ = writer.save(tmp_path / "out" / f"vector_{i}.npy", np.full(8, i))
+
+    for i in range(10):
+        path = tmp_path / "out" / f"vector_{i}.npy"
+        assert path.stat().st_size == nbytes
+        np.testing.assert_array_equal(np.load(path), np.full(8, i))
+
+
+def test_writer_surfaces_errors(tmp_path):
+    (tmp_path / "not_a_dir").write_text("")
+
+    writer = AsyncWriter()
+    writer.save(tmp_path / "not_a_dir" / "vector_0.npy", np.zeros(8))
+    with pytest.raises(OSError):
+        writer.close()
+
+
+def test_process_writers_keep_their_owner_errors_and_budget(tmp_path):
+    (tmp_path / "not_a_dir").write_text("")
+    failing = tmp_path / "not_a_dir"
+    working = tmp_path / "out"
+
+    process_writer(failing, max_bytes=1024).save(failing / "vector_0.npy", np.zeros(8))
+    writer = process_writer(working, max_bytes=2048)
+    assert writer.max_bytes == 2048
+    assert process_writer(failing).max_bytes == 1024
+
+    # The error of the other owner neither surfaces here nor is swallowed
+    writer.save(working / "vector_0.npy", np.zeros(8))
+    flush_process_writer(working)
+    assert (working / "vector_0.npy").exists()
+
+    with pytest.raises(OSError):
+        flush_process_writer(failing)
+
+    # Flushing drops the writer of the owner
+    assert process_writer(working, max_bytes=1) is not writer
+    flush_process_writer(working)
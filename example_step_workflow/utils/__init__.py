@@ -0,0 +1,3 @@
+# -*- coding: utf-8 -*-
+
+"""Shared utilities used by the steps of example_step_workflow."""
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import logging
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Union
+
+import numpy as np
+
+from .array_io import save_array, write_bytes_atomic
+from .stack import _stack_key
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+class VectorBlock(NamedTuple):
+    """
+    Stacked vectors sorted by their last value, the order the fancy plot draws them
+    in, along with what the plots need of them.
+
+    Attributes
+    ----------
+    indices: np.ndarray
+        The row of every vector in the manifest.
+    keys: np.ndarray
+        The last value of every vector, ascending.
+    maxima: np.ndarray
+        The maximum of every vector.
+    vectors: np.ndarray
+        The vectors, one per row, in the order of the keys.
+    """
+
+    indices: np.ndarray
+    keys: np.ndarray
+    maxima: np.ndarray
+    vectors: np.ndarray
+
+
+def block_from_arrays(vectors: List[np.ndarray], indices: List[int]) -> VectorBlock:
+    """
+    Stack and sort in-memory vectors, intended to run on a worker.
+    """
+    stacked = np.stack(vectors)
+    order = np.argsort(stacked[:, -1], kind="stable")
+    stacked = stacked[order]
+    return VectorBlock(
+        indices=np.asarray(indices)[order],
+        keys=stacked[:, -1].copy(),
+        maxima=np.amax(stacked, axis=1),
+        vectors=stacked,
+    )
+
+
+def block_from_files(paths: List[Union[str, Path]], indices: List[int]) -> VectorBlock:
+    """
+    Stack and sort serialized vectors, intended to run on a worker.
+    """
+    return block_from_arrays([np.load(path) for path in paths], indices)
+
+
+def merge_blocks(*blocks: VectorBlock) -> VectorBlock:
+    """
+    Merge sorted blocks into one. Vectors with the same last value keep the order of
+    the blocks, so merging blocks of consecutive vectors in order is stable.
+    """
+    keys = np.concatenate([block.keys for block in blocks])
+    order = np.argsort(keys, kind="stable")
+    return VectorBlock(
+        indices=np.concatenate([block.indices for block in blocks])[order],
+        keys=keys[order],
+        maxima=np.concatenate([block.maxima for block in blocks])[order],
+        vectors=np.concatenate([block.vectors for block in blocks])[order],
+    )
+
+
+def save_block(block: VectorBlock, save_dir: Union[str, Path], key: str) -> Path:
+    """
+    Atomically store a block to a directory: the vectors to vectors.npy, so they can
+    be memory-mapped, and the rest to index.npz along with the key of the vectors it
+    was built from, see `load_block`. Intended to run on the worker holding it.
+    """
+    # Readers never pair the index of a prior block with these vectors
+    save_dir = Path(save_dir)
+    if (save_dir / "index.npz").exists():
+        (save_dir / "index.npz").unlink()
+
+    save_array(save_dir / "vectors.npy", block.vectors)
+
+    buffer = io.BytesIO()
+    np.savez(
+        buffer, indices=block.indices, keys=block.keys, maxima=block.maxima, key=key
+    )
+    write_bytes_atomic(save_dir / "index.npz", buffer.getvalue())
+    return save_dir
+
+
+def aggregate_key(vectors: List[Union[str, Path]]) -> str:
+    """
+    Identify a list of serialized vectors by the signature of every file, as the
+    stacks of `load_stack` are.
+    """
+    return _stack_key(vectors)
+
+
+def load_block(
+    save_dir: Union[str, Path], vectors: List[Union[str, Path]]
+) -> Optional[VectorBlock]:
+    """
+    Read a block stored with `save_block`, with its vectors memory-mapped, if it was
+    built from exactly these unchanged vectors.
+    """
+    save_dir = Path(save_dir)
+    if not (save_dir / "index.npz").is_file():
+        return None
+
+    with np.load(save_dir / "index.npz") as data:
+        if str(data["key"]) != aggregate_key(vectors):
+            log.info(f"Aggregate of other vectors, ignoring: {save_dir}")
+            return None
+
+        indices, keys, maxima = data["indices"], data["keys"], data["maxima"]
+
+    return VectorBlock(
+        indices=indices,
+        keys=keys,
+        maxima=maxima,
+        vectors=np.load(save_dir / "vectors.npy", mmap_mode="r"),
+    )
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import io
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+def serialize_array(arr: np.ndarray) -> bytes:
+    """
+    Serialize an array to the bytes of a `.npy` file.
+
+    Parameters
+    ----------
+    arr: np.ndarray
+        The array to serialize.
+
+    Returns
+    -------
+    data: bytes
+        The exact bytes `np.save` would write to disk.
+    """
+    buffer = io.BytesIO()
+    np.save(buffer, arr)
+    return buffer.getvalue()
+
+
+def checksum_bytes(data: bytes) -> str:
+    """
+    Compute the checksum used to track step outputs.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def checksum_file(path: Path) -> str:
+    """
+    Compute the checksum of a file on disk, see `checksum_bytes`.
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as read_in:
+        for block in iter(lambda: read_in.read(1 << 20), b""):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
+def write_bytes_atomic(save_path: Path, data: bytes):
+    """
+    Write bytes to a path so that readers only ever see the complete file.
+
+    The data is written to a uniquely named temporary file next to the target and
+    then renamed over the target. This makes the write idempotent: multiple writers of
+    the same content can race without ever leaving a partial file behind.
+    """
+    save_path = Path(save_path)
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = save_path.with_name(f".{save_path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(tmp_path, "wb") as write_out:
+            write_out.write(data)
+
+        os.replace(tmp_path, save_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def save_array(save_path: Path, arr: np.ndarray) -> Tuple[int, str]:
+    """
+    Atomically save an array to a `.npy` file and return its size and checksum.
+
+    Parameters
+    ----------
+    save_path: Path
+        Where to store the array. Parent directories are created as needed.
+    arr: np.ndarray
+        The array to store.
+
+    Returns
+    -------
+    nbytes: int
+        The size of the written file in bytes.
+    checksum: str
+        The checksum of the written file.
+    """
+    data = serialize_array(arr)
+    write_bytes_atomic(save_path, data)
+
+    return len(data), checksum_bytes(data)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import math
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+from distributed import WorkerPlugin
+from threadpoolctl import threadpool_limits
+
+from .array_io import write_bytes_atomic
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+class BlasLayout(NamedTuple):
+    """
+    How to split the cores of a host between BLAS threads and parallel tasks.
+
+    Attributes
+    ----------
+    threads: int
+        The BLAS threads of every task.
+    tasks: int
+        The number of tasks running at once, `cores // threads`.
+    items_per_second: float
+        The measured throughput of inversions with this split.
+    """
+
+    threads: int
+    tasks: int
+    items_per_second: float
+
+
+def blas_splits(cores: int) -> List[Tuple[int, int]]:
+    """
+    The (BLAS threads, tasks) splits of the cores to benchmark: every power of two of
+    threads up to the number of cores, and all the cores in a single task.
+    """
+    threads = {2**k for k in range(int(math.log2(max(cores, 1))) + 1)} | {cores}
+    return [(t, cores // t) for t in sorted(threads)]
+
+
+def benchmark_split(
+    m: int, dtype: str, threads: int, tasks: int, repeats: int
+) -> float:
+    """
+    Measure the throughput of `tasks` threads inverting (m, m) matrices at once with
+    `threads` BLAS threads each, in inversions per second.
+
+    Tasks run in threads of this process, as in a Dask worker, LAPACK releases the
+    GIL. The BLAS thread limit applies to the whole process while measuring.
+    """
+    mat = np.random.default_rng(0).random((m, m)).astype(dtype)
+
+    def invert_repeatedly(_):
+        for _ in range(repeats):
+            np.linalg.inv(mat)
+
+    with threadpool_limits(threads), ThreadPoolExecutor(tasks) as pool:
+        np.linalg.inv(mat)
+        start = time.perf_counter()
+        list(pool.map(invert_repeatedly, range(tasks)))
+        wall = time.perf_counter() - start
+
+    return tasks * repeats / max(wall, 1e-9)
+
+
+def _cache_key(m: int, dtype: str, cores: int) -> str:
+    return f"{socket.gethostname()}/{cores}/{m}/{np.dtype(dtype).name}"
+
+
+def tune_blas(
+    m: int,
+    dtype: str = "float64",
+    cores: Optional[int] = None,
+    cache_path: Optional[Union[str, Path]] = None,
+    seconds: float = 0.5,
+) -> BlasLayout:
+    """
+    Find the fastest split of the cores of this host between BLAS threads and
+    parallel tasks for inverting (m, m) matrices.
+
+    Small matrices invert fastest with one single-threaded task per core, large ones
+    with fewer tasks using several BLAS threads each. Every split from
+    `blas_splits` is benchmarked, and the decision is cached per host, cores, m and
+    dtype.
+
+    Parameters
+    ----------
+    m: int
+        The squared shape of the matrices.
+    dtype: str
+        The floating point precision of the matrices.
+        Default: "float64"
+    cores: Optional[int]
+        The cores to split.
+        Default: None (The cores available to this process)
+    cache_path: Optional[Union[str, Path]]
+        A json file of prior decisions to reuse and add to.
+        Default: None (Always benchmark)
+    seconds: float
+        The approximate duration of the benchmark of every split.
+        Default: 0.5
+
+    Returns
+    -------
+    layout: BlasLayout
+        The fastest split.
+    """
+    cores = cores or len(os.sched_getaffinity(0))
+    key = _cache_key(m, dtype, cores)
+
+    cache: Dict[str, Dict] = {}
+    if cache_path is not None and Path(cache_path).exists():
+        with open(cache_path) as read_in:
+            cache = json.load(read_in)
+
+        if key in cache:
+            return BlasLayout(**cache[key])
+
+    # Time a single inversion to size the benchmark of every split
+    single = benchmark_split(m, dtype, 1, 1, 1)
+    repeats = int(min(max(seconds * single, 1), 1000))
+
+    layouts = []
+    for threads, tasks in blas_splits(cores):
+        items_per_second = benchmark_split(m, dtype, threads, tasks, repeats)
+        log.debug(
+            f"BLAS split of {threads} thread(s) x {tasks} task(s): "
+            f"{items_per_second:.1f} inversions/s"
+        )
+        layouts.append(BlasLayout(threads, tasks, items_per_second))
+
+    layout = max(layouts, key=lambda layout: layout.items_per_second)
+    log.info(
+        f"Inverting ({m}, {m}) matrices on {cores} core(s) is fastest with "
+        f"{layout.threads} BLAS thread(s) x {layout.tasks} task(s)"
+    )
+
+    # Other hosts may have added to the cache meanwhile
+    if cache_path is not None:
+        if Path(cache_path).exists():
+            with open(cache_path) as read_in:
+                cache = json.load(read_in)
+
+        cache[key] = layout._asdict()
+        write_bytes_atomic(Path(cache_path), json.dumps(cache, indent=4).encode())
+
+    return layout
+
+
+class BlasThreads(WorkerPlugin):
+    """
+    Limit the BLAS threads of every worker of a cluster, including the ones that
+    join later on, see `tune_blas`.
+
+    Parameters
+    ----------
+    threads: int
+        The BLAS threads of every worker process.
+    """
+
+    name = "blas-threads"
+
+    def __init__(self, threads: int):
+        self.threads = threads
+
+    def setup(self, worker):
+        threadpool_limits(self.threads)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+from typing import List, NamedTuple, Sequence, TypeVar
+
+from .planner import ClusterPlan, StepEstimate, estimate_steps, format_plan
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+T = TypeVar("T")
+
+
+def subsample(items: Sequence[T], k: int) -> List[T]:
+    """
+    A deterministic, stratified subsample of k items: the items are split into k
+    strata of consecutive items and the middle item of each is kept, so the sample
+    spans the whole manifest rather than its start.
+    """
+    if k >= len(items):
+        return list(items)
+
+    return [items[(2 * s + 1) * len(items) // (2 * k)] for s in range(k)]
+
+
+class StepTiming(NamedTuple):
+    step: str
+    items: int
+    seconds: float
+
+
+class StepExtrapolation(NamedTuple):
+    """
+    The estimated runtime of a step in a full run, from its runtime in a debug run.
+
+    Attributes
+    ----------
+    step: str
+        The name of the step.
+    sample_items: int
+        The number of items of the debug run.
+    sample_seconds: float
+        The runtime of the step in the debug run, on a single thread.
+    items: int
+        The number of items of the full run.
+    serial_seconds: float
+        The estimated runtime of the full run on a single thread.
+    wall_seconds: float
+        The estimated runtime of the full run on the planned cluster.
+    """
+
+    step: str
+    sample_items: int
+    sample_seconds: float
+    items: int
+    serial_seconds: float
+    wall_seconds: float
+
+
+def _work(estimate: StepEstimate, n: int, m: int) -> float:
+    # Mapped steps scale with their operations, the plots with the points drawn
+    if estimate.mapped:
+        return estimate.items * estimate.flops_per_item
+
+    return float(n * m)
+
+
+def extrapolate(
+    timings: List[StepTiming],
+    n: int,
+    m: int,
+    sample_n: int,
+    sample_m: int,
+    plan: ClusterPlan,
+    dtype: str = "float64",
+) -> List[StepExtrapolation]:
+    """
+    Scale the runtimes of the steps of a debug run to a full run, with the work
+    estimated for both by `estimate_steps`.
+
+    The runtime of a step is assumed to grow with its work: the floating point
+    operations of the mapped steps, and the points drawn by the plot steps. Mapped
+    steps are spread over every task the planned cluster runs at once, the plots run
+    in a single task. Fixed costs, such as scheduling, are scaled too, so sample
+    matrices shrunk far below m overestimate the full run.
+
+    Parameters
+    ----------
+    timings: List[StepTiming]
+        The runtime of every step of the debug run.
+    n: int
+        The number of matrices of the full run.
+    m: int
+        The squared shape of the matrices of the full run.
+    sample_n: int
+        The number of matrices of the debug run.
+    sample_m: int
+        The squared shape of the matrices of the debug run.
+    plan: ClusterPlan
+        The cluster planned for the full run.
+    dtype: str
+        The floating point precision of the matrices.
+        Default: "float64"
+
+    Returns
+    -------
+    extrapolations: List[StepExtrapolation]
+        The estimated runtime of every step timed.
+    """
+    full = {e.step: e for e in estimate_steps(n, m, dtype)}
+    sample = {e.step: e for e in estimate_steps(sample_n, sample_m, dtype)}
+    tasks = plan.workers * max(plan.threads_per_worker // plan.blas_threads, 1)
+
+    extrapolations = []
+    for timing in timings:
+        scale = _work(full[timing.step], n, m) / max(
+            _work(sample[timing.step], sample_n, sample_m), 1.0
+        )
+        serial_seconds = timing.seconds * scale
+        parallel = (
+            min(tasks, full[timing.step].items) if full[timing.step].mapped else 1
+        )
+        extrapolations.append(
+            StepExtrapolation(
+                step=timing.step,
+                sample_items=timing.items,
+                sample_seconds=timing.seconds,
+                items=full[timing.step].items,
+                serial_seconds=serial_seconds,
+                wall_seconds=serial_seconds / parallel,
+            )
+        )
+
+    return extrapolations
+
+
+def format_extrapolation(
+    extrapolations: List[StepExtrapolation], plan: ClusterPlan
+) -> str:
+    """
+    Describe the estimated runtime of a full run and the planned cluster.
+    """
+    lines = [
+        f"{'step':<14}{'sampled':>10}{'seconds':>10}{'items':>10}"
+        f"{'serial s':>12}{'wall s':>12}",
+    ]
+    for e in extrapolations:
+        lines.append(
+            f"{e.step:<14}{e.sample_items:>10}{e.sample_seconds:>10.2f}{e.items:>10}"
+            f"{e.serial_seconds:>12.1f}{e.wall_seconds:>12.1f}"
+        )
+
+    wall = sum(e.wall_seconds for e in extrapolations)
+    lines.extend(["", f"Estimated full run: {wall:.1f}s on", format_plan(plan)])
+    return "\n".join(lines)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import math
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+from tqdm import tqdm
+
+from .prefetch import prefetch
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+class DensityHistogram:
+    """
+    A 2-D histogram of vector values by index, accumulated chunk by chunk.
+
+    Every vector index is its own column, and values are counted in `bins` equal
+    width rows. The value range is not needed up front: it starts around the first
+    values added and, whenever values fall outside it, the bin width doubles by
+    merging neighbouring bins until everything fits. Memory is therefore
+    O(m * bins) however many vectors are added.
+
+    Bin widths are powers of two and bin edges are whole multiples of the width, so
+    two histograms always share bin edges once their widths match. Histograms of the
+    same vector length and number of bins can therefore be merged exactly, in any
+    order, and partial histograms can be accumulated in parallel and combined.
+
+    Parameters
+    ----------
+    m: int
+        The length of the vectors.
+    bins: int
+        The number of value bins, must be even.
+        Default: 256
+    """
+
+    def __init__(self, m: int, bins: int = 256):
+        if bins < 2 or bins % 2 != 0:
+            raise ValueError(f"The number of bins must be even, got {bins}.")
+
+        self.m = m
+        self.bins = bins
+        self.counts = np.zeros((m, bins), dtype=np.int64)
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+        # Bin i counts the values in [start + i, start + i + 1) * 2 ** exponent
+        self.exponent: Optional[int] = None
+        self.start: Optional[int] = None
+
+    @property
+    def width(self) -> float:
+        return math.ldexp(1.0, self.exponent)
+
+    @property
+    def lo(self) -> float:
+        return self.start * self.width
+
+    @property
+    def hi(self) -> float:
+        return (self.start + self.bins) * self.width
+
+    def _occupied(self) -> Optional[Tuple[int, int]]:
+        # The first and last bin holding any counts
+        bins = np.flatnonzero(self.counts.any(axis=0))
+        if len(bins) == 0:
+            return None
+
+        return self.start + bins[0], self.start + bins[-1]
+
+    def _rebin(self):
+        # Double the bin width, bin k of the old edges falls in bin k // 2
+        counts = self.counts
+        if self.start % 2 != 0:
+            counts = np.pad(counts, ((0, 0), (1, 1)))
+
+        merged = counts[:, 0::2] + counts[:, 1::2]
+        self.counts = np.zeros_like(self.counts)
+        self.counts[:, : merged.shape[1]] = merged
+        self.start //= 2
+        self.exponent += 1
+
+    def _shift(self, start: int):
+        # Move the window of bins without changing their width
+        offset = start - self.start
+        counts = np.zeros_like(self.counts)
+        if 0 <= offset < self.bins:
+            counts[:, : self.bins - offset] = self.counts[:, offset:]
+        elif -self.bins < offset < 0:
+            counts[:, -offset:] = self.counts[:, : self.bins + offset]
+
+        self.counts = counts
+        self.start = start
+
+    def _fit(self, lo: float, hi: float):
+        # Start with the finest bins that could hold the values
+        if self.exponent is None:
+            self.exponent = math.frexp(max(hi - lo, 1e-300) / self.bins)[1]
+            self.start = math.floor(lo / self.width)
+
+        # Widen the bins until the values and all prior counts fit
+        while True:
+            first, last = math.floor(lo / self.width), math.floor(hi / self.width)
+            occupied = self._occupied()
+            if occupied is not None:
+                first, last = min(first, occupied[0]), max(last, occupied[1])
+
+            if last - first < self.bins:
+                break
+
+            self._rebin()
+
+        # Center the occupied bins to leave room on both sides
+        self._shift(first - (self.bins - (last - first + 1)) // 2)
+
+    def add(self, chunk: np.ndarray):
+        """
+        Count the values of a chunk of vectors.
+
+        Parameters
+        ----------
+        chunk: np.ndarray
+            The vectors, one per row, of shape (k, m).
+        """
+        chunk = np.asarray(chunk).reshape(-1, self.m)
+        if len(chunk) == 0:
+            return
+
+        chunk_min, chunk_max = float(np.min(chunk)), float(np.max(chunk))
+        if not (np.isfinite(chunk_min) and np.isfinite(chunk_max)):
+            raise ValueError("Vectors must only contain finite values.")
+
+        self._fit(chunk_min, chunk_max)
+
+        # Bin every value of every vector at once
+        rows = np.floor(chunk / self.width).astype(np.int64) - self.start
+        rows = np.clip(rows, 0, self.bins - 1)
+        cells = np.arange(self.m) * self.bins + rows
+        self.counts += np.bincount(cells.ravel(), minlength=self.m * self.bins).reshape(
+            self.m, self.bins
+        )
+
+        self.n += len(chunk)
+        self.min = min(self.min, chunk_min)
+        self.max = max(self.max, chunk_max)
+
+    def merge(self, other: "DensityHistogram"):
+        """
+        Add the counts of another histogram of the same shape to this one.
+
+        Both are brought to the narrowest bins holding both, so counts may be merged
+        into wider bins, never split.
+        """
+        if (other.m, other.bins) != (self.m, self.bins):
+            raise ValueError("Only histograms of the same shape can be merged.")
+
+        occupied = other._occupied()
+        if occupied is not None:
+            other = other.copy()
+            if self.exponent is None:
+                self.exponent, self.start = other.exponent, other.start
+
+            # Match the finer bin width to the coarser one
+            while self.exponent < other.exponent:
+                self._rebin()
+            while other.exponent < self.exponent:
+                other._rebin()
+
+            # Fit the bins of the other histogram, widening both if needed
+            first, last = other._occupied()
+            self._fit(first * self.width, last * self.width)
+            while other.exponent < self.exponent:
+                other._rebin()
+
+            other._shift(self.start)
+            self.counts += other.counts
+
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def copy(self) -> "DensityHistogram":
+        histogram = DensityHistogram(self.m, self.bins)
+        histogram.counts = self.counts.copy()
+        histogram.exponent, histogram.start = self.exponent, self.start
+        histogram.n, histogram.min, histogram.max = self.n, self.min, self.max
+        return histogram
+
+
+def density_from_files(
+    vectors: List[Union[str, Path]],
+    bins: int = 256,
+    chunk_size: int = 1024,
+    prefetch_depth: int = 4,
+    prefetch_max_bytes: Optional[int] = 256 * 1024 * 1024,
+) -> DensityHistogram:
+    """
+    Accumulate the density of serialized vectors, reading them ahead in the
+    background and binning `chunk_size` vectors at a time.
+
+    Parameters
+    ----------
+    vectors: List[Union[str, Path]]
+        The serialized vectors, all of the same length.
+    bins: int
+        The number of value bins, see `DensityHistogram`.
+        Default: 256
+    chunk_size: int
+        The number of vectors binned at once.
+        Default: 1024
+    prefetch_depth: int
+        The number of vectors to read ahead, see `prefetch`.
+        Default: 4
+    prefetch_max_bytes: Optional[int]
+        The maximum total size of the vectors read ahead.
+        Default: 268435456 (256 MiB)
+
+    Returns
+    -------
+    histogram: DensityHistogram
+        The density of the vectors.
+    """
+    histogram = None
+    chunk = None
+    filled = 0
+    loaded = prefetch(vectors, depth=prefetch_depth, max_bytes=prefetch_max_bytes)
+    for vector, vec in tqdm(loaded, desc="Binning vectors", total=len(vectors)):
+        # Allocate from the first vector
+        if histogram is None:
+            histogram = DensityHistogram(len(vec), bins=bins)
+            chunk = np.empty((chunk_size, len(vec)), dtype=vec.dtype)
+
+        if vec.shape != (histogram.m,):
+            raise ValueError(
+                f"Vector {vector} has shape {vec.shape}, expected ({histogram.m},)."
+            )
+
+        chunk[filled] = vec
+        filled += 1
+        if filled == chunk_size:
+            histogram.add(chunk)
+            filled = 0
+
+    if histogram is None:
+        raise ValueError("No vectors provided.")
+
+    histogram.add(chunk[:filled])
+    return histogram
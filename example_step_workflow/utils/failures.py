@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from pathlib import Path
+from typing import Any, Callable, List, NamedTuple, Optional, Union
+
+import pandas as pd
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+FAILURE_POLICIES = ("fail", "continue")
+
+
+class ItemFailure(NamedTuple):
+    index: int
+    source: Optional[str]
+    error: str
+    attempts: int
+
+
+def check_failure_policy(failure_policy: str):
+    if failure_policy not in FAILURE_POLICIES:
+        raise ValueError(
+            f"Unsupported failure_policy: '{failure_policy}'. "
+            f"Use either 'fail' or 'continue'."
+        )
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Whether an error may go away when retried, such as a flaky network filesystem.
+    Missing files and every other error are considered deterministic.
+    """
+    return isinstance(error, OSError) and not isinstance(
+        error, (FileNotFoundError, IsADirectoryError, NotADirectoryError)
+    )
+
+
+class Guarded:
+    """
+    Wrap a mapped kernel so a failing item does not take the whole step down.
+
+    Transient errors, see `is_transient`, are retried with an exponential backoff.
+    Once retries are exhausted, or on any other error, the error is raised with the
+    "fail" policy, or returned as an `ItemFailure` with the "continue" policy so the
+    step can quarantine the item and carry on.
+
+    Parameters
+    ----------
+    func: Callable[..., Any]
+        The kernel, called with every argument but the item index.
+    retries: int
+        The number of times an item is retried after a transient error.
+        Default: 0
+    failure_policy: str
+        "fail" to raise the error of a failed item, "continue" to return it.
+        Default: "fail"
+    delay: float
+        The number of seconds before the first retry, doubled for every retry after.
+        Default: 1.0
+    """
+
+    def __init__(
+        self,
+        func: Callable[..., Any],
+        retries: int = 0,
+        failure_policy: str = "fail",
+        delay: float = 1.0,
+    ):
+        check_failure_policy(failure_policy)
+        self.func = func
+        self.retries = retries
+        self.failure_policy = failure_policy
+        self.delay = delay
+
+    def __call__(self, index: int, *args, **kwargs) -> Union[Any, ItemFailure]:
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                return self.func(*args, **kwargs)
+            except Exception as e:
+                if is_transient(e) and attempts <= self.retries:
+                    log.warning(f"Item {index} failed, retrying: {e!r}")
+                    time.sleep(self.delay * 2 ** (attempts - 1))
+                    continue
+
+                if self.failure_policy == "fail":
+                    raise
+
+                source = str(args[0]) if len(args) > 0 else None
+                return ItemFailure(index, source, f"{type(e).__name__}: {e}", attempts)
+
+
+def guarded_write_behind(
+    write_behind_bytes: int, retries: int = 0, failure_policy: str = "fail"
+) -> int:
+    """
+    The write-behind budget of guarded items, see `AsyncWriter`.
+
+    A background write error is raised by a later save of the same process, so it
+    would be retried or quarantined with another item while the item it belongs to is
+    already recorded. Items that may be retried or quarantined therefore write
+    synchronously.
+    """
+    if retries > 0 or failure_policy == "continue":
+        return 0
+
+    return write_behind_bytes
+
+
+def save_quarantine(path: Union[str, Path], failures: List[ItemFailure]):
+    """
+    Store the failed items of a step to a csv, or remove a stale one if none failed.
+    """
+    path = Path(path)
+    if len(failures) == 0:
+        if path.exists():
+            path.unlink()
+
+        return
+
+    pd.DataFrame(failures, columns=ItemFailure._fields).sort_values("index").to_csv(
+        path, index=False
+    )
+    log.warning(
+        f"{len(failures)} items failed and were quarantined, see: {path}. "
+        f"Downstream steps skip them, fix their inputs and rerun with resume."
+    )
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import uuid
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from distributed import Client, Future
+
+from .writer import flush_process_writer, process_writer
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+class ArrayHandoff(NamedTuple):
+    """
+    A reference to arrays held in the memory of Dask workers.
+
+    Mapped steps return this instead of a list of paths when asked to keep their
+    outputs in memory, and accept it in place of a list of paths. The arrays stay on
+    the workers that produced them (Dask spills them to the worker local directory
+    under memory pressure), so the next step reads them without a round trip through
+    the staging directory.
+
+    Attributes
+    ----------
+    dataset: str
+        The name of the dataset the futures of the arrays are published under on the
+        scheduler.
+    names: List[str]
+        The file name each array would have if saved, e.g. "matrix_3.npy". The item
+        index is part of the name.
+    """
+
+    dataset: str
+    names: List[str]
+
+
+def index_from_name(name: str) -> int:
+    # Split the filename by the suffix and the name
+    # Then split by the datalabel and the index
+    return int(name.split(".")[0].split("_")[1])
+
+
+def publish(client: Client, futures: List[Future], names: List[str], prefix: str):
+    """
+    Publish futures on the scheduler so they outlive the client that created them.
+
+    Parameters
+    ----------
+    client: Client
+        The client the futures belong to.
+    futures: List[Future]
+        The futures of the arrays.
+    names: List[str]
+        The file name of each array.
+    prefix: str
+        A prefix for the dataset name, usually the step name.
+
+    Returns
+    -------
+    handoff: ArrayHandoff
+        The reference to pass to the next step.
+    """
+    dataset = f"{prefix}-{uuid.uuid4().hex}"
+    client.publish_dataset(futures, name=dataset)
+    return ArrayHandoff(dataset=dataset, names=list(names))
+
+
+def retrieve(client: Client, handoff: ArrayHandoff) -> List[Future]:
+    """
+    Get the futures of a handoff and unpublish them.
+
+    The arrays stay in memory for as long as this client or the tasks depending on
+    them need them, and are released afterwards.
+    """
+    futures = client.get_dataset(handoff.dataset)
+    client.unpublish_dataset(handoff.dataset)
+    return futures
+
+
+def unpublish(client: Client, handoff: ArrayHandoff):
+    """
+    Unpublish a handoff its consumer never retrieved, e.g. because it failed, so its
+    arrays are released from worker memory.
+    """
+    if handoff.dataset in client.list_datasets():
+        client.unpublish_dataset(handoff.dataset)
+
+
+def save_named_array(
+    arr: np.ndarray, name: str, save_dir: Path, write_behind_bytes: int = 0
+) -> Tuple[int, Path, int, str]:
+    """
+    Save an in-memory array to the staging directory, run on a worker.
+
+    Returns
+    -------
+    i: int
+        The item index.
+    save_path: Path
+        Where the array is saved.
+    nbytes: int
+        The size of the file.
+    checksum: str
+        The checksum of the file.
+    """
+    save_path = save_dir / name
+    nbytes, checksum = process_writer(save_dir, write_behind_bytes).save(save_path, arr)
+    return index_from_name(name), save_path, nbytes, checksum
+
+
+def keep_or_save(
+    client: Client,
+    futures: List[Future],
+    names: List[str],
+    save_dir: Path,
+    prefix: str,
+    keep: bool,
+    save: bool,
+    write_behind_bytes: int = 0,
+    on_array: Optional[Callable[[int, np.ndarray], None]] = None,
+) -> Tuple[Optional[ArrayHandoff], List[Tuple[int, Path]]]:
+    """
+    Hand in-memory arrays off to the next step, save them, or both.
+
+    Parameters
+    ----------
+    client: Client
+        The client the futures belong to.
+    futures: List[Future]
+        The futures of the arrays.
+    names: List[str]
+        The file name of each array.
+    save_dir: Path
+        Where to save the arrays.
+    prefix: str
+        A prefix for the handoff dataset name, usually the step name.
+    keep: bool
+        Should the arrays be kept in worker memory and handed off.
+    save: bool
+        Should the arrays be saved to `save_dir`.
+    write_behind_bytes: int
+        The write-behind budget of each worker, see `AsyncWriter`.
+        Default: 0 (Synchronous writes)
+    on_array: Optional[Callable[[int, np.ndarray], None]]
+        Called with the index and array of every item, in order, the arrays are
+        then sent back from the workers.
+        Default: None (The arrays stay on the workers)
+
+    Returns
+    -------
+    handoff: Optional[ArrayHandoff]
+        The reference to pass to the next step if kept.
+    saved: List[Tuple[int, Path]]
+        The item index and path of each saved array.
+    """
+    handoff = publish(client, futures, names, prefix) if keep else None
+
+    if save:
+        saves = client.map(
+            save_named_array,
+            futures,
+            names,
+            save_dir=save_dir,
+            write_behind_bytes=write_behind_bytes,
+        )
+
+    # Fetch the arrays while they are saved
+    if on_array is not None:
+        for future, name in zip(futures, names):
+            on_array(index_from_name(name), future.result())
+
+    saved = []
+    if save:
+        saved = [(i, path) for i, path, _, _ in client.gather(saves)]
+
+        # Wait for every worker to finish writing
+        client.run(flush_process_writer, save_dir)
+
+    return handoff, saved
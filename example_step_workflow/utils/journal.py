@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from .array_io import checksum_file
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+def _source_signature(path: Union[str, Path]) -> Dict[str, Any]:
+    # A cheap stand in for the content of an input file
+    # If the upstream step rewrites the file, the size or mtime will change
+    stat = os.stat(path)
+    return {"path": str(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class Journal:
+    """
+    An append-only record of the items a step has completed.
+
+    The first line of the journal stores the parameters the items were produced with,
+    every following line records a single completed item: its index, output path,
+    size and checksum, and optionally a signature of the input it was produced from.
+
+    When resuming, items are only considered complete if the journal parameters match
+    the current parameters, the output file still exists with the recorded size, and
+    the input (if any) has not changed since the item was recorded.
+
+    Because outputs are written atomically, an item may be recorded as soon as its
+    output is queued for writing: if the write never completes the file will be
+    missing and the item is recomputed.
+
+    Parameters
+    ----------
+    path: Union[str, Path]
+        Where the journal is stored.
+    params: Dict[str, Any]
+        The parameters that affect the content of every item. Parameters that only
+        change how many items there are (such as `n`) should not be included so that
+        a run can be extended by resuming with a larger `n`.
+    resume: bool
+        Should the items recorded by a prior run be reused.
+        Default: False (Start a new journal)
+    verify: bool
+        When resuming, should the recorded checksums be verified against the files.
+        Default: False (Only check file existance and size)
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        params: Dict[str, Any] = {},
+        resume: bool = False,
+        verify: bool = False,
+    ):
+        self.path = Path(path)
+        self.params = json.loads(json.dumps(params, default=str))
+        self.verify = verify
+        self._entries = {}
+        self._handle = None
+
+        # Read prior entries
+        if resume:
+            self._entries = self._read()
+
+        # Start a fresh journal if not resuming or the prior one is unusable
+        if not resume or self._entries is None:
+            self._entries = {}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "w") as write_out:
+                write_out.write(json.dumps({"params": self.params}) + "\n")
+
+        if resume:
+            log.info(f"Resuming from {len(self._entries)} journaled items: {self.path}")
+
+    def _read(self) -> Optional[Dict[int, Dict[str, Any]]]:
+        if not self.path.is_file():
+            return None
+
+        entries = {}
+        with open(self.path, "r") as read_in:
+            for line_number, line in enumerate(read_in):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave the final line partially written
+                    log.debug(f"Skipping malformed journal line {line_number}")
+                    continue
+
+                if line_number == 0:
+                    if record.get("params") != self.params:
+                        log.warning(
+                            f"Journal parameters {record.get('params')} do not match "
+                            f"current parameters {self.params}. Starting over."
+                        )
+                        return None
+                else:
+                    entries[record["index"]] = record
+
+        return entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __enter__(self) -> "Journal":
+        self._handle = open(self.path, "a")
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def lookup(
+        self, index: int, source: Optional[Union[str, Path]] = None
+    ) -> Optional[Path]:
+        """
+        Get the output path of a completed item.
+
+        Parameters
+        ----------
+        index: int
+            The item index.
+        source: Optional[Union[str, Path]]
+            The input file the item is produced from. If provided, the item is only
+            complete if the input is unchanged since the item was recorded.
+
+        Returns
+        -------
+        filepath: Optional[Path]
+            The recorded output path, or None if the item must be (re)computed.
+        """
+        entry = self._entries.get(index)
+        if entry is None:
+            return None
+
+        # Check the input hasn't changed
+        if source is not None:
+            try:
+                if entry.get("source") != _source_signature(source):
+                    return None
+            except FileNotFoundError:
+                return None
+
+        # Check the output is still intact
+        filepath = Path(entry["filepath"])
+        try:
+            if filepath.stat().st_size != entry["nbytes"]:
+                return None
+        except FileNotFoundError:
+            return None
+
+        if self.verify and checksum_file(filepath) != entry["checksum"]:
+            return None
+
+        return filepath
+
+    def record(
+        self,
+        index: int,
+        filepath: Union[str, Path],
+        nbytes: int,
+        checksum: str,
+        source: Optional[Union[str, Path]] = None,
+    ):
+        """
+        Append a completed item to the journal.
+
+        Parameters
+        ----------
+        index: int
+            The item index.
+        filepath: Union[str, Path]
+            The path to the output the item produced.
+        nbytes: int
+            The size of the output file in bytes.
+        checksum: str
+            The checksum of the output file.
+        source: Optional[Union[str, Path]]
+            The input file the item was produced from.
+        """
+        entry = {
+            "index": index,
+            "filepath": str(filepath),
+            "nbytes": nbytes,
+            "checksum": checksum,
+        }
+        if source is not None:
+            entry["source"] = _source_signature(source)
+
+        self._entries[index] = entry
+
+        # Write and flush immediately so a crash loses at most the current item
+        if self._handle is None:
+            with open(self.path, "a") as write_out:
+                write_out.write(json.dumps(entry) + "\n")
+        else:
+            self._handle.write(json.dumps(entry) + "\n")
+            self._handle.flush()
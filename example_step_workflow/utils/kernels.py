@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+The array transforms every step and the in-process API share, so the results of a
+workflow run don't depend on how it was run.
+
+Each kernel works on a single (m, m) matrix or a stack of shape (n, m, m), and keeps
+the precision of the array it is given.
+"""
+
+import logging
+
+import numpy as np
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+def invert_matrix(mat: np.ndarray) -> np.ndarray:
+    """
+    Invert a matrix or each matrix of a stack.
+
+    numpy inverts float32 matrices in double precision and casts the result back, so
+    single precision saves bytes stored and held in memory, not compute.
+    """
+    return np.linalg.inv(mat)
+
+
+def sum_matrix(mat: np.ndarray) -> np.ndarray:
+    """
+    The cumulative sum of the sorted column maxima of a matrix or of each matrix of a
+    stack.
+    """
+    vec = np.amax(mat, axis=-2)
+    vec = np.sort(vec, axis=-1)
+    return np.cumsum(vec, axis=-1)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+from distributed import Client, as_completed, get_worker, worker_client
+
+from .array_io import save_array, write_bytes_atomic
+from .handoff import index_from_name
+from .writer import flush_process_writer, process_writer
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+class ScratchHandoff(NamedTuple):
+    """
+    A reference to arrays saved to the node-local scratch directories of the Dask
+    workers that produced them.
+
+    Mapped steps return this instead of a list of paths when asked for locality, and
+    accept it in place of a list of paths. The next step runs each item on the
+    worker holding it when it can, so the array is read from local disk rather than
+    crossing the network through the shared staging directory.
+
+    Scratch files live in the local directory of each worker and are removed with
+    it, so the handoff is only valid for the lifetime of the cluster.
+
+    Attributes
+    ----------
+    paths: List[str]
+        The path of each array on the node of the worker holding it. The file name
+        includes the item index, e.g. "matrix_3.npy".
+    workers: List[str]
+        The address of the worker holding each array.
+    """
+
+    paths: List[str]
+    workers: List[str]
+
+
+class LocalResult(NamedTuple):
+    index: int
+    scratch_path: Optional[str]
+    worker: str
+    saved_path: Optional[Path]
+    nbytes: int
+    checksum: str
+    same_worker: Optional[bool]
+    local: bool
+    array: Optional[np.ndarray] = None
+
+
+def scratch_dir(step_name: str) -> Path:
+    """
+    The node-local scratch directory of a step on the current worker.
+    """
+    path = Path(get_worker().local_directory) / "scratch" / step_name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def load_scratch(path: str, owner: str) -> Tuple[np.ndarray, bool]:
+    """
+    Load a scratch array from local disk, or fetch it from the worker holding it if
+    it is on another node, run on a worker.
+
+    Returns
+    -------
+    arr: np.ndarray
+        The array.
+    local: bool
+        Whether the array was read from local disk.
+    """
+    if Path(path).is_file():
+        return np.load(path), True
+
+    with worker_client() as client:
+        if owner not in client.scheduler_info()["workers"]:
+            raise FileNotFoundError(
+                f"Scratch array {path} was lost with the worker holding it: {owner}."
+            )
+
+        return client.submit(np.load, path, workers=[owner], pure=False).result(), False
+
+
+def run_local(
+    kernel: Callable[..., np.ndarray],
+    name: str,
+    step_name: str,
+    source: Optional[str] = None,
+    owner: Optional[str] = None,
+    keep: bool = True,
+    save_dir: Optional[Path] = None,
+    write_behind_bytes: int = 0,
+    return_array: bool = False,
+) -> LocalResult:
+    """
+    Produce one array into scratch, the shared staging directory, or both, run on a
+    worker.
+
+    Parameters
+    ----------
+    kernel: Callable[..., np.ndarray]
+        Produces the array from the source array, or from the item index when there
+        is no source.
+    name: str
+        The file name of the array, including the item index.
+    step_name: str
+        The step producing the array, its scratch files are kept apart.
+    source: Optional[str]
+        The scratch path of the input array.
+        Default: None (The kernel is given the item index)
+    owner: Optional[str]
+        The address of the worker holding the input array.
+        Default: None (The input is in the shared staging directory)
+    keep: bool
+        Should the array be saved to the scratch directory of this worker.
+        Default: True
+    save_dir: Optional[Path]
+        Where to also save the array in the shared staging directory.
+        Default: None (Only keep it in scratch)
+    write_behind_bytes: int
+        The write-behind budget of this worker for shared writes, see `AsyncWriter`.
+        Default: 0 (Synchronous writes)
+    return_array: bool
+        Should the array be sent back with the result.
+        Default: False (Only send back where it went)
+
+    Returns
+    -------
+    result: LocalResult
+        Where the array went, and whether the task ran on the worker holding its
+        input and read it from local disk.
+    """
+    i = index_from_name(name)
+    address = get_worker().address
+    if source is None:
+        arr, local = kernel(i), True
+    else:
+        inputs, local = load_scratch(source, owner)
+        arr = kernel(inputs)
+
+    # Scratch writes are synchronous, the next step may read them right away
+    scratch_path = None
+    if keep:
+        scratch_path = str(scratch_dir(step_name) / name)
+        save_array(Path(scratch_path), arr)
+
+    saved_path, nbytes, checksum = None, 0, ""
+    if save_dir is not None:
+        saved_path = save_dir / name
+        nbytes, checksum = process_writer(save_dir, write_behind_bytes).save(
+            saved_path, arr
+        )
+
+    return LocalResult(
+        i,
+        scratch_path,
+        address,
+        saved_path,
+        nbytes,
+        checksum,
+        None if owner is None else owner == address,
+        local,
+        arr if return_array else None,
+    )
+
+
+def map_local(
+    client: Client,
+    kernel: Callable[..., np.ndarray],
+    names: List[str],
+    step_name: str,
+    handoff: Optional[ScratchHandoff] = None,
+    keep: bool = True,
+    save_dir: Optional[Path] = None,
+    write_behind_bytes: int = 0,
+    on_array: Optional[Callable[[int, np.ndarray], None]] = None,
+) -> Tuple[Optional[ScratchHandoff], List[LocalResult]]:
+    """
+    Run `run_local` for every item, each preferably on the worker holding its input.
+
+    Tasks are loosely restricted to the worker holding their input: the scheduler
+    places them there unless that worker is busy and another is idle, in which case
+    the input is fetched from its node.
+
+    Parameters
+    ----------
+    client: Client
+        The client to submit tasks with.
+    kernel: Callable[..., np.ndarray]
+        See `run_local`.
+    names: List[str]
+        The file name of every output array.
+    step_name: str
+        The step producing the arrays.
+    handoff: Optional[ScratchHandoff]
+        The input arrays, in the order of the names. Inputs without a worker are read
+        from the shared staging directory.
+        Default: None (The kernel is given the item index)
+    keep: bool
+        Should the arrays be kept in scratch and handed off.
+        Default: True
+    save_dir: Optional[Path]
+        Where to also save the arrays in the shared staging directory.
+        Default: None (Only keep them in scratch)
+    write_behind_bytes: int
+        The write-behind budget of each worker for shared writes.
+        Default: 0 (Synchronous writes)
+    on_array: Optional[Callable[[int, np.ndarray], None]]
+        Called with the index and array of every item as it completes, the arrays
+        are then sent back from the workers.
+        Default: None (The arrays stay on the workers)
+
+    Returns
+    -------
+    handoff: Optional[ScratchHandoff]
+        The reference to pass to the next step if kept.
+    results: List[LocalResult]
+        The result of every item, in the order of the names.
+    """
+    if save_dir is not None:
+        save_dir.mkdir(parents=True, exist_ok=True)
+
+    futures = []
+    for k, name in enumerate(names):
+        if handoff is None:
+            source, owner, placement = None, None, {}
+        else:
+            source, owner = handoff.paths[k], handoff.workers[k]
+            placement = {}
+            if owner is not None:
+                placement = dict(workers=[owner], allow_other_workers=True)
+
+        futures.append(
+            client.submit(
+                run_local,
+                kernel,
+                name,
+                step_name,
+                source=source,
+                owner=owner,
+                keep=keep,
+                save_dir=save_dir,
+                write_behind_bytes=write_behind_bytes,
+                return_array=on_array is not None,
+                pure=False,
+                **placement,
+            )
+        )
+
+    results = {}
+    for future in as_completed(futures):
+        result = future.result()
+        if on_array is not None:
+            on_array(result.index, result.array)
+            result = result._replace(array=None)
+
+        results[result.index] = result
+
+    # Wait for every worker to finish writing to the shared staging directory
+    if save_dir is not None:
+        client.run(flush_process_writer, save_dir)
+
+    ordered = [results[index_from_name(name)] for name in names]
+    if not keep:
+        return None, ordered
+
+    return (
+        ScratchHandoff(
+            paths=[result.scratch_path for result in ordered],
+            workers=[result.worker for result in ordered],
+        ),
+        ordered,
+    )
+
+
+def locality_stats(results: List[LocalResult]) -> Dict[str, Any]:
+    """
+    Count the tasks that ran on the worker holding their input, the hit rate, and
+    the inputs read from local disk, including from other workers of the same node.
+    """
+    placed = [result for result in results if result.same_worker is not None]
+    hits = sum(result.same_worker for result in placed)
+    local = sum(result.local for result in placed)
+    return {
+        "tasks": len(placed),
+        "hits": hits,
+        "hit_rate": hits / len(placed) if len(placed) > 0 else None,
+        "local_reads": local,
+        "remote_reads": len(placed) - local,
+    }
+
+
+def save_locality_stats(path: Union[str, Path], results: List[LocalResult]):
+    """
+    Store the locality stats of a step, to be collected into the run summary.
+    """
+    stats = locality_stats(results)
+    write_bytes_atomic(Path(path), json.dumps(stats, indent=4).encode())
+    log.info(
+        f"Locality: {stats['hits']} of {stats['tasks']} tasks ran on the worker "
+        f"holding their input, {stats['remote_reads']} inputs crossed the network"
+    )
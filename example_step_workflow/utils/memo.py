@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Union
+
+import pandas as pd
+from datastep import Step
+
+from .array_io import write_bytes_atomic
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+# Run parameters that never change what a step produces
+VOLATILE_PARAMS = {
+    "distributed_executor_address",
+    "clean",
+    "resume",
+    "memoize",
+}
+
+###############################################################################
+
+
+def _file_signature(path: Union[str, Path]) -> List[Any]:
+    stat = os.stat(path)
+    return [str(path), stat.st_size, stat.st_mtime_ns]
+
+
+@lru_cache(maxsize=1)
+def code_version() -> str:
+    """
+    Hash the source of the whole package.
+
+    Steps delegate their work to the kernels, writers and loaders of the utils
+    modules, so a change to any module may change what a step produces.
+
+    Returns
+    -------
+    version: str
+        The hash of every module of the package, tests excluded.
+    """
+    package_dir = Path(__file__).parent.parent
+    sha = hashlib.sha256()
+    for path in sorted(package_dir.rglob("*.py")):
+        relative = path.relative_to(package_dir)
+        if relative.parts[0] == "tests":
+            continue
+
+        sha.update(relative.as_posix().encode())
+        sha.update(path.read_bytes())
+
+    return sha.hexdigest()
+
+
+class StepCache:
+    """
+    Memoize the outputs of a step keyed on everything that determines them.
+
+    A run is fingerprinted from the signature (path, size and mtime) of every input
+    file, the run parameters, and a hash of the source code of the package. After a
+    run, the produced manifest is stored under that fingerprint. A later run with the
+    same fingerprint can return the stored manifest as long as every file it lists is
+    unchanged since it was stored.
+
+    Steps write their outputs to the same paths on every run, so only the latest run
+    is kept: storing a run replaces the prior one and deletes the files only the
+    prior run referenced.
+
+    Because the cache lives in the step local staging directory, cleaning the step
+    always forces recomputation.
+
+    Parameters
+    ----------
+    step: Step
+        The step to cache the outputs of.
+    """
+
+    def __init__(self, step: Step):
+        self.step = step
+        self.step_dir = Path(step.step_local_staging_dir)
+        self.cache_dir = self.step_dir / "memo"
+        self.index_path = self.cache_dir / "index.json"
+
+        # Hash the code that produces the outputs
+        self.code_version = code_version()
+
+    def _read_index(self) -> Dict[str, Dict[str, Any]]:
+        if not self.index_path.is_file():
+            return {}
+
+        with open(self.index_path, "r") as read_in:
+            return json.load(read_in)
+
+    def _write_index(self, index: Dict[str, Dict[str, Any]]):
+        write_bytes_atomic(self.index_path, json.dumps(index).encode())
+
+    def fingerprint(
+        self,
+        params: Dict[str, Any],
+        inputs: Optional[List[Union[str, Path]]] = None,
+    ) -> str:
+        """
+        Compute the fingerprint of a run.
+
+        Parameters
+        ----------
+        params: Dict[str, Any]
+            The run parameters. Parameters that do not change the outputs, such as the
+            executor address, are ignored.
+        inputs: Optional[List[Union[str, Path]]]
+            The input files of the run.
+
+        Returns
+        -------
+        key: str
+            The fingerprint.
+        """
+        params = {k: v for k, v in params.items() if k not in VOLATILE_PARAMS}
+        sha = hashlib.sha256()
+        sha.update(self.code_version.encode())
+        sha.update(json.dumps(params, sort_keys=True, default=str).encode())
+        for path in inputs or []:
+            sha.update(json.dumps(_file_signature(path)).encode())
+
+        return sha.hexdigest()
+
+    def lookup(self, key: str) -> Optional[pd.DataFrame]:
+        """
+        Get the manifest of a prior run with the same fingerprint.
+
+        Parameters
+        ----------
+        key: str
+            The fingerprint of the run.
+
+        Returns
+        -------
+        manifest: Optional[pd.DataFrame]
+            The stored manifest if all of its files are unchanged, otherwise None.
+        """
+        index = self._read_index()
+        entry = index.get(key)
+        if entry is None:
+            return None
+
+        # Check that no file was removed or overwritten since
+        for signature in entry["files"]:
+            try:
+                if _file_signature(signature[0]) != signature:
+                    raise FileNotFoundError(signature[0])
+            except FileNotFoundError:
+                log.info(f"Cached run {key[:12]} is stale and will be recomputed.")
+                index.pop(key)
+                self._write_index(index)
+                return None
+
+        log.info(f"Using cached outputs of identical run {key[:12]}.")
+        return pd.read_csv(self.cache_dir / entry["manifest"])
+
+    def restore(self, key: str) -> bool:
+        """
+        Make the manifest of a prior run with the same fingerprint that of the step.
+
+        Parameters
+        ----------
+        key: str
+            The fingerprint of the run.
+
+        Returns
+        -------
+        restored: bool
+            Whether the stored manifest was intact and is now the step manifest,
+            saved to its local staging directory.
+        """
+        manifest = self.lookup(key)
+        if manifest is None:
+            return False
+
+        self.step.manifest = manifest
+        manifest.to_csv(self.step_dir / "manifest.csv", index=False)
+        return True
+
+    def store(
+        self,
+        key: str,
+        manifest: pd.DataFrame,
+        filepath_columns: List[str] = ["filepath"],
+    ):
+        """
+        Store the manifest of a completed run in place of the prior one.
+
+        Parameters
+        ----------
+        key: str
+            The fingerprint of the run.
+        manifest: pd.DataFrame
+            The manifest the run produced.
+        filepath_columns: List[str]
+            The manifest columns that store filepaths.
+            Default: ["filepath"]
+        """
+        files = []
+        for column in filepath_columns:
+            files += [_file_signature(f) for f in manifest[column].dropna()]
+
+        manifest_name = f"{key}.csv"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        manifest.to_csv(self.cache_dir / manifest_name, index=False)
+
+        evicted = self._read_index()
+        evicted.pop(key, None)
+        self._write_index({key: {"manifest": manifest_name, "files": files}})
+        self._evict(evicted, retained={signature[0] for signature in files})
+
+    def _evict(self, evicted: Dict[str, Dict[str, Any]], retained: Set[str]):
+        # Delete the files only the replaced runs reference, unless rewritten since
+        for key, entry in evicted.items():
+            log.info(f"Evicted cached run {key[:12]}.")
+            for signature in entry["files"]:
+                path = Path(signature[0])
+                if signature[0] not in retained and path.is_file():
+                    try:
+                        if _file_signature(path) == signature:
+                            path.unlink()
+                    except FileNotFoundError:
+                        pass
+
+            manifest_path = self.cache_dir / entry["manifest"]
+            if manifest_path.is_file():
+                manifest_path.unlink()
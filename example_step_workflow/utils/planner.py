@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import logging
+import math
+import os
+from pathlib import Path
+from typing import Any, ContextManager, Dict, List, NamedTuple, Optional, Union
+
+import dask
+import numpy as np
+from distributed.system import MEMORY_LIMIT
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+# Memory used by a worker process before it runs anything
+WORKER_OVERHEAD_BYTES = 256 * 1024 * 1024
+
+# Memory used by a figure of the plot steps beyond the vectors
+FIGURE_OVERHEAD_BYTES = 256 * 1024 * 1024
+
+GB = 1000**3
+
+
+class StepEstimate(NamedTuple):
+    step: str
+    items: int
+    bytes_per_item: int
+    flops_per_item: float
+    mapped: bool = True
+
+
+class ClusterPlan(NamedTuple):
+    """
+    A cluster sized for a workflow run, see `plan_cluster`.
+
+    Attributes
+    ----------
+    distributed: bool
+        Whether the plan is for a SLURMCluster rather than a LocalCluster.
+    workers: int
+        The number of local workers, or the maximum number of SLURM jobs.
+    threads_per_worker: int
+        The threads of each local worker, or the cores of each SLURM job.
+    blas_threads: int
+        The BLAS threads of every mapped task, see `tune_blas`.
+    memory_per_worker: int
+        The memory limit of each local worker or SLURM job in bytes.
+    task_memory: int
+        The peak memory of the largest mapped task in bytes.
+    worker_resources: Dict[str, int]
+        The MEMORY and CPU resources each worker declares, so the scheduler never
+        runs more tasks at once on a worker than fit in its memory and cores.
+    estimates: List[StepEstimate]
+        The per-item estimates of every step.
+    estimated_seconds: float
+        The estimated compute time of the whole run on a single thread.
+    notes: List[str]
+        Warnings about the plan, e.g. a workload that does not fit in memory.
+    """
+
+    distributed: bool
+    workers: int
+    threads_per_worker: int
+    blas_threads: int
+    memory_per_worker: int
+    task_memory: int
+    worker_resources: Dict[str, int]
+    estimates: List[StepEstimate]
+    estimated_seconds: float
+    notes: List[str]
+
+    @property
+    def task_resources(self) -> Dict[str, int]:
+        """
+        The resource annotation of every mapped task.
+        """
+        return {"MEMORY": self.task_memory, "CPU": self.blas_threads}
+
+
+def estimate_steps(n: int, m: int, dtype: str = "float64") -> List[StepEstimate]:
+    """
+    Estimate the peak memory and floating point operations of every item of every
+    step of the workflow.
+
+    Parameters
+    ----------
+    n: int
+        The number of matrices.
+    m: int
+        The squared shape of the matrices.
+    dtype: str
+        The floating point precision of the matrices.
+        Default: "float64"
+
+    Returns
+    -------
+    estimates: List[StepEstimate]
+        The estimates of every step, in workflow order. The plot steps are a single
+        item holding every vector.
+    """
+    itemsize = np.dtype(dtype).itemsize
+    matrix = m * m * itemsize
+    return [
+        # float64 draws, the cast copy and its serialized bytes
+        StepEstimate("mappedraw", n, m * m * 8 + 2 * matrix, float(m * m)),
+        # Input, LAPACK copy, inverse and its serialized bytes, about 2m^3 flops
+        StepEstimate("mappedinvert", n, 4 * matrix, 2.0 * m**3),
+        # Input and the small vector
+        StepEstimate("mappedsum", n, matrix + 3 * m * 8, m * m + m * math.log2(m + 1)),
+        # Every vector stacked, their float copy and the figure
+        StepEstimate("plot", 1, 2 * n * m * 8 + FIGURE_OVERHEAD_BYTES, 0.0, False),
+        StepEstimate("fancyplot", 1, 3 * n * m * 8 + FIGURE_OVERHEAD_BYTES, 0.0, False),
+    ]
+
+
+def plan_cluster(
+    n: int,
+    m: int,
+    dtype: str = "float64",
+    distributed: bool = False,
+    cores: Optional[int] = None,
+    memory: Optional[int] = None,
+    job_cores: int = 2,
+    max_jobs: int = 40,
+    blas_threads: int = 1,
+    write_behind_bytes: int = 256 * 1024 * 1024,
+    gflops_per_thread: float = 5.0,
+    target_seconds: float = 60.0,
+) -> ClusterPlan:
+    """
+    Size a cluster for a workflow run from estimates of the work of every step.
+
+    Local workers get a single thread each, as the OpenBLAS threads of several
+    workers conflict, and as many workers as there are cores for their BLAS threads
+    and the memory allows.
+    SLURM jobs get enough memory for every core to run the largest mapped task, and
+    as many jobs as keep every core busy for `target_seconds`, up to `max_jobs`.
+
+    Parameters
+    ----------
+    n: int
+        The number of matrices.
+    m: int
+        The squared shape of the matrices.
+    dtype: str
+        The floating point precision of the matrices.
+        Default: "float64"
+    distributed: bool
+        Plan a SLURMCluster rather than a LocalCluster.
+        Default: False
+    cores: Optional[int]
+        The cores available to a LocalCluster.
+        Default: None (The cores of this machine)
+    memory: Optional[int]
+        The memory available to a LocalCluster in bytes.
+        Default: None (The memory of this machine)
+    job_cores: int
+        The cores of each SLURM job.
+        Default: 2
+    max_jobs: int
+        The maximum number of SLURM jobs.
+        Default: 40
+    blas_threads: int
+        The BLAS threads of every mapped task. Local workers run a single task each,
+        SLURM jobs run as many tasks at once as they have cores for.
+        Default: 1
+    write_behind_bytes: int
+        The write-behind budget of each worker, see `AsyncWriter`.
+        Default: 268435456 (256 MiB)
+    gflops_per_thread: float
+        The assumed compute speed of a thread, used to estimate runtimes.
+        Default: 5.0
+    target_seconds: float
+        The minimum estimated work of every SLURM core, fewer jobs are requested for
+        smaller runs.
+        Default: 60.0
+
+    Returns
+    -------
+    plan: ClusterPlan
+        The cluster to create and the estimates it is based on.
+    """
+    estimates = estimate_steps(n, m, dtype)
+    task_memory = max(e.bytes_per_item for e in estimates if e.mapped)
+    plot_memory = max(e.bytes_per_item for e in estimates if not e.mapped)
+    overhead = WORKER_OVERHEAD_BYTES + write_behind_bytes
+    flops = sum(estimate.items * estimate.flops_per_item for estimate in estimates)
+    estimated_seconds = flops / (gflops_per_thread * 1e9)
+    notes = []
+
+    if distributed:
+        threads = job_cores
+        needed = max(threads * task_memory, plot_memory) + overhead
+        memory_per_worker = max(math.ceil(needed / GB), 2) * GB
+        work_per_core = max(estimated_seconds / target_seconds, 1)
+        workers = int(min(math.ceil(work_per_core / threads), max_jobs))
+        workers = max(min(workers, math.ceil(n / threads)), 1)
+    else:
+        cores = cores or os.cpu_count() or 1
+        memory = memory or MEMORY_LIMIT
+        threads = 1
+        needed = task_memory + overhead
+        workers = max(min(cores // blas_threads, n, memory // needed), 1)
+        memory_per_worker = int(memory // workers)
+        if plot_memory + overhead > memory_per_worker:
+            notes.append(
+                f"The plot steps need about {_format_bytes(plot_memory)}, "
+                f"more than the {_format_bytes(memory_per_worker)} of a worker. "
+                f"Use plot_mode='density' or 'envelope'."
+            )
+
+    if needed > memory_per_worker:
+        notes.append(
+            f"A worker needs about {_format_bytes(needed)} but only has "
+            f"{_format_bytes(memory_per_worker)}, expect spilling or failures."
+        )
+
+    # Never declare less than a single task needs, or it could never run
+    available = max(memory_per_worker - overhead, task_memory)
+
+    return ClusterPlan(
+        distributed=distributed,
+        workers=workers,
+        threads_per_worker=threads,
+        blas_threads=blas_threads,
+        memory_per_worker=memory_per_worker,
+        task_memory=task_memory,
+        worker_resources={
+            "MEMORY": available,
+            "CPU": max(threads, blas_threads) if distributed else blas_threads,
+        },
+        estimates=estimates,
+        estimated_seconds=estimated_seconds,
+        notes=notes,
+    )
+
+
+def local_cluster_kwargs(plan: ClusterPlan) -> Dict[str, Any]:
+    """
+    The arguments of a `LocalCluster` following a plan.
+    """
+    return dict(
+        n_workers=plan.workers,
+        threads_per_worker=plan.threads_per_worker,
+        memory_limit=plan.memory_per_worker,
+        resources=plan.worker_resources,
+    )
+
+
+def slurm_cluster_kwargs(
+    plan: ClusterPlan, log_dir: Union[str, Path], local_directory: Union[str, Path]
+) -> Dict[str, Any]:
+    """
+    The arguments of a `SLURMCluster` following a plan. Scale it adaptively up to
+    `plan.workers` jobs.
+    """
+    resources = ",".join(f"{k}={v}" for k, v in plan.worker_resources.items())
+    return dict(
+        cores=plan.threads_per_worker,
+        processes=1,
+        memory=f"{plan.memory_per_worker // GB}GB",
+        walltime="10:00:00",
+        queue="aics_cpu_general",
+        local_directory=str(local_directory),
+        log_directory=str(log_dir),
+        worker_extra_args=["--resources", resources],
+    )
+
+
+def annotate_resources(resources: Optional[Dict[str, float]]) -> ContextManager:
+    """
+    Annotate the tasks submitted within the context with the resources they need,
+    such as MEMORY and CPU, so workers declaring them never run more of them at once
+    than fit.
+    """
+    if resources is None:
+        return contextlib.nullcontext()
+
+    return dask.annotate(resources=resources)
+
+
+def _format_bytes(nbytes: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if nbytes < 1000:
+            return f"{nbytes:.1f} {unit}"
+
+        nbytes /= 1000
+
+    return f"{nbytes:.1f} TB"
+
+
+def format_plan(plan: ClusterPlan) -> str:
+    """
+    Describe a plan and its estimates for a dry run.
+    """
+    if plan.distributed:
+        cluster = (
+            f"SLURMCluster: up to {plan.workers} job(s) of "
+            f"{plan.threads_per_worker} core(s) and "
+            f"{_format_bytes(plan.memory_per_worker)}"
+        )
+    else:
+        cluster = (
+            f"LocalCluster: {plan.workers} worker(s) of "
+            f"{plan.threads_per_worker} thread(s) and "
+            f"{_format_bytes(plan.memory_per_worker)}"
+        )
+
+    lines = [
+        cluster,
+        f"Mapped task annotation: {_format_bytes(plan.task_memory)} and "
+        f"{plan.blas_threads} BLAS thread(s) (workers declare "
+        f"{_format_bytes(plan.worker_resources['MEMORY'])} and "
+        f"{plan.worker_resources['CPU']} CPU)",
+        f"Estimated compute: {plan.estimated_seconds:.1f}s on a single thread",
+        "",
+        f"{'step':<14}{'items':>10}{'memory/item':>16}{'GFLOP/item':>14}",
+    ]
+    for estimate in plan.estimates:
+        lines.append(
+            f"{estimate.step:<14}{estimate.items:>10}"
+            f"{_format_bytes(estimate.bytes_per_item):>16}"
+            f"{estimate.flops_per_item / 1e9:>14.3f}"
+        )
+
+    lines.extend(f"Note: {note}" for note in plan.notes)
+    return "\n".join(lines)
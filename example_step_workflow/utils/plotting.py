@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+from functools import partial
+from typing import Any, Optional, Tuple
+
+import matplotlib.style
+import numpy as np
+from matplotlib import rcParams
+from matplotlib.collections import LineCollection
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+
+from .density import DensityHistogram
+from .summary import VectorSummary
+from .tiles import axes_image, axes_rgba, map_tiles, over, tile_slices
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+def line_collection(
+    plot_matrix: np.ndarray, colors: Any = "r", rasterized: bool = False
+) -> LineCollection:
+    """
+    Build a single artist drawing each vector as a line against its index.
+
+    The lines use the line width, cap and join style and antialiasing of the current
+    style, so they look the same as one Line2D per vector.
+
+    Parameters
+    ----------
+    plot_matrix: np.ndarray
+        The vectors to draw, one per row.
+    colors: Any
+        A single matplotlib color for every line or one color per vector.
+        Default: "r"
+    rasterized: bool
+        Should the lines be rasterized when saving to a vector format.
+        Default: False (Keep the lines as vectors)
+
+    Returns
+    -------
+    lines: LineCollection
+        The lines, to be added to an axes.
+    """
+    n, m = plot_matrix.shape
+
+    # One (m, 2) segment of x, y points per vector
+    segments = np.empty((n, m, 2), dtype=plot_matrix.dtype)
+    segments[:, :, 0] = np.arange(m)
+    segments[:, :, 1] = plot_matrix
+
+    return LineCollection(
+        segments,
+        colors=colors,
+        linewidths=rcParams["lines.linewidth"],
+        capstyle=rcParams["lines.solid_capstyle"],
+        joinstyle=rcParams["lines.solid_joinstyle"],
+        antialiaseds=rcParams["lines.antialiased"],
+        rasterized=rasterized,
+    )
+
+
+def line_layer(
+    tile: Tuple[np.ndarray, Any],
+    xlim: Tuple[float, float],
+    ylim: Tuple[float, float],
+) -> np.ndarray:
+    """
+    Render the lines of a tile of vectors alone on a transparent canvas configured
+    like the line plot, intended to run on a worker.
+
+    Parameters
+    ----------
+    tile: Tuple[np.ndarray, Any]
+        The vectors, one per row, and their colors, see `line_collection`.
+    xlim: Tuple[float, float]
+        The x limits of the axes.
+    ylim: Tuple[float, float]
+        The y limits of the axes.
+
+    Returns
+    -------
+    rgba: np.ndarray
+        The pixels covered by the axes, see `axes_rgba`.
+    """
+    plot_matrix, colors = tile
+    with matplotlib.style.context("seaborn-whitegrid"):
+        fig = Figure()
+        fig.patch.set_alpha(0)
+        ax = fig.subplots()
+        ax.set_axis_off()
+        ax.add_collection(line_collection(plot_matrix, colors=colors))
+        ax.set_xlim(*xlim)
+        ax.set_ylim(*ylim)
+
+        return axes_rgba(ax)
+
+
+def line_plot(
+    plot_matrix: np.ndarray,
+    rasterized: bool = False,
+    tile_size: Optional[int] = None,
+    processes: Optional[int] = None,
+) -> Figure:
+    """
+    Plot each vector as a red line.
+
+    Every vector is drawn by a single LineCollection rather than one Line2D per
+    vector, so the memory used by the figure and the time to save it grow with the
+    number of points only.
+
+    With a `tile_size`, consecutive tiles of vectors are instead rendered in
+    parallel, see `map_tiles`, each alone on a transparent canvas by `line_layer`.
+    The tiles are composited in order into a single image drawn in place of the
+    lines, which matches the serial render to within antialiasing rounding.
+
+    The figure is not registered with pyplot, so it is garbage collected like any
+    other object and creating it is safe from any thread.
+
+    Parameters
+    ----------
+    plot_matrix: np.ndarray
+        The vectors to plot, one per row.
+    rasterized: bool
+        Should the lines be rasterized when saving to a vector format such as pdf or
+        svg. Keeps those files small for large numbers of vectors. Tiled lines are
+        always rasterized.
+        Default: False (Keep the lines as vectors)
+    tile_size: Optional[int]
+        The number of vectors rendered by each parallel task.
+        Default: None (Render every vector at once, in this process)
+    processes: Optional[int]
+        The number of local processes rendering tiles when not running on a Dask
+        worker.
+        Default: None (One per core)
+
+    Returns
+    -------
+    fig: Figure
+        The line plot.
+    """
+    xlim, ylim = (1, plot_matrix.shape[1]), (0, np.amax(plot_matrix))
+    with matplotlib.style.context("seaborn-whitegrid"):
+        fig = Figure()
+        ax = fig.subplots()
+        if tile_size is None:
+            ax.add_collection(line_collection(plot_matrix, rasterized=rasterized))
+        else:
+            # Render tiles of lines in parallel and draw them as one image
+            tiles = [
+                (plot_matrix[tile], "r")
+                for tile in tile_slices(len(plot_matrix), tile_size)
+            ]
+            layers = map_tiles(
+                partial(line_layer, xlim=xlim, ylim=ylim), tiles, processes=processes
+            )
+            axes_image(ax, over(layers))
+
+        # set axes limits
+        ax.set_xlim(*xlim)
+        ax.set_ylim(*ylim)
+
+    return fig
+
+
+def density_plot(histogram: DensityHistogram, cmap: str = "Reds") -> Figure:
+    """
+    Plot the density of the vectors as a single colormapped image.
+
+    The cost of drawing depends on the number of bins only, not on the number of
+    vectors, and bins no vector passes through are left blank.
+
+    Parameters
+    ----------
+    histogram: DensityHistogram
+        The density of the vectors to plot.
+    cmap: str
+        The colormap used for the number of vectors per bin, on a log scale.
+        Default: "Reds"
+
+    Returns
+    -------
+    fig: Figure
+        The density plot.
+    """
+    counts = np.ma.masked_equal(histogram.counts.T, 0)
+    with matplotlib.style.context("seaborn-whitegrid"):
+        fig = Figure()
+        ax = fig.subplots()
+
+        # Each vector index is a column centered on the index
+        image = ax.imshow(
+            counts,
+            extent=(-0.5, histogram.m - 0.5, histogram.lo, histogram.hi),
+            origin="lower",
+            aspect="auto",
+            interpolation="nearest",
+            cmap=cmap,
+            norm=LogNorm(vmin=1, vmax=max(counts.max(), 1)),
+            zorder=2,
+        )
+        fig.colorbar(image, ax=ax, label="Vectors")
+
+        # set axes limits
+        ax.set_xlim(1, histogram.m)
+        ax.set_ylim(0, histogram.max)
+
+    return fig
+
+
+def envelope_plot(summary: VectorSummary, color: str = "r") -> Figure:
+    """
+    Plot the distribution of the vectors at every index from their summary.
+
+    Draws the 5th to 95th and 25th to 75th percentile bands, the median, the mean
+    and the minimum and maximum, so the cost of drawing does not depend on the number
+    of vectors summarized. The y axis is scaled to the bands, a few extreme vectors
+    may run off the top.
+
+    Parameters
+    ----------
+    summary: VectorSummary
+        The summary of the vectors to plot.
+    color: str
+        The matplotlib color of the bands and lines.
+        Default: "r"
+
+    Returns
+    -------
+    fig: Figure
+        The envelope plot.
+    """
+    index = np.arange(summary.m)
+    low, lower, median, upper, high = summary.quantile([0.05, 0.25, 0.5, 0.75, 0.95])
+    with matplotlib.style.context("seaborn-whitegrid"):
+        fig = Figure()
+        ax = fig.subplots()
+
+        ax.fill_between(index, low, high, color=color, alpha=0.2, lw=0, label="5-95%")
+        ax.fill_between(
+            index, lower, upper, color=color, alpha=0.4, lw=0, label="25-75%"
+        )
+        ax.plot(index, median, color=color, label="Median")
+        ax.plot(index, summary.mean, color=color, ls="--", label="Mean")
+        ax.plot(index, summary.min, color=color, ls=":", label="Min / max")
+        ax.plot(index, summary.max, color=color, ls=":")
+        ax.legend(loc="upper left")
+
+        # set axes limits
+        ax.set_xlim(1, summary.m)
+        ax.set_ylim(0, 1.1 * np.amax(high))
+
+    return fig
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Callable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+def prefetch(
+    paths: List[Union[str, Path]],
+    depth: int = 4,
+    max_bytes: Optional[int] = None,
+    loader: Callable[[Union[str, Path]], Any] = np.load,
+) -> Iterator[Tuple[Union[str, Path], Any]]:
+    """
+    Load files in order while reading the next ones ahead in a background thread.
+
+    Parameters
+    ----------
+    paths: List[Union[str, Path]]
+        The files to load, in the order they will be consumed.
+    depth: int
+        The maximum number of files loaded ahead of the consumer.
+        A depth of 0 loads every file in the calling thread when it is requested.
+        Default: 4
+    max_bytes: Optional[int]
+        The maximum total file size loaded ahead of the consumer. A single file larger
+        than the budget is still loaded, but only once nothing else is held.
+        Default: None (Only bounded by depth)
+    loader: Callable[[Union[str, Path]], Any]
+        The function used to load a single file.
+        Default: np.load
+
+    Returns
+    -------
+    loaded: Iterator[Tuple[Union[str, Path], Any]]
+        Each path with its loaded content. Errors raised while loading a file are
+        raised when that file is reached.
+    """
+    # Nothing to overlap with, load in the calling thread
+    if depth < 1:
+        for path in paths:
+            yield path, loader(path)
+
+        return
+
+    # Shared state between the reading thread and the consumer
+    condition = threading.Condition()
+    held = {"count": 0, "bytes": 0, "stop": False}
+    loaded = queue.Queue()
+
+    def has_room(size: int) -> bool:
+        if held["stop"] or held["count"] == 0:
+            return True
+        if held["count"] >= depth:
+            return False
+
+        return max_bytes is None or held["bytes"] + size <= max_bytes
+
+    def read_ahead():
+        for path in paths:
+            size = 0
+            try:
+                size = os.stat(path).st_size
+                with condition:
+                    condition.wait_for(lambda: has_room(size))
+                    if held["stop"]:
+                        return
+
+                    held["count"] += 1
+                    held["bytes"] += size
+
+                loaded.put((path, loader(path), size, None))
+            except Exception as e:
+                loaded.put((path, None, size, e))
+                return
+
+    reader = threading.Thread(target=read_ahead, daemon=True)
+    reader.start()
+
+    try:
+        for _ in range(len(paths)):
+            path, content, size, error = loaded.get()
+
+            # Release the budget the item was holding
+            with condition:
+                held["count"] = max(held["count"] - 1, 0)
+                held["bytes"] -= size
+                condition.notify_all()
+
+            if error is not None:
+                raise error
+
+            yield path, content
+
+    finally:
+        # Stop reading ahead if the consumer stops early
+        with condition:
+            held["stop"] = True
+            condition.notify_all()
+
+        reader.join()
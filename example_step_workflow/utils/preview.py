@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import logging
+import math
+import time
+from pathlib import Path
+from typing import List, Optional, Union
+
+import matplotlib
+import matplotlib.cm
+import matplotlib.style
+import numpy as np
+from matplotlib.figure import Figure
+
+from .array_io import write_bytes_atomic
+from .plotting import line_layer
+from .tiles import axes_image, axes_pixels, over
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+def _halve_rows(rgba: np.ndarray) -> np.ndarray:
+    # Squeeze an image into its bottom half, averaging pairs of rows from the bottom
+    height = rgba.shape[0]
+    bottom_up = rgba[::-1]
+    if height % 2 != 0:
+        bottom_up = np.concatenate([bottom_up, np.zeros_like(bottom_up[:1])])
+
+    # Average in premultiplied alpha
+    premultiplied = bottom_up.copy()
+    premultiplied[..., :3] *= premultiplied[..., 3:]
+    pairs = premultiplied.reshape(-1, 2, *rgba.shape[1:]).mean(axis=1)
+
+    halved = np.zeros_like(rgba)
+    halved[: len(pairs)] = pairs
+    filled = halved[..., 3] > 0
+    halved[filled, :3] /= halved[filled, 3:]
+    return halved[::-1]
+
+
+class PlotPreview:
+    """
+    Progressively render previews of the line and fancy plots from the vectors
+    completed so far.
+
+    Vectors are drawn once, onto accumulated layers the size of the axes in pixels,
+    so every refresh costs the same however many vectors have arrived. The y axis
+    spans up to the next power of two above the largest value seen. When a vector
+    goes beyond it, the axis is doubled and the layers squeezed into their bottom
+    half, as `DensityHistogram` merges bins, rather than redrawn.
+
+    The previews are approximate. Vectors are drawn in the order they arrive, and
+    fancy plot colors are relative to the top of the axis rather than the largest
+    value. They are saved in place of the outputs of the Plot and Fancyplot steps,
+    which replace them with the final plots.
+
+    Parameters
+    ----------
+    staging_dir: Union[str, Path]
+        The local staging directory of the Plot and Fancyplot steps, the previews are
+        saved to plot/plots/plot.png and fancyplot/fancyplots/plot_fancy.png in it.
+    interval: float
+        The minimum number of seconds between refreshes of the saved previews.
+        Default: 60.0
+    cmap: str
+        The colormap of the fancy plot, see `fancy_plot`.
+        Default: "gnuplot"
+    """
+
+    def __init__(
+        self,
+        staging_dir: Union[str, Path],
+        interval: float = 60.0,
+        cmap: str = "gnuplot",
+    ):
+        self.plot_path = Path(staging_dir) / "plot" / "plots" / "plot.png"
+        self.fancy_path = (
+            Path(staging_dir) / "fancyplot" / "fancyplots" / "plot_fancy.png"
+        )
+        self.interval = interval
+        self.cmap = cmap
+        self.n = 0
+        self.m: Optional[int] = None
+        self.top: Optional[float] = None
+        self._pending: List[np.ndarray] = []
+        self._refreshed = time.monotonic()
+
+        # The red lines, and the colored lines over the fills of the fancy plot
+        self.lines: Optional[np.ndarray] = None
+        self.fancy_lines: Optional[np.ndarray] = None
+        self.fancy_fills: Optional[np.ndarray] = None
+
+    def _figure(self):
+        with matplotlib.style.context("seaborn-whitegrid"):
+            fig = Figure()
+            ax = fig.subplots()
+            ax.set_xlim(1, self.m)
+            ax.set_ylim(0, self.top)
+
+        return fig, ax
+
+    def _fit(self, maximum: float):
+        # Grow the y axis in powers of two so the layers can be squeezed to match
+        top = math.ldexp(1.0, math.frexp(max(maximum, 1e-300))[1])
+        if self.top is None:
+            self.top = top
+            fig, ax = self._figure()
+            (rows, columns), _ = axes_pixels(ax)
+            shape = (rows.stop - rows.start, columns.stop - columns.start, 4)
+            self.lines = np.zeros(shape)
+            self.fancy_lines = np.zeros(shape)
+            self.fancy_fills = np.zeros(shape)
+
+        while self.top < top:
+            self.top *= 2
+            self.lines = _halve_rows(self.lines)
+            self.fancy_lines = _halve_rows(self.fancy_lines)
+            self.fancy_fills = _halve_rows(self.fancy_fills)
+
+    def _draw_pending(self):
+        # Imported here as the steps import this module
+        from example_step_workflow.steps.fancyplot.plot_utils import fancy_tile
+
+        plot_matrix = np.stack(self._pending)
+        self._pending = []
+        self._fit(float(np.amax(plot_matrix)))
+
+        fig, ax = self._figure()
+        _, extent = axes_pixels(ax)
+        limits = dict(xlim=(1, self.m), ylim=(0, self.top))
+        colors = matplotlib.cm.get_cmap(self.cmap)(
+            np.clip(np.amax(plot_matrix, axis=1) / self.top, 0, 1)
+        )
+
+        lines = line_layer((plot_matrix, "r"), **limits)
+        fancy_lines, fancy_fills = fancy_tile(
+            (plot_matrix, colors), extent=extent, shape=self.lines.shape[:2], **limits
+        )
+        self.lines = over([self.lines, lines])
+        self.fancy_lines = over([self.fancy_lines, fancy_lines])
+        self.fancy_fills = over([self.fancy_fills, fancy_fills])
+
+    def _save(self, rgba: np.ndarray, save_path: Path):
+        with matplotlib.style.context("seaborn-whitegrid"):
+            fig, ax = self._figure()
+            axes_image(ax, rgba)
+            ax.set_xlim(1, self.m)
+            ax.set_ylim(0, self.top)
+            ax.set_title(f"Preview of {self.n} vectors")
+
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png")
+        write_bytes_atomic(save_path, buffer.getvalue())
+
+    def add(self, vec: np.ndarray):
+        """
+        Add a completed vector, refreshing the previews if `interval` has passed.
+        """
+        if self.m is None:
+            self.m = len(vec)
+
+        self._pending.append(vec)
+        self.n += 1
+        if time.monotonic() - self._refreshed >= self.interval:
+            self.refresh()
+
+    def refresh(self):
+        """
+        Draw the vectors added since the last refresh and save the previews.
+        """
+        if len(self._pending) == 0:
+            return
+
+        self._draw_pending()
+        self._save(self.lines, self.plot_path)
+        self._save(over([self.fancy_fills, self.fancy_lines]), self.fancy_path)
+        self._refreshed = time.monotonic()
+        log.info(
+            f"Preview of {self.n} vectors saved to: {self.plot_path}, "
+            f"{self.fancy_path}"
+        )
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+from typing import Any, Callable, List
+
+from distributed import Client, Future
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+def tree_reduce(
+    client: Client,
+    futures: List[Future],
+    combine: Callable[..., Any],
+    fanout: int = 8,
+) -> Future:
+    """
+    Combine the results of many tasks on the workers, `fanout` at a time.
+
+    Every level of the tree runs in parallel, so combining n results takes
+    log(n) / log(fanout) rounds and only the final result is sent to the client.
+
+    Parameters
+    ----------
+    client: Client
+        The client the futures belong to.
+    futures: List[Future]
+        The results to combine, at least one.
+    combine: Callable[..., Any]
+        Combines any number of results, passed as positional arguments, into one.
+        Must be associative.
+    fanout: int
+        The number of results combined by each task.
+        Default: 8
+
+    Returns
+    -------
+    result: Future
+        The combined result.
+    """
+    if len(futures) == 0:
+        raise ValueError("Nothing to reduce.")
+
+    fanout = max(fanout, 2)
+    while len(futures) > 1:
+        futures = [
+            client.submit(combine, *futures[start : start + fanout])
+            for start in range(0, len(futures), fanout)
+        ]
+
+    return futures[0]
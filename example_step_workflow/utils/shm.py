@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+from distributed import Client, as_completed
+
+from .handoff import index_from_name
+from .writer import flush_process_writer, process_writer
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+# Memory-backed on Linux, other platforms fall back to the temporary directory
+SHM_ROOT = (
+    Path("/dev/shm") if Path("/dev/shm").is_dir() else Path(tempfile.gettempdir())
+)
+
+
+class SharedHandoff(NamedTuple):
+    """
+    A reference to arrays held in shared memory on the node of a local cluster.
+
+    Mapped steps return this instead of a list of paths when asked to hand off in
+    shared memory, and accept it in place of a list of paths. Every array is a .npy
+    file in a shared memory directory, /dev/shm on Linux, that the next step's tasks
+    memory-map, so only the paths cross between processes and nothing is pickled or
+    copied.
+
+    Each path is a hard link owned by this handoff, so the number of links to an
+    array counts its references, see `retain` and `release`. The memory is freed
+    once the last reference is released and no task has the array mapped. The step
+    consuming a handoff releases it.
+
+    Attributes
+    ----------
+    paths: List[str]
+        The path of the link to each array this handoff owns.
+    names: List[str]
+        The file name each array would have if saved, e.g. "matrix_3.npy". The item
+        index is part of the name.
+    """
+
+    paths: List[str]
+    names: List[str]
+
+
+class SharedResult(NamedTuple):
+    index: int
+    shared_path: Optional[str]
+    saved_path: Optional[Path]
+    nbytes: int
+    checksum: str
+    array: Optional[np.ndarray] = None
+
+
+def shared_dir(step_name: str) -> Path:
+    """
+    A new shared memory directory for the arrays of a step run.
+    """
+    path = SHM_ROOT / f"example_step_workflow-{step_name}-{uuid.uuid4().hex}"
+    path.mkdir(parents=True)
+    return path
+
+
+def share_array(arr: np.ndarray, path: Union[str, Path]) -> str:
+    """
+    Copy an array into a shared memory file, atomically, and return its path: the
+    first reference to it.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        shared = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=arr.dtype, shape=arr.shape
+        )
+        shared[...] = arr
+        shared.flush()
+        del shared
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    return str(path)
+
+
+def attach(path: Union[str, Path]) -> np.ndarray:
+    """
+    Map a shared, or any serialized, array read-only without copying it.
+    """
+    return np.load(path, mmap_mode="r")
+
+
+def retain(path: Union[str, Path]) -> str:
+    """
+    Add a reference to a shared array and return its path, to be released on its
+    own.
+    """
+    link = f"{path}.{uuid.uuid4().hex}"
+    os.link(path, link)
+    return link
+
+
+def release(path: Union[str, Path]):
+    """
+    Drop a reference to a shared array. Its directory is removed with the last
+    array in it.
+    """
+    path = Path(path)
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        # Already released, e.g. by the cleanup of a failed run
+        return
+
+    try:
+        path.parent.rmdir()
+    except OSError:
+        pass
+
+
+def references(path: Union[str, Path]) -> int:
+    """
+    The number of references to a shared array.
+    """
+    return os.stat(path).st_nlink
+
+
+def release_handoff(handoff: SharedHandoff):
+    """
+    Drop the references of a handoff to every array.
+    """
+    for path in handoff.paths:
+        release(path)
+
+
+def run_shared(
+    kernel: Callable[..., np.ndarray],
+    name: str,
+    source: Optional[str] = None,
+    keep_dir: Optional[Path] = None,
+    save_dir: Optional[Path] = None,
+    write_behind_bytes: int = 0,
+    return_array: bool = False,
+) -> SharedResult:
+    """
+    Produce one array into shared memory, the staging directory, or both, run on a
+    worker.
+
+    Parameters
+    ----------
+    kernel: Callable[..., np.ndarray]
+        Produces the array from the source array, or from the item index when there
+        is no source.
+    name: str
+        The file name of the array, including the item index.
+    source: Optional[str]
+        The path of the input array, memory-mapped rather than read.
+        Default: None (The kernel is given the item index)
+    keep_dir: Optional[Path]
+        The shared memory directory to keep the array in.
+        Default: None (Don't keep it in shared memory)
+    save_dir: Optional[Path]
+        Where to also save the array in the staging directory.
+        Default: None (Don't save it)
+    write_behind_bytes: int
+        The write-behind budget of this worker for saves, see `AsyncWriter`.
+        Default: 0 (Synchronous writes)
+    return_array: bool
+        Should the array be sent back with the result.
+        Default: False (Only send back where it went)
+
+    Returns
+    -------
+    result: SharedResult
+        Where the array went.
+    """
+    i = index_from_name(name)
+    arr = kernel(i) if source is None else kernel(attach(source))
+
+    # Shared writes are synchronous, the next step may map them right away
+    shared_path = None
+    if keep_dir is not None:
+        shared_path = share_array(arr, keep_dir / name)
+
+    saved_path, nbytes, checksum = None, 0, ""
+    if save_dir is not None:
+        saved_path = save_dir / name
+        nbytes, checksum = process_writer(save_dir, write_behind_bytes).save(
+            saved_path, arr
+        )
+
+    return SharedResult(
+        i, shared_path, saved_path, nbytes, checksum, arr if return_array else None
+    )
+
+
+def check_single_node(client: Client):
+    """
+    Raise if the workers of a cluster aren't all on one node, shared memory is local
+    to a node.
+    """
+    hosts = {info["host"] for info in client.scheduler_info()["workers"].values()}
+    if len(hosts) > 1:
+        raise ValueError(
+            f"Shared memory handoffs need every worker on a single node, "
+            f"found workers on: {sorted(hosts)}."
+        )
+
+
+def map_shared(
+    client: Client,
+    kernel: Callable[..., np.ndarray],
+    names: List[str],
+    step_name: str,
+    sources: Optional[Union[List[str], SharedHandoff]] = None,
+    keep: bool = True,
+    save_dir: Optional[Path] = None,
+    write_behind_bytes: int = 0,
+    on_array: Optional[Callable[[int, np.ndarray], None]] = None,
+) -> Tuple[Optional[SharedHandoff], List[SharedResult]]:
+    """
+    Run `run_shared` for every item. A handoff given as sources is released once
+    every item is done.
+
+    Parameters
+    ----------
+    client: Client
+        The client to submit tasks with.
+    kernel: Callable[..., np.ndarray]
+        See `run_shared`.
+    names: List[str]
+        The file name of every output array.
+    step_name: str
+        The step producing the arrays.
+    sources: Optional[Union[List[str], SharedHandoff]]
+        The paths of the serialized input arrays, or their handoff, in the order of
+        the names.
+        Default: None (The kernel is given the item index)
+    keep: bool
+        Should the arrays be kept in shared memory and handed off.
+        Default: True
+    save_dir: Optional[Path]
+        Where to also save the arrays in the staging directory.
+        Default: None (Only keep them in shared memory)
+    write_behind_bytes: int
+        The write-behind budget of each worker for saves.
+        Default: 0 (Synchronous writes)
+    on_array: Optional[Callable[[int, np.ndarray], None]]
+        Called with the index and array of every item as it completes, the arrays
+        are then sent back from the workers.
+        Default: None (The arrays stay on the workers)
+
+    Returns
+    -------
+    handoff: Optional[SharedHandoff]
+        The reference to pass to the next step if kept.
+    results: List[SharedResult]
+        The result of every item, in the order of the names.
+    """
+    check_single_node(client)
+
+    keep_dir = shared_dir(step_name) if keep else None
+    if save_dir is not None:
+        save_dir.mkdir(parents=True, exist_ok=True)
+
+    paths = sources.paths if isinstance(sources, SharedHandoff) else sources
+    futures = client.map(
+        run_shared,
+        [kernel for name in names],
+        names,
+        [None for name in names] if paths is None else [str(p) for p in paths],
+        keep_dir=keep_dir,
+        save_dir=save_dir,
+        write_behind_bytes=write_behind_bytes,
+        return_array=on_array is not None,
+        pure=False,
+    )
+
+    # Free the arrays of a failed step, nothing can reference them yet
+    results = {}
+    try:
+        for future in as_completed(futures):
+            result = future.result()
+            if on_array is not None:
+                on_array(result.index, result.array)
+                result = result._replace(array=None)
+
+            results[result.index] = result
+    except Exception:
+        if keep_dir is not None:
+            shutil.rmtree(keep_dir, ignore_errors=True)
+
+        raise
+
+    # Wait for every worker to finish writing to the staging directory
+    if save_dir is not None:
+        client.run(flush_process_writer, save_dir)
+
+    # The inputs are consumed
+    if isinstance(sources, SharedHandoff):
+        release_handoff(sources)
+
+    ordered = [results[index_from_name(name)] for name in names]
+    if not keep:
+        return None, ordered
+
+    return (
+        SharedHandoff(
+            paths=[result.shared_path for result in ordered], names=list(names)
+        ),
+        ordered,
+    )
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import statistics
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from distributed import Client, Future, as_completed, wait
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+# `wait` raises asyncio's TimeoutError, which is only the builtin from Python 3.11
+WAIT_TIMEOUTS = (TimeoutError, asyncio.TimeoutError)
+
+###############################################################################
+
+
+def _timed(func: Callable[..., Any], *args, **kwargs) -> Tuple[float, Any]:
+    # Time the item on the worker, so the runtimes exclude scheduling
+    start = time.monotonic()
+    result = func(*args, **kwargs)
+    return time.monotonic() - start, result
+
+
+def map_completed(
+    client: Client,
+    func: Callable[..., Any],
+    *iterables: Iterable,
+    speculate: Optional[float] = None,
+    min_samples: int = 3,
+    interval: float = 0.5,
+    **kwargs,
+) -> Iterator[Any]:
+    """
+    Map a function over items on the cluster and yield the results as they complete,
+    like `client.map` followed by `as_completed`.
+
+    With `speculate`, items are submitted as threads of the cluster free up, so the
+    time each has been running is known. Once there are no items left to submit, any
+    item running longer than `speculate` times the median runtime of the completed
+    items gets a duplicate on another worker. The first copy to finish wins and the
+    other is cancelled. Both copies may still write their outputs, so the function
+    must write idempotently, e.g. with `write_bytes_atomic`.
+
+    Parameters
+    ----------
+    client: Client
+        The client to submit tasks with.
+    func: Callable[..., Any]
+        The function applied to every item.
+    *iterables: Iterable
+        The positional arguments of every item, as for `client.map`.
+    speculate: Optional[float]
+        The multiple of the median item runtime after which an item is duplicated.
+        Default: None (No duplicates, every item is submitted at once)
+    min_samples: int
+        The number of completed items needed before any item is duplicated.
+        Default: 3
+    interval: float
+        The number of seconds between checks for slow items.
+        Default: 0.5
+    **kwargs
+        The keyword arguments shared by every item.
+
+    Returns
+    -------
+    results: Iterator[Any]
+        The result of every item, in the order they complete. Each item is yielded
+        once, whichever copy finished first.
+    """
+    if speculate is None:
+        for future in as_completed(client.map(func, *iterables, **kwargs)):
+            yield future.result()
+
+        return
+
+    items = list(zip(*iterables))
+    queue = deque(range(len(items)))
+    running: Dict[Future, Tuple[int, float]] = {}
+    copies: Dict[int, List[Future]] = {}
+    runtimes: List[float] = []
+    duplicated, duplicate_wins = 0, 0
+
+    def submit(k: int, workers: Optional[List[str]] = None):
+        placement = {}
+        if workers is not None:
+            placement = dict(workers=workers, allow_other_workers=False)
+
+        future = client.submit(
+            _timed, func, *items[k], pure=False, **placement, **kwargs
+        )
+        running[future] = (k, time.monotonic())
+        copies.setdefault(k, []).append(future)
+
+    while len(queue) > 0 or len(running) > 0:
+        # Only keep as many items running as there are threads, adaptive clusters
+        # may grow or shrink between checks
+        workers = client.scheduler_info()["workers"]
+        slots = max(sum(worker["nthreads"] for worker in workers.values()), 1)
+        while len(queue) > 0 and len(running) < slots:
+            submit(queue.popleft())
+
+        # Duplicate slow items into the threads left free at the end of the map
+        free = slots - len(running)
+        if len(queue) == 0 and free > 0 and len(runtimes) >= min_samples:
+            threshold = speculate * statistics.median(runtimes)
+            processing = None
+            now = time.monotonic()
+            for future, (k, started) in list(running.items()):
+                if free == 0:
+                    break
+
+                if len(copies[k]) > 1 or now - started <= threshold:
+                    continue
+
+                # Run the duplicate anywhere but where the original is running
+                if processing is None:
+                    processing = client.processing()
+
+                others = [
+                    address
+                    for address in workers
+                    if future.key not in processing.get(address, ())
+                ]
+                if len(others) == 0 or len(others) == len(workers):
+                    continue
+
+                log.info(
+                    f"Item {k} has run for {now - started:.1f}s, over {speculate}x "
+                    f"the median of {statistics.median(runtimes):.1f}s, duplicating"
+                )
+                submit(k, workers=others)
+                duplicated += 1
+                free -= 1
+
+        try:
+            finished = wait(
+                list(running), timeout=interval, return_when="FIRST_COMPLETED"
+            ).done
+        except WAIT_TIMEOUTS:
+            continue
+
+        for future in finished:
+            # The other copy of this item already won
+            if future not in running:
+                continue
+
+            k, _ = running.pop(future)
+            runtime, result = future.result()
+            runtimes.append(runtime)
+
+            # First copy wins, cancel the rest
+            losers = [copy for copy in copies[k] if copy is not future]
+            for loser in losers:
+                running.pop(loser, None)
+
+            if len(losers) > 0:
+                client.cancel(losers)
+
+            if future is not copies[k][0]:
+                duplicate_wins += 1
+
+            yield result
+
+    if duplicated > 0:
+        log.info(
+            f"Speculation: duplicated {duplicated} slow items, "
+            f"{duplicate_wins} duplicates finished first"
+        )
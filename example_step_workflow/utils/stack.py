@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+from tqdm import tqdm
+
+from .array_io import save_array
+from .memo import _file_signature
+from .prefetch import prefetch
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+def _stack_key(vectors: List[Union[str, Path]]) -> str:
+    signatures = [_file_signature(vector) for vector in vectors]
+    return hashlib.sha256(json.dumps(signatures).encode()).hexdigest()
+
+
+def _evict_stacks(cache_dir: Path, max_stacks: int):
+    # Keep the most recently used stacks
+    stacks = sorted(
+        cache_dir.glob("*.npy"), key=lambda p: p.stat().st_mtime_ns, reverse=True
+    )
+    for stack in stacks[max_stacks:]:
+        log.debug(f"Evicting vector stack: {stack}")
+        stack.unlink()
+
+
+def load_stack(
+    vectors: List[Union[str, Path]],
+    cache_dir: Optional[Union[str, Path]] = None,
+    prefetch_depth: int = 4,
+    prefetch_max_bytes: Optional[int] = 256 * 1024 * 1024,
+    mmap_min_bytes: int = 256 * 1024 * 1024,
+    max_stacks: int = 2,
+    desc: str = "Loading vectors",
+) -> np.ndarray:
+    """
+    Read vectors into a single (n, m) matrix in one pass.
+
+    The matrix is allocated once, from the length and precision of the first vector,
+    and every vector is copied into its row as it is read. Matrices of at least
+    `mmap_min_bytes` are written straight into a memory-mapped file instead of being
+    held in memory.
+
+    If a cache directory is provided, the matrix is stored there keyed on the
+    signature (path, size and mtime) of every vector, so any later step loading the
+    same, unchanged vectors memory-maps the stored matrix instead of reading n files.
+    Steps running at the same time may both read the vectors, the stored matrix is
+    written atomically either way.
+
+    Parameters
+    ----------
+    vectors: List[Union[str, Path]]
+        The serialized vectors to load, all of the same length.
+    cache_dir: Optional[Union[str, Path]]
+        Where to store and look up loaded matrices.
+        Default: None (Do not cache)
+    prefetch_depth: int
+        The number of vectors to read ahead in the background, see `prefetch`.
+        Default: 4
+    prefetch_max_bytes: Optional[int]
+        The maximum total size of the vectors read ahead.
+        Default: 268435456 (256 MiB)
+    mmap_min_bytes: int
+        The size from which the matrix is memory-mapped from disk instead of held in
+        memory. Requires a cache directory.
+        Default: 268435456 (256 MiB)
+    max_stacks: int
+        The number of matrices to keep in the cache directory, the least recently
+        used are evicted first.
+        Default: 2
+    desc: str
+        The progress bar description.
+        Default: "Loading vectors"
+
+    Returns
+    -------
+    plot_matrix: np.ndarray
+        The vectors, one per row, in the order provided. Read-only if loaded from or
+        memory-mapped to the cache.
+    """
+    if len(vectors) == 0:
+        raise ValueError("No vectors provided.")
+
+    # Reuse a matrix another step already loaded from the same vectors
+    stack_path = None
+    if cache_dir is not None:
+        cache_dir = Path(cache_dir)
+        stack_path = cache_dir / f"{_stack_key(vectors)}.npy"
+        if stack_path.is_file():
+            log.info(f"Reusing stacked vectors: {stack_path}")
+            os.utime(stack_path)
+            return np.load(stack_path, mmap_mode="r")
+
+    loaded = prefetch(vectors, depth=prefetch_depth, max_bytes=prefetch_max_bytes)
+
+    # Allocate the matrix from the first vector
+    _, first = next(loaded)
+    n, m = len(vectors), len(first)
+    nbytes = n * m * first.dtype.itemsize
+    tmp_path = None
+    if stack_path is not None and nbytes >= mmap_min_bytes:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = stack_path.with_name(f".{stack_path.name}.{uuid.uuid4().hex}.tmp")
+        plot_matrix = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=first.dtype, shape=(n, m)
+        )
+    else:
+        plot_matrix = np.empty((n, m), dtype=first.dtype)
+
+    try:
+        # Fill the matrix in a single pass
+        plot_matrix[0] = first
+        for i, (vector, vec) in tqdm(
+            enumerate(loaded, start=1), desc=desc, initial=1, total=n
+        ):
+            if vec.shape != (m,):
+                raise ValueError(
+                    f"Vector {vector} has shape {vec.shape}, expected ({m},)."
+                )
+
+            plot_matrix[i] = vec
+
+        # Store the matrix for other steps
+        if tmp_path is not None:
+            plot_matrix.flush()
+            del plot_matrix
+            os.replace(tmp_path, stack_path)
+            plot_matrix = np.load(stack_path, mmap_mode="r")
+        elif stack_path is not None:
+            save_array(stack_path, plot_matrix)
+
+    finally:
+        if tmp_path is not None and tmp_path.exists():
+            tmp_path.unlink()
+
+    if stack_path is not None:
+        _evict_stacks(cache_dir, max_stacks)
+
+    return plot_matrix
@@ -0,0 +1,493 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import math
+import statistics
+import time
+from collections import deque
+from pathlib import Path
+from typing import (
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+import pandas as pd
+from distributed import Client, Future, wait
+
+from .array_io import save_array
+from .failures import Guarded, ItemFailure, check_failure_policy, save_quarantine
+from .kernels import invert_matrix, sum_matrix
+from .planner import annotate_resources
+from .preview import PlotPreview
+from .speculate import WAIT_TIMEOUTS
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+class DirectoryWatcher:
+    """
+    Find the new files of a directory that instruments keep adding to.
+
+    A file is only reported once its size and modification time stayed the same
+    between two polls, so files still being written are left for a later poll.
+    Hidden files, such as the temporary files of `write_bytes_atomic`, are ignored.
+
+    Parameters
+    ----------
+    input_dir: Union[str, Path]
+        The directory to watch.
+    pattern: str
+        The glob pattern of the files to report.
+        Default: "*.npy"
+    seen: Iterable[Union[str, Path]]
+        Files already processed, never reported.
+        Default: () (Report every file)
+    """
+
+    def __init__(
+        self,
+        input_dir: Union[str, Path],
+        pattern: str = "*.npy",
+        seen: Iterable[Union[str, Path]] = (),
+    ):
+        self.input_dir = Path(input_dir).resolve()
+        self.pattern = pattern
+        self.seen: Set[Path] = {Path(path).resolve() for path in seen}
+        self._candidates: Dict[Path, Tuple[int, int]] = {}
+
+    def poll(self) -> List[Path]:
+        """
+        The files that are complete and weren't reported before, oldest first.
+        """
+        ready = []
+        candidates = {}
+        for path in self.input_dir.glob(self.pattern):
+            if path.name.startswith(".") or path in self.seen or not path.is_file():
+                continue
+
+            stat = path.stat()
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._candidates.get(path) == signature:
+                ready.append((stat.st_mtime_ns, path))
+            else:
+                candidates[path] = signature
+
+        self._candidates = candidates
+        ready = [path for _, path in sorted(ready)]
+        self.seen.update(ready)
+        return ready
+
+
+class ManifestWatcher:
+    """
+    Find the new files listed in a manifest that another run keeps extending, such
+    as the manifest of `MappedRaw` run with resume and a growing n.
+
+    Parameters
+    ----------
+    manifest_path: Union[str, Path]
+        The csv manifest to watch.
+    filepath_column: str
+        The column of the files.
+        Default: "filepath"
+    seen: Iterable[Union[str, Path]]
+        Files already processed, never reported.
+        Default: () (Report every file)
+    """
+
+    def __init__(
+        self,
+        manifest_path: Union[str, Path],
+        filepath_column: str = "filepath",
+        seen: Iterable[Union[str, Path]] = (),
+    ):
+        self.manifest_path = Path(manifest_path)
+        self.filepath_column = filepath_column
+        self.seen: Set[Path] = {Path(path).resolve() for path in seen}
+        self._mtime: Optional[int] = None
+
+    def poll(self) -> List[Path]:
+        """
+        The files added to the manifest since the last poll, in manifest order.
+        """
+        # Only read the manifest again once it changed
+        if not self.manifest_path.is_file():
+            return []
+
+        mtime = self.manifest_path.stat().st_mtime_ns
+        if mtime == self._mtime:
+            return []
+
+        self._mtime = mtime
+        ready = []
+        manifest = pd.read_csv(self.manifest_path)
+        for filepath in manifest[self.filepath_column].dropna():
+            path = Path(filepath).resolve()
+            if path not in self.seen:
+                ready.append(path)
+                self.seen.add(path)
+
+        return ready
+
+
+def batch_sizes(pending: int, free_slots: int, max_batch: int) -> List[int]:
+    """
+    Coalesce the pending items into batches for the free threads of the cluster.
+
+    When there are enough free threads every item gets its own task, for the lowest
+    latency. Under load items are spread over the free threads in batches of up to
+    `max_batch`, so scheduling costs less per item, and whatever doesn't fit waits
+    for the next free thread.
+    """
+    if pending == 0 or free_slots <= 0:
+        return []
+
+    size = min(math.ceil(pending / free_slots), max_batch)
+    count = min(free_slots, math.ceil(pending / size))
+    return [min(size, pending - k * size) for k in range(count)]
+
+
+###############################################################################
+
+
+class StreamDirs(NamedTuple):
+    """
+    Where a streamed item is saved, the directories of the mapped steps. Without a
+    `raw` directory the sources are already in place and aren't copied.
+    """
+
+    raw: Optional[Path]
+    inverted: Path
+    summed: Path
+
+
+class StreamResult(NamedTuple):
+    index: int
+    source: str
+    raw_path: str
+    inverted_path: str
+    vector_path: str
+    vector: np.ndarray
+
+
+def process_item(source: str, index: int, name: str, dirs: StreamDirs) -> StreamResult:
+    """
+    Take a single matrix through the mapped steps, saving every output as they do.
+    """
+    mat = np.load(source)
+    raw_path = source
+    if dirs.raw is not None:
+        raw_path = dirs.raw / name
+        save_array(raw_path, mat)
+
+    inv = invert_matrix(mat)
+    save_array(dirs.inverted / name, inv)
+    vec = sum_matrix(inv)
+    save_array(dirs.summed / name, vec)
+
+    return StreamResult(
+        index,
+        source,
+        str(raw_path),
+        str(dirs.inverted / name),
+        str(dirs.summed / name),
+        vec,
+    )
+
+
+def process_batch(
+    items: List[Tuple[int, str, str]],
+    dirs: StreamDirs,
+    retries: int = 0,
+    failure_policy: str = "fail",
+) -> List[Union[StreamResult, ItemFailure]]:
+    """
+    Process a batch of (index, source, name) items in a single task, see `Guarded`
+    for the failure handling of every item.
+    """
+    guarded = Guarded(process_item, retries, failure_policy)
+    return [guarded(index, source, index, name, dirs) for index, source, name in items]
+
+
+def append_manifest(path: Union[str, Path], rows: pd.DataFrame):
+    """
+    Append rows to a csv manifest, creating it if needed. A manifest missing some of
+    the columns of the rows is rewritten with them.
+    """
+    path = Path(path)
+    if not path.is_file():
+        rows.to_csv(path, index=False)
+        return
+
+    columns = list(pd.read_csv(path, nrows=0).columns)
+    if set(rows.columns) <= set(columns):
+        rows.reindex(columns=columns).to_csv(path, mode="a", header=False, index=False)
+    else:
+        pd.concat([pd.read_csv(path), rows]).to_csv(path, index=False)
+
+
+def parse_index(path: Union[str, Path]) -> int:
+    # Mirrors the mapped steps, the index is part of the filename
+    return int(Path(path).name.split(".")[0].split("_")[1])
+
+
+###############################################################################
+
+
+class StreamStats(NamedTuple):
+    processed: int
+    failed: int
+    batches: int
+    latency_median: float
+    latency_max: float
+
+
+class Stream:
+    """
+    Process matrices through the invert and sum kernels as they arrive, on a
+    persistent cluster, and extend the manifests of the mapped steps as items
+    complete.
+
+    Every poll the new files reported by the watcher are queued, and as many as
+    there are free threads on the cluster are submitted, coalesced with
+    `batch_sizes`. Items therefore start within a poll of their arrival while the
+    cluster keeps up, and queue in growing batches once it doesn't. Previews of the
+    plots are refreshed incrementally, see `PlotPreview`.
+
+    Parameters
+    ----------
+    client: Client
+        The client of the persistent cluster.
+    watcher: Union[DirectoryWatcher, ManifestWatcher]
+        Reports the new matrices.
+    dirs: StreamDirs
+        Where to save the outputs of every item.
+    manifests: Dict[str, Path]
+        The manifests to extend, keyed by "raw", "inverted" and "summed". The raw
+        manifest is only extended when the sources are copied.
+    next_index: int
+        The index of the first copied source, following the items of prior runs.
+        Default: 0
+    preview: Optional[PlotPreview]
+        The previews to refresh with every vector.
+        Default: None (No previews)
+    quarantine_path: Optional[Path]
+        Where to store the failed items, see `save_quarantine`.
+        Default: None (Failed items are only logged)
+    max_batch: int
+        The maximum number of items processed by a single task.
+        Default: 16
+    poll_interval: float
+        The number of seconds between polls of the watcher.
+        Default: 1.0
+    retries: int
+        The number of times an item is retried after a transient I/O error.
+        Default: 0
+    failure_policy: str
+        "fail" to stop at the first item that fails, or "continue" to quarantine it
+        and carry on.
+        Default: "continue"
+    task_resources: Optional[Dict[str, float]]
+        The Dask resources every item needs, see `annotate_resources`. Batches are
+        annotated with the resources of a single item, they run one item at a time.
+        Default: None (No annotation)
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        watcher: Union[DirectoryWatcher, ManifestWatcher],
+        dirs: StreamDirs,
+        manifests: Dict[str, Path],
+        next_index: int = 0,
+        preview: Optional[PlotPreview] = None,
+        quarantine_path: Optional[Path] = None,
+        max_batch: int = 16,
+        poll_interval: float = 1.0,
+        retries: int = 0,
+        failure_policy: str = "continue",
+        task_resources: Optional[Dict[str, float]] = None,
+    ):
+        check_failure_policy(failure_policy)
+        self.client = client
+        self.watcher = watcher
+        self.dirs = dirs
+        self.manifests = manifests
+        self.next_index = next_index
+        self.preview = preview
+        self.quarantine_path = quarantine_path
+        self.max_batch = max_batch
+        self.poll_interval = poll_interval
+        self.retries = retries
+        self.failure_policy = failure_policy
+        self.task_resources = task_resources
+
+        self.pending: Deque[Tuple[int, str, str, float]] = deque()
+        self.in_flight: Dict[Future, List[Tuple[int, str, str, float]]] = {}
+        self.failures: List[ItemFailure] = []
+        self.latencies: List[float] = []
+        self.batches = 0
+
+    def _enqueue(self, sources: List[Path]):
+        now = time.monotonic()
+        for source in sources:
+            if self.dirs.raw is None:
+                index, name = parse_index(source), source.name
+            else:
+                index, name = self.next_index, f"matrix_{self.next_index}.npy"
+                self.next_index += 1
+
+            self.pending.append((index, str(source), name, now))
+
+    def _submit(self):
+        workers = self.client.scheduler_info()["workers"]
+        slots = max(sum(worker["nthreads"] for worker in workers.values()), 1)
+        for size in batch_sizes(
+            len(self.pending), slots - len(self.in_flight), self.max_batch
+        ):
+            batch = [self.pending.popleft() for _ in range(size)]
+            with annotate_resources(self.task_resources):
+                future = self.client.submit(
+                    process_batch,
+                    [(index, source, name) for index, source, name, _ in batch],
+                    self.dirs,
+                    retries=self.retries,
+                    failure_policy=self.failure_policy,
+                    pure=False,
+                )
+
+            self.in_flight[future] = batch
+            self.batches += 1
+
+    def _record(self, future: Future):
+        batch = self.in_flight.pop(future)
+        arrivals = {index: detected for index, _, _, detected in batch}
+        results = future.result()
+        now = time.monotonic()
+
+        done = [result for result in results if isinstance(result, StreamResult)]
+        failed = [result for result in results if isinstance(result, ItemFailure)]
+        for failure in failed:
+            log.warning(f"Streamed item {failure.index} failed: {failure.error}")
+
+        if len(failed) > 0:
+            self.failures.extend(failed)
+            if self.quarantine_path is not None:
+                save_quarantine(self.quarantine_path, self.failures)
+
+        if len(done) == 0:
+            return
+
+        # Outputs are saved atomically before the task returns, so they can be listed
+        if self.dirs.raw is not None:
+            append_manifest(
+                self.manifests["raw"],
+                pd.DataFrame(
+                    {
+                        "filepath": [result.raw_path for result in done],
+                        "source": [result.source for result in done],
+                    }
+                ),
+            )
+
+        for key, column in [("inverted", "inverted_path"), ("summed", "vector_path")]:
+            append_manifest(
+                self.manifests[key],
+                pd.DataFrame({"filepath": [getattr(r, column) for r in done]}),
+            )
+
+        for result in done:
+            self.latencies.append(now - arrivals[result.index])
+            if self.preview is not None:
+                self.preview.add(result.vector)
+
+    def stats(self) -> StreamStats:
+        """
+        The items processed so far and their latency from arrival to being listed.
+        """
+        return StreamStats(
+            processed=len(self.latencies),
+            failed=len(self.failures),
+            batches=self.batches,
+            latency_median=statistics.median(self.latencies or [0.0]),
+            latency_max=max(self.latencies or [0.0]),
+        )
+
+    def run(
+        self, idle_timeout: Optional[float] = None, max_items: Optional[int] = None
+    ) -> StreamStats:
+        """
+        Process arrivals until interrupted, until nothing arrived for `idle_timeout`
+        seconds, or until `max_items` items arrived. Items in flight are always
+        completed and listed before returning.
+        """
+        last_arrival = time.monotonic()
+        arrived = 0
+        stopping = False
+        try:
+            while not stopping or len(self.in_flight) > 0:
+                if not stopping:
+                    sources = self.watcher.poll()
+                    if max_items is not None:
+                        sources = sources[: max_items - arrived]
+
+                    if len(sources) > 0:
+                        self._enqueue(sources)
+                        arrived += len(sources)
+                        last_arrival = time.monotonic()
+
+                    self._submit()
+
+                if len(self.in_flight) > 0:
+                    try:
+                        finished = wait(
+                            list(self.in_flight),
+                            timeout=self.poll_interval,
+                            return_when="FIRST_COMPLETED",
+                        ).done
+                    except WAIT_TIMEOUTS:
+                        finished = set()
+
+                    for future in finished:
+                        self._record(future)
+                else:
+                    time.sleep(self.poll_interval)
+
+                idle = len(self.pending) == 0 and len(self.in_flight) == 0
+                if (max_items is not None and arrived >= max_items and idle) or (
+                    idle_timeout is not None
+                    and idle
+                    and time.monotonic() - last_arrival >= idle_timeout
+                ):
+                    stopping = True
+
+        except KeyboardInterrupt:
+            # Queued items are left for the next run, their sources aren't listed
+            log.info("Stopping, waiting for the items in flight")
+            for future in list(self.in_flight):
+                future.result()
+                self._record(future)
+
+        if self.preview is not None:
+            self.preview.refresh()
+
+        stats = self.stats()
+        log.info(
+            f"Streamed {stats.processed} items in {stats.batches} batches, "
+            f"{stats.failed} failed, latency median {stats.latency_median:.2f}s, "
+            f"max {stats.latency_max:.2f}s"
+        )
+        return stats
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import logging
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .array_io import write_bytes_atomic
+from .density import DensityHistogram
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+class VectorSummary:
+    """
+    Mergeable streaming statistics of vectors at every position.
+
+    Keeps the count, minimum, maximum, mean and variance (merged with Chan's parallel
+    algorithm) of the values at every position, and approximate quantiles from a
+    `DensityHistogram` of the values after an `asinh(value / scale)` transform, with a
+    memory use of O(m * bins) whatever the number of vectors.
+
+    Quantiles are accurate to one bin of the transformed values. For values much
+    larger than `scale` in magnitude that is a relative error of at most about
+    2 * (asinh(max / scale) - asinh(min / scale)) / bins, e.g. 3% for values from 0 to
+    1e6 with the default 1024 bins. Near zero the error is absolute, in units of
+    `scale`.
+
+    Vectors can be added one at a time with `append`, they are binned in chunks of
+    `chunk_size`. Summaries with the same m, bins and scale can be merged exactly in
+    any order.
+
+    Parameters
+    ----------
+    m: int
+        The length of the vectors.
+    bins: int
+        The number of bins of the quantile histogram, must be even.
+        Default: 1024
+    scale: float
+        The magnitude below which quantile accuracy becomes absolute rather than
+        relative.
+        Default: 1.0
+    chunk_size: int
+        The number of appended vectors buffered before they are added.
+        Default: 1024
+    """
+
+    def __init__(
+        self, m: int, bins: int = 1024, scale: float = 1.0, chunk_size: int = 1024
+    ):
+        self.m = m
+        self.scale = scale
+        self.chunk_size = chunk_size
+        self.n = 0
+        self.min = np.full(m, np.inf)
+        self.max = np.full(m, -np.inf)
+        self.mean = np.zeros(m)
+        self.m2 = np.zeros(m)
+        self.histogram = DensityHistogram(m, bins=bins)
+        self._buffer = []
+
+    @property
+    def bins(self) -> int:
+        return self.histogram.bins
+
+    def _flush(self):
+        if len(self._buffer) > 0:
+            chunk = np.stack(self._buffer)
+            self._buffer = []
+            self.add(chunk)
+
+    def append(self, vec: np.ndarray):
+        """
+        Add a single vector, buffered until `chunk_size` vectors are appended.
+        """
+        if vec.shape != (self.m,):
+            raise ValueError(f"Vector has shape {vec.shape}, expected ({self.m},).")
+
+        self._buffer.append(vec)
+        if len(self._buffer) >= self.chunk_size:
+            self._flush()
+
+    def add(self, chunk: np.ndarray):
+        """
+        Add a chunk of vectors, one per row, of shape (k, m).
+        """
+        chunk = np.asarray(chunk, dtype=np.float64).reshape(-1, self.m)
+        if len(chunk) == 0:
+            return
+
+        # Moments of the chunk, then merge them in
+        other = VectorSummary(self.m, bins=self.bins, scale=self.scale)
+        other.n = len(chunk)
+        other.min = chunk.min(axis=0)
+        other.max = chunk.max(axis=0)
+        other.mean = chunk.mean(axis=0)
+        other.m2 = ((chunk - other.mean) ** 2).sum(axis=0)
+        self._merge_moments(other)
+
+        self.histogram.add(np.arcsinh(chunk / self.scale))
+
+    def _merge_moments(self, other: "VectorSummary"):
+        n = self.n + other.n
+        if n == 0:
+            return
+
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.n / n)
+        self.m2 = self.m2 + other.m2 + delta**2 * (self.n * other.n / n)
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.n = n
+
+    def merge(self, other: "VectorSummary"):
+        """
+        Add the statistics of another summary of the same m, bins and scale.
+        """
+        if (other.m, other.bins, other.scale) != (self.m, self.bins, self.scale):
+            raise ValueError(
+                "Only summaries of the same shape and scale can be merged."
+            )
+
+        self._flush()
+        other._flush()
+        self._merge_moments(other)
+        self.histogram.merge(other.histogram)
+
+    @property
+    def var(self) -> np.ndarray:
+        self._flush()
+        return self.m2 / max(self.n - 1, 1)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.var)
+
+    def quantile(self, q: Union[float, Sequence[float]]) -> np.ndarray:
+        """
+        Approximate quantiles of the values at every position.
+
+        Parameters
+        ----------
+        q: Union[float, Sequence[float]]
+            The quantile or quantiles to compute, between 0 and 1.
+
+        Returns
+        -------
+        quantiles: np.ndarray
+            The quantiles at every position, of shape (m,) for a single quantile or
+            (len(q), m).
+        """
+        self._flush()
+        if self.n == 0:
+            raise ValueError("No vectors have been added.")
+
+        qs = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        hist = self.histogram
+        cumulative = np.cumsum(hist.counts, axis=1)
+
+        # Interpolate within the first bin the cumulative count reaches the rank in
+        positions = np.arange(self.m)
+        quantiles = np.empty((len(qs), self.m))
+        for k, quant in enumerate(qs):
+            rank = quant * self.n
+            bins = np.minimum((cumulative < rank).sum(axis=1), hist.bins - 1)
+            inside = hist.counts[positions, bins]
+            before = cumulative[positions, bins] - inside
+            fraction = np.clip((rank - before) / np.maximum(inside, 1), 0, 1)
+            transformed = hist.lo + (bins + fraction) * hist.width
+            quantiles[k] = np.sinh(transformed) * self.scale
+
+        # The extremes are known exactly
+        quantiles = np.clip(quantiles, self.min, self.max)
+        return quantiles[0] if np.ndim(q) == 0 else quantiles
+
+    def save(self, path: Union[str, Path], key: Optional[str] = None):
+        """
+        Atomically store the summary to a `.npz` file, along with an optional key
+        identifying the vectors it summarizes.
+        """
+        self._flush()
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            n=self.n,
+            scale=self.scale,
+            min=self.min,
+            max=self.max,
+            mean=self.mean,
+            m2=self.m2,
+            counts=self.histogram.counts,
+            histogram=[
+                self.histogram.n,
+                self.histogram.exponent if self.histogram.exponent is not None else 0,
+                self.histogram.start if self.histogram.start is not None else 0,
+            ],
+            histogram_range=[self.histogram.min, self.histogram.max],
+            key="" if key is None else key,
+        )
+        write_bytes_atomic(path, buffer.getvalue())
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> Tuple["VectorSummary", Optional[str]]:
+        """
+        Read a summary stored with `save` and the key it was stored with.
+        """
+        with np.load(path) as data:
+            m, bins = data["counts"].shape
+            summary = cls(m, bins=bins, scale=float(data["scale"]))
+            summary.n = int(data["n"])
+            summary.min = data["min"]
+            summary.max = data["max"]
+            summary.mean = data["mean"]
+            summary.m2 = data["m2"]
+            summary.histogram.counts = data["counts"]
+            n, exponent, start = (int(v) for v in data["histogram"])
+            summary.histogram.n = n
+            if n > 0:
+                summary.histogram.exponent, summary.histogram.start = exponent, start
+            summary.histogram.min, summary.histogram.max = data["histogram_range"]
+            key = str(data["key"]) or None
+
+        return summary, key
+
+
+###############################################################################
+
+
+def summarize_files(
+    paths: List[Union[str, Path]],
+    bins: int = 1024,
+    scale: float = 1.0,
+    chunk_size: int = 1024,
+) -> VectorSummary:
+    """
+    Summarize serialized vectors `chunk_size` at a time, intended to run on a worker.
+    """
+    summary = None
+    for path in paths:
+        vec = np.load(path)
+        if summary is None:
+            summary = VectorSummary(
+                len(vec), bins=bins, scale=scale, chunk_size=chunk_size
+            )
+
+        summary.append(vec)
+
+    if summary is None:
+        raise ValueError("No vectors provided.")
+
+    summary._flush()
+    return summary
+
+
+def summary_matches(path: Union[str, Path], key: str, bins: int) -> bool:
+    """
+    Check a summary was saved with the given key and number of bins.
+    """
+    if not Path(path).exists():
+        return False
+
+    summary, saved_key = VectorSummary.load(path)
+    return saved_key == key and summary.bins == bins
+
+
+def merge_summaries(*summaries: VectorSummary) -> VectorSummary:
+    """
+    Merge summaries into a new one, intended to be used with `tree_reduce`.
+    """
+    merged = VectorSummary(summaries[0].m, summaries[0].bins, summaries[0].scale)
+    for summary in summaries:
+        merged.merge(summary)
+
+    return merged
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import itertools
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Union
+
+import numpy as np
+
+from .handoff import index_from_name
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+# The parameters a sweep varies, by the steps they are passed to
+RAW_PARAMS = ("n", "m", "seed", "dtype")
+PLOT_PARAMS = ("plot_mode",)
+
+# The raw parameters the matrix of an item depends on, every matrix is seeded by its
+# index so the matrices of n items are the first n of any larger n
+GROUP_PARAMS = ("m", "seed", "dtype")
+
+
+class SweepConfig(NamedTuple):
+    """
+    A single configuration of a parameter sweep.
+
+    Attributes
+    ----------
+    name: str
+        The name of the configuration, the namespace of its plots, e.g.
+        "n=100_m=50_seed=1_dtype=float64_plot_mode=lines".
+    group: str
+        The name of the configurations generating the same raw matrices, up to their
+        number, the namespace of their raw, invert and sum steps, e.g.
+        "m=50_seed=1_dtype=float64".
+    subset: str
+        The name of the configurations using the same raw matrices, the namespace
+        of their fancy plot, e.g. "n=100_m=50_seed=1_dtype=float64".
+    raw_params: Dict[str, Any]
+        The parameters of the raw step.
+    plot_params: Dict[str, Any]
+        The parameters of the plot steps.
+    """
+
+    name: str
+    group: str
+    subset: str
+    raw_params: Dict[str, Any]
+    plot_params: Dict[str, Any]
+
+
+def _name(params: Dict[str, Any]) -> str:
+    return "_".join(f"{key}={value}" for key, value in params.items())
+
+
+def expand_grid(
+    grid: Dict[str, Union[Any, List[Any]]], defaults: Dict[str, Any]
+) -> List[SweepConfig]:
+    """
+    Every combination of the values of a parameter grid, in grid order.
+
+    Parameters
+    ----------
+    grid: Dict[str, Union[Any, List[Any]]]
+        The values of every parameter swept, any of RAW_PARAMS or PLOT_PARAMS. A
+        single value is used for every configuration.
+    defaults: Dict[str, Any]
+        The value of every parameter of RAW_PARAMS and PLOT_PARAMS not in the grid.
+
+    Returns
+    -------
+    configs: List[SweepConfig]
+        Every configuration. Configurations with the same raw parameters but n share
+        their group.
+    """
+    unknown = set(grid) - set(RAW_PARAMS + PLOT_PARAMS)
+    if len(unknown) > 0:
+        raise ValueError(
+            f"Cannot sweep {sorted(unknown)}, "
+            f"only {list(RAW_PARAMS + PLOT_PARAMS)}."
+        )
+
+    values = {key: grid.get(key, defaults[key]) for key in RAW_PARAMS + PLOT_PARAMS}
+    values = {
+        key: value if isinstance(value, (list, tuple)) else [value]
+        for key, value in values.items()
+    }
+
+    # Repeated values would stage two configurations to the same namespace
+    configs = {}
+    for combination in itertools.product(*values.values()):
+        params = dict(zip(values, combination))
+        raw_params = {key: params[key] for key in RAW_PARAMS}
+        plot_params = {key: params[key] for key in PLOT_PARAMS}
+        configs.setdefault(
+            _name(params),
+            SweepConfig(
+                name=_name(params),
+                group=_name({key: params[key] for key in GROUP_PARAMS}),
+                subset=_name(raw_params),
+                raw_params=raw_params,
+                plot_params=plot_params,
+            ),
+        )
+
+    return list(configs.values())
+
+
+def group_configs(configs: List[SweepConfig]) -> Dict[str, List[SweepConfig]]:
+    """
+    The configurations of every group, the upstream work of a group is shared by
+    all of them and runs for the largest n of the group.
+    """
+    groups = {}
+    for config in configs:
+        groups.setdefault(config.group, []).append(config)
+
+    return groups
+
+
+def group_size(members: List[SweepConfig]) -> int:
+    """
+    The number of items the upstream steps of a group run for, the largest n of its
+    configurations.
+    """
+    return max(config.raw_params["n"] for config in members)
+
+
+def first_items(vectors: List[Union[str, Path]], n: int) -> List[Union[str, Path]]:
+    """
+    The outputs of the items of index below n, in order, e.g. the vectors of a
+    configuration of n items out of those of its group.
+    """
+    return [path for path in vectors if index_from_name(Path(path).name) < n]
+
+
+def sweep_workload(configs: List[SweepConfig]) -> Dict[str, Any]:
+    """
+    The workload a sweep's cluster is planned for: the matrices of every group, the
+    largest m and the widest dtype.
+    """
+    groups = group_configs(configs)
+    raw_params = [group[0].raw_params for group in groups.values()]
+    return {
+        "n": sum(group_size(members) for members in groups.values()),
+        "m": max(params["m"] for params in raw_params),
+        "dtype": str(
+            max(
+                (np.dtype(params["dtype"]) for params in raw_params),
+                key=lambda dtype: dtype.itemsize,
+            )
+        ),
+    }
+
+
+def staging_config(root: Union[str, Path], namespace: str) -> Dict[str, str]:
+    """
+    The datastep config of a step staged under a namespace of a sweep directory.
+    """
+    return {"project_local_staging_dir": str(Path(root) / namespace)}
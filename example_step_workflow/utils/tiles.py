@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+from distributed import get_worker, worker_client
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.image import AxesImage
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+def tile_slices(n: int, tile_size: int) -> List[slice]:
+    """
+    Split n consecutive items into tiles of at most `tile_size` items, in order.
+    """
+    tile_size = max(tile_size, 1)
+    return [slice(start, min(start + tile_size, n)) for start in range(0, n, tile_size)]
+
+
+def map_tiles(
+    func: Callable[..., Any], tiles: List[Any], processes: Optional[int] = None
+) -> List[Any]:
+    """
+    Apply a function to every tile in parallel and return the results in order.
+
+    When called from a Dask worker, for example from a step of the workflow, the
+    tiles are spread across the workers of its cluster. Otherwise they are spread
+    across a pool of local processes.
+
+    Parameters
+    ----------
+    func: Callable[..., Any]
+        The function applied to each tile, must be picklable.
+    tiles: List[Any]
+        The arguments of each call.
+    processes: Optional[int]
+        The number of local processes used outside of a Dask worker.
+        Default: None (One per core)
+
+    Returns
+    -------
+    results: List[Any]
+        The result of every tile, in the order of the tiles.
+    """
+    try:
+        get_worker()
+        on_worker = True
+    except ValueError:
+        on_worker = False
+
+    if on_worker:
+        with worker_client() as client:
+            return client.gather(client.map(func, tiles, pure=False))
+
+    with ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(func, tiles))
+
+
+def _pixel_bounds(ax: Axes) -> Tuple[int, int, int, int]:
+    # The whole pixels of the canvas covered by the axes, from the bottom left
+    bbox = ax.get_window_extent()
+    return (
+        int(round(bbox.x0)),
+        int(round(bbox.x1)),
+        int(round(bbox.y0)),
+        int(round(bbox.y1)),
+    )
+
+
+def axes_pixels(ax: Axes) -> Tuple[Tuple[slice, slice], Tuple[float, ...]]:
+    """
+    Find the whole pixels of the canvas an axes covers.
+
+    Returns
+    -------
+    region: Tuple[slice, slice]
+        The rows and columns of the canvas buffer, first row at the top.
+    extent: Tuple[float, ...]
+        The data limits of those pixels, (left, right, bottom, top).
+    """
+    height = ax.figure.canvas.get_width_height()[1]
+    x0, x1, y0, y1 = _pixel_bounds(ax)
+    (left, bottom), (right, top) = ax.transData.inverted().transform(
+        [(x0, y0), (x1, y1)]
+    )
+    return (slice(height - y1, height - y0), slice(x0, x1)), (left, right, bottom, top)
+
+
+def axes_image(ax: Axes, rgba: np.ndarray, zorder: float = 2) -> AxesImage:
+    """
+    Draw an image of the pixels found by `axes_pixels` onto the axes, first row at
+    the top.
+
+    The image is placed in figure inches rather than data coordinates, so that at
+    the figure dpi every image pixel lands exactly on a canvas pixel. In data
+    coordinates rounding in the transform can drop or repeat a row of pixels. Set the
+    axes limits afterwards.
+    """
+    fig = ax.figure
+    x0, x1, y0, y1 = _pixel_bounds(ax)
+    return ax.imshow(
+        rgba,
+        extent=(x0 / fig.dpi, x1 / fig.dpi, y0 / fig.dpi, y1 / fig.dpi),
+        transform=fig.dpi_scale_trans,
+        aspect="auto",
+        origin="upper",
+        interpolation="nearest",
+        zorder=zorder,
+    )
+
+
+def axes_rgba(ax: Axes) -> np.ndarray:
+    """
+    Render the figure of an axes and return the pixels the axes covers.
+
+    Returns
+    -------
+    rgba: np.ndarray
+        The (height, width, 4) image, straight alpha as uint8, with the first row at
+        the top.
+    """
+    canvas = FigureCanvasAgg(ax.figure)
+    canvas.draw()
+    region, _ = axes_pixels(ax)
+    return np.asarray(canvas.buffer_rgba())[region].copy()
+
+
+def over(layers: Iterable[np.ndarray]) -> np.ndarray:
+    """
+    Alpha-composite straight alpha RGBA images of the same shape, each later one over
+    the ones before, as if they were drawn in that order.
+
+    Images may be uint8, such as the buffer of an Agg canvas, or floats between 0 and
+    1. The result is a float image.
+    """
+    premultiplied = None
+    for layer in layers:
+        if layer.dtype == np.uint8:
+            layer = layer / 255
+
+        if premultiplied is None:
+            premultiplied = np.zeros(layer.shape[:-1] + (3,))
+            alpha = np.zeros(layer.shape[:-1])
+
+        transmittance = 1 - layer[..., 3]
+        premultiplied *= transmittance[..., None]
+        premultiplied += layer[..., :3] * layer[..., 3:]
+        alpha = layer[..., 3] + transmittance * alpha
+
+    if premultiplied is None:
+        raise ValueError("No layers to composite.")
+
+    # Back to straight alpha
+    rgba = np.zeros(alpha.shape + (4,))
+    filled = alpha > 0
+    rgba[filled, :3] = np.clip(premultiplied[filled] / alpha[filled, None], 0, 1)
+    rgba[..., 3] = np.clip(alpha, 0, 1)
+
+    return rgba
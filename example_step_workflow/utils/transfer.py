@@ -0,0 +1,515 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import base64
+import getpass
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from datastep import Step, constants, quilt_utils
+
+from .array_io import checksum_file, write_bytes_atomic
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+def _copy_atomic(source: Path, destination: Path):
+    # Readers only ever see complete files, as with `write_bytes_atomic`
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, destination)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+class PackageStore(ABC):
+    """
+    A remote store of step packages: named sets of files, each with a logical key
+    relative to its step directory and a checksum.
+
+    Pushing a package uploads files with `put`, in batches, then records the full
+    set of files with `commit`. Files left out of a commit are removed from the
+    package.
+    """
+
+    def checksum(self, path: Path, remote: Optional[str] = None) -> str:
+        """
+        The checksum of a local file, comparable to the `remote` one listed for it.
+        Defaults to the SHA-256 of `checksum_file`.
+        """
+        return checksum_file(path)
+
+    @abstractmethod
+    def list(self, package: str) -> Dict[str, Optional[str]]:
+        """
+        The checksum of every file of a package, empty if it doesn't exist. Files
+        without a known checksum are listed with None.
+        """
+
+    @abstractmethod
+    def put(self, package: str, files: Dict[str, Path]):
+        """
+        Upload a batch of files, by logical key.
+        """
+
+    @abstractmethod
+    def get(self, package: str, logical_keys: List[str], dest: Path):
+        """
+        Download a batch of files into a directory, at their logical keys.
+        """
+
+    @abstractmethod
+    def commit(self, package: str, checksums: Dict[str, str], message: str):
+        """
+        Record the files of a package once every changed file is uploaded.
+        """
+
+
+class LocalStore(PackageStore):
+    """
+    A package store in a local or shared directory, one directory per package with
+    a checksums.json of its files. Stands in for a remote registry in tests and
+    serves as one on a shared filesystem.
+
+    Parameters
+    ----------
+    root: Union[str, Path]
+        The directory of the store.
+    """
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+
+    def _checksums_path(self, package: str) -> Path:
+        return self.root / package / "checksums.json"
+
+    def list(self, package: str) -> Dict[str, str]:
+        path = self._checksums_path(package)
+        if not path.is_file():
+            return {}
+
+        with open(path) as read_in:
+            return json.load(read_in)["files"]
+
+    def put(self, package: str, files: Dict[str, Path]):
+        for logical_key, path in files.items():
+            _copy_atomic(path, self.root / package / "files" / logical_key)
+
+    def get(self, package: str, logical_keys: List[str], dest: Path):
+        for logical_key in logical_keys:
+            _copy_atomic(
+                self.root / package / "files" / logical_key, dest / logical_key
+            )
+
+    def commit(self, package: str, checksums: Dict[str, str], message: str):
+        files_dir = self.root / package / "files"
+        for path in files_dir.rglob("*") if files_dir.exists() else []:
+            if (
+                path.is_file()
+                and path.relative_to(files_dir).as_posix() not in checksums
+            ):
+                path.unlink()
+
+        write_bytes_atomic(
+            self._checksums_path(package),
+            json.dumps({"message": message, "files": checksums}, indent=4).encode(),
+        )
+
+
+def chunked_checksum(path: Path) -> str:
+    """
+    The "sha2-256-chunked" checksum quilt records for a file: the base64 SHA-256 of
+    the SHA-256 digests of its 8 MiB parts, parts doubling in size past 10,000.
+    """
+    size = path.stat().st_size
+    part_size = 8 * 1024 * 1024
+    while math.ceil(size / part_size) > 10_000:
+        part_size *= 2
+
+    digests = []
+    with open(path, "rb") as read_in:
+        for _ in range(math.ceil(size / part_size)):
+            sha = hashlib.sha256()
+            remaining = part_size
+            for block in iter(lambda: read_in.read(min(1 << 20, remaining)), b""):
+                sha.update(block)
+                remaining -= len(block)
+
+            digests.append(sha.digest())
+
+    return base64.b64encode(hashlib.sha256(b"".join(digests)).digest()).decode()
+
+
+class QuiltStore(PackageStore):
+    """
+    The quilt package registry `datastep` pushes to, packages are the step
+    subpackages of the project package. With the files of `package_docs` the step
+    subpackages have the layout of `Step.push`.
+
+    Files are uploaded by quilt when a package is committed, only the files that
+    changed are copied. Commits are serialized as every step is part of the same
+    project package. Checksums are listed as "type:value" in the hash type quilt
+    records, "sha2-256-chunked" or the legacy "SHA256", files hashed otherwise are
+    always transferred.
+
+    Parameters
+    ----------
+    package_loc: str
+        The project package, "owner/name".
+    registry: str
+        The bucket of the registry.
+    """
+
+    def __init__(self, package_loc: str, registry: str):
+        self.package_loc = package_loc
+        self.registry = registry
+        self._staged: Dict[str, Dict[str, Path]] = {}
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._project = None
+
+    def _browse(self, refresh: bool = False):
+        import quilt3
+
+        with self._lock:
+            if self._project is None or refresh:
+                try:
+                    self._project = quilt3.Package.browse(
+                        self.package_loc, self.registry
+                    )
+                except Exception as e:
+                    log.info(f"Could not browse {self.package_loc}, starting anew: {e}")
+                    self._project = quilt3.Package()
+
+            return self._project
+
+    def _entries(self, package: str) -> Dict:
+        try:
+            return dict(self._browse()[package].walk())
+        except KeyError:
+            return {}
+
+    def checksum(self, path: Path, remote: Optional[str] = None) -> str:
+        if remote is not None and remote.startswith("SHA256:"):
+            return f"SHA256:{checksum_file(path)}"
+
+        return f"sha2-256-chunked:{chunked_checksum(path)}"
+
+    def list(self, package: str) -> Dict[str, Optional[str]]:
+        return {
+            logical_key: (
+                None
+                if entry.hash is None
+                else f"{entry.hash.get('type')}:{entry.hash.get('value')}"
+            )
+            for logical_key, entry in self._entries(package).items()
+        }
+
+    def put(self, package: str, files: Dict[str, Path]):
+        with self._lock:
+            self._staged.setdefault(package, {}).update(files)
+
+    def get(self, package: str, logical_keys: List[str], dest: Path):
+        entries = self._entries(package)
+        for logical_key in logical_keys:
+            entries[logical_key].fetch(dest / logical_key)
+
+    def commit(self, package: str, checksums: Dict[str, str], message: str):
+        with self._lock:
+            staged = self._staged.pop(package, {})
+
+        # Steps share the project package, commit them one at a time
+        with self._commit_lock:
+            remote = self._entries(package)
+            project = self._browse(refresh=True)
+            if package in project:
+                project = project.delete(package)
+
+            for logical_key in checksums:
+                entry = staged.get(logical_key, remote.get(logical_key))
+                project.set(f"{package}/{logical_key}", entry)
+
+            # Only copy the files that aren't in the registry already
+            pushed = project.push(
+                self.package_loc,
+                registry=self.registry,
+                message=message,
+                selector_fn=lambda logical_key, entry: entry.physical_key.is_local(),
+            )
+            with self._lock:
+                self._project = pushed
+
+
+###############################################################################
+
+
+class TransferStats(NamedTuple):
+    step: str
+    package: str
+    transferred: int
+    skipped: int
+    batches: int
+    nbytes: int
+
+
+def step_files(step: Step) -> Dict[str, Path]:
+    """
+    The files of a step to push, by logical key relative to its staging directory:
+    its manifest, parameters, and every file in the filepath columns of its manifest.
+    """
+    root = Path(step.step_local_staging_dir).resolve()
+    files = {}
+    for name in ["manifest.csv", "run_parameters.json", "init_parameters.json"]:
+        if (root / name).is_file():
+            files[name] = root / name
+
+    if step.manifest is not None:
+        for column in step.filepath_columns:
+            for filepath in step.manifest[column].dropna():
+                path = Path(filepath).resolve()
+                if root not in path.parents:
+                    raise ValueError(
+                        f"File {path} of step {step.step_name} is outside of its "
+                        f"staging directory: {root}."
+                    )
+
+                files[path.relative_to(root).as_posix()] = path
+
+    return files
+
+
+def package_docs(step: Step, dest: Path) -> Dict[str, Path]:
+    """
+    The files `Step.push` adds to a step package besides the step files, written to
+    a directory: its manifest with filepaths relative to the package, which a step
+    reads before manifest.csv once checked out, and its README.
+    """
+    docs = {}
+    if step.manifest is not None:
+        _, relative_manifest = quilt_utils.create_package(
+            manifest=step.manifest,
+            step_pkg_root=step.step_local_staging_dir,
+            filepath_columns=step.filepath_columns,
+            metadata_columns=step.metadata_columns,
+        )
+        docs["manifest.parquet"] = dest / "manifest.parquet"
+        relative_manifest.to_parquet(docs["manifest.parquet"])
+
+    docs["README.md"] = dest / "README.md"
+    docs["README.md"].write_text(
+        constants.README_TEMPLATE.render(
+            quilt_package_name=step._quilt_package_name,
+            source_url=step._get_git_origin_url(),
+            branch_name=step._get_current_git_branch(),
+            commit_hash=step._get_current_git_commit_hash(),
+            creator=getpass.getuser(),
+        )
+    )
+
+    return docs
+
+
+def batch_files(
+    sizes: Dict[str, int], batch_bytes: int = 16 * 1024 * 1024, max_files: int = 256
+) -> List[List[str]]:
+    """
+    Group files into batches of at most `batch_bytes` and `max_files`, so many small
+    files are transferred together. Files larger than a batch go alone.
+    """
+    batches, batch, total = [], [], 0
+    for logical_key in sorted(sizes, key=lambda key: sizes[key]):
+        size = sizes[logical_key]
+        if len(batch) > 0 and (total + size > batch_bytes or len(batch) >= max_files):
+            batches.append(batch)
+            batch, total = [], 0
+
+        batch.append(logical_key)
+        total += size
+
+    if len(batch) > 0:
+        batches.append(batch)
+
+    return batches
+
+
+class TransferEngine:
+    """
+    Push and checkout the packages of several steps concurrently and incrementally.
+
+    Every step is transferred in its own task of a pool of `max_workers`. Files
+    whose checksum matches the other side are skipped, the rest are grouped with
+    `batch_files` and transferred by a second pool of `max_workers` shared by every
+    step.
+
+    Parameters
+    ----------
+    store: PackageStore
+        The remote store of the packages.
+    max_workers: int
+        The number of steps, and of batches of files, transferred at once.
+        Default: 4
+    batch_bytes: int
+        The maximum size of a batch of small files.
+        Default: 16777216 (16 MiB)
+    """
+
+    def __init__(
+        self,
+        store: PackageStore,
+        max_workers: int = 4,
+        batch_bytes: int = 16 * 1024 * 1024,
+    ):
+        self.store = store
+        self.max_workers = max_workers
+        self.batch_bytes = batch_bytes
+
+    @staticmethod
+    def _transfer(
+        pool: ThreadPoolExecutor,
+        func: Callable[..., None],
+        package: str,
+        batches: List,
+        *args,
+    ):
+        # Transfer every batch concurrently and raise the first error
+        for future in [pool.submit(func, package, batch, *args) for batch in batches]:
+            future.result()
+
+    def _push_step(
+        self, step: Step, branch: str, message: str, pool: ThreadPoolExecutor
+    ) -> TransferStats:
+        package = f"{branch}/{step.step_name}"
+        with TemporaryDirectory() as tempdir:
+            # Packaged as `Step.push` does, so a plain `Step.checkout` still works
+            files = {**step_files(step), **package_docs(step, Path(tempdir))}
+
+            # Only upload what changed since the last push
+            remote = self.store.list(package)
+            checksums = dict(
+                zip(
+                    files,
+                    pool.map(
+                        self.store.checksum,
+                        [files[key] for key in files],
+                        [remote.get(key) for key in files],
+                    ),
+                )
+            )
+            changed = [key for key in files if remote.get(key) != checksums[key]]
+            sizes = {key: files[key].stat().st_size for key in changed}
+            batches = batch_files(sizes, self.batch_bytes)
+            self._transfer(
+                pool,
+                self.store.put,
+                package,
+                [{key: files[key] for key in batch} for batch in batches],
+            )
+            self.store.commit(package, checksums, message)
+
+        return TransferStats(
+            step.step_name,
+            package,
+            len(changed),
+            len(files) - len(changed),
+            len(batches),
+            sum(sizes.values()),
+        )
+
+    def _checkout_step(
+        self, step: Step, branch: str, pool: ThreadPoolExecutor
+    ) -> TransferStats:
+        # Fall back to the data of the master branch as `Step.checkout` does
+        package = f"{branch}/{step.step_name}"
+        remote = self.store.list(package)
+        if len(remote) == 0:
+            package = f"master/{step.step_name}"
+            remote = self.store.list(package)
+            if len(remote) == 0:
+                raise FileNotFoundError(f"No data found for step: {step.step_name}.")
+
+        # Only download what differs from the local files
+        root = Path(step.step_local_staging_dir)
+
+        def differs(key: str) -> bool:
+            path = root / key
+            return not path.is_file() or (
+                self.store.checksum(path, remote[key]) != remote[key]
+            )
+
+        changed = [key for key, diff in zip(remote, pool.map(differs, remote)) if diff]
+
+        # Remote sizes aren't listed, batch by count
+        batches = batch_files({key: 0 for key in changed}, self.batch_bytes)
+        self._transfer(pool, self.store.get, package, batches, root)
+
+        return TransferStats(
+            step.step_name,
+            package,
+            len(changed),
+            len(remote) - len(changed),
+            len(batches),
+            sum((root / key).stat().st_size for key in changed),
+        )
+
+    def _run(
+        self, func: Callable[..., TransferStats], steps: List[Step], *args
+    ) -> List[TransferStats]:
+        with ThreadPoolExecutor(self.max_workers) as steps_pool, ThreadPoolExecutor(
+            self.max_workers
+        ) as files_pool:
+            futures = [
+                steps_pool.submit(func, step, *args, files_pool) for step in steps
+            ]
+            stats = [future.result() for future in futures]
+
+        for stat in stats:
+            log.info(
+                f"{stat.step}: transferred {stat.transferred} files "
+                f"({stat.nbytes} bytes in {stat.batches} batches), "
+                f"skipped {stat.skipped} unchanged files of {stat.package}"
+            )
+
+        return stats
+
+    def push(
+        self, steps: List[Step], branch: str, message: Optional[str] = None
+    ) -> List[TransferStats]:
+        """
+        Push the files of every step to its package on the branch.
+        """
+        return self._run(self._push_step, steps, branch, message or "")
+
+    def checkout(self, steps: List[Step], branch: str) -> List[TransferStats]:
+        """
+        Fetch the package of every step on the branch into its staging directory.
+        """
+        return self._run(self._checkout_step, steps, branch)
+
+
+def unique_steps(steps: List[Step]) -> Tuple[Step, ...]:
+    """
+    Drop repeated steps, by name, keeping the first of each.
+    """
+    seen = {}
+    for step in steps:
+        seen.setdefault(step.step_name, step)
+
+    return tuple(seen.values())
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+The transports mapped steps hand arrays to each other through instead of the staging
+directory: worker memory, worker scratch or shared memory. Each transport maps a
+kernel over the items, optionally keeps the outputs for the next step and optionally
+saves them, so a step handles every transport the same way.
+"""
+
+import logging
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from datastep import Step
+from distributed import Client
+
+from .handoff import ArrayHandoff, index_from_name, keep_or_save, retrieve
+from .locality import ScratchHandoff, map_local, save_locality_stats
+from .shm import SharedHandoff, map_shared
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+Handoff = Union[ArrayHandoff, ScratchHandoff, SharedHandoff]
+
+# The handoff each transport returns
+HANDOFFS = {
+    "locality": ScratchHandoff,
+    "shared_memory": SharedHandoff,
+    "in_memory": ArrayHandoff,
+}
+
+###############################################################################
+
+
+def transport_mode(
+    inputs: Optional[Union[List[Path], Handoff]] = None,
+    in_memory: bool = False,
+    locality: bool = False,
+    shared_memory: bool = False,
+) -> Optional[str]:
+    """
+    The transport a mapped step uses: the one it is asked to hand its outputs off
+    through, otherwise the one its inputs were handed off through.
+
+    Parameters
+    ----------
+    inputs: Optional[Union[List[Path], Handoff]]
+        The inputs of the step.
+        Default: None (The step has no inputs)
+    in_memory: bool
+        Should the outputs be kept in worker memory.
+        Default: False
+    locality: bool
+        Should the outputs be kept in worker scratch.
+        Default: False
+    shared_memory: bool
+        Should the outputs be kept in shared memory.
+        Default: False
+
+    Returns
+    -------
+    mode: Optional[str]
+        "locality", "shared_memory" or "in_memory", or None to read and save through
+        the staging directory.
+    """
+    flags = dict(locality=locality, shared_memory=shared_memory, in_memory=in_memory)
+    if sum(flags.values()) > 1:
+        raise ValueError("Use only one of in_memory, locality or shared_memory.")
+
+    for mode, handoff_type in HANDOFFS.items():
+        if flags[mode] or isinstance(inputs, handoff_type):
+            return mode
+
+    return None
+
+
+def check_transport_failures(mode: Optional[str], retries: int, failure_policy: str):
+    """
+    Raise if items handed off through a transport are to be retried or quarantined,
+    only items read and saved through the staging directory are guarded.
+    """
+    if mode is not None and (retries > 0 or failure_policy == "continue"):
+        raise ValueError(
+            f"Retries and the 'continue' failure policy don't apply to items handed "
+            f"off through {mode}, use the staging directory instead."
+        )
+
+
+def handoff_names(inputs: Union[List[Path], Handoff]) -> List[str]:
+    """
+    The file name of every input array, including its item index.
+    """
+    if isinstance(inputs, ScratchHandoff):
+        return [Path(path).name for path in inputs.paths]
+    if isinstance(inputs, (ArrayHandoff, SharedHandoff)):
+        return list(inputs.names)
+
+    return [Path(path).name for path in inputs]
+
+
+def map_transport(
+    client: Client,
+    mode: str,
+    kernel: Callable[..., np.ndarray],
+    names: List[str],
+    step_name: str,
+    sources: Optional[Union[List[Path], Handoff]] = None,
+    keep: bool = True,
+    save_dir: Optional[Path] = None,
+    write_behind_bytes: int = 0,
+    stats_path: Optional[Path] = None,
+    on_array: Optional[Callable[[int, np.ndarray], None]] = None,
+) -> Tuple[Optional[Handoff], List[Tuple[int, Path]]]:
+    """
+    Map a kernel over the items through a transport, see `map_local`, `map_shared`
+    and `keep_or_save`.
+
+    Parameters
+    ----------
+    client: Client
+        The client to submit tasks with.
+    mode: str
+        The transport, see `transport_mode`.
+    kernel: Callable[..., np.ndarray]
+        Produces each array from its input array, or from the item index when there
+        are no sources.
+    names: List[str]
+        The file name of every output array, including its item index.
+    step_name: str
+        The step producing the arrays.
+    sources: Optional[Union[List[Path], Handoff]]
+        The paths of the input arrays, or their handoff, in the order of the names.
+        Default: None (The kernel is given the item index)
+    keep: bool
+        Should the arrays be kept and handed off.
+        Default: True
+    save_dir: Optional[Path]
+        Where to also save the arrays in the staging directory.
+        Default: None (Only keep them)
+    write_behind_bytes: int
+        The write-behind budget of each worker for saves, see `AsyncWriter`.
+        Default: 0 (Synchronous writes)
+    stats_path: Optional[Path]
+        Where to store the locality stats of the items, see `save_locality_stats`.
+        Default: None (Don't store them)
+    on_array: Optional[Callable[[int, np.ndarray], None]]
+        Called with the index and array of every item as it completes, the arrays
+        are then sent back from the workers.
+        Default: None (The arrays stay on the workers)
+
+    Returns
+    -------
+    handoff: Optional[Handoff]
+        The reference to pass to the next step if kept.
+    saved: List[Tuple[int, Path]]
+        The item index and path of each saved array, in the order of the names.
+    """
+    if mode == "locality":
+        if sources is not None and not isinstance(sources, ScratchHandoff):
+            sources = ScratchHandoff(
+                paths=[str(path) for path in sources],
+                workers=[None for path in sources],
+            )
+
+        handoff, results = map_local(
+            client,
+            kernel,
+            names,
+            step_name,
+            handoff=sources,
+            keep=keep,
+            save_dir=save_dir,
+            write_behind_bytes=write_behind_bytes,
+            on_array=on_array,
+        )
+        if stats_path is not None:
+            save_locality_stats(stats_path, results)
+
+    elif mode == "shared_memory":
+        handoff, results = map_shared(
+            client,
+            kernel,
+            names,
+            step_name,
+            sources=sources,
+            keep=keep,
+            save_dir=save_dir,
+            write_behind_bytes=write_behind_bytes,
+            on_array=on_array,
+        )
+
+    elif mode == "in_memory":
+        if sources is None:
+            inputs = [index_from_name(name) for name in names]
+        elif isinstance(sources, ArrayHandoff):
+            inputs = retrieve(client, sources)
+        else:
+            inputs = client.map(np.load, sources)
+
+        handoff, saved = keep_or_save(
+            client,
+            client.map(kernel, inputs),
+            names,
+            save_dir,
+            step_name,
+            keep=keep,
+            save=save_dir is not None,
+            write_behind_bytes=write_behind_bytes,
+            on_array=on_array,
+        )
+        return handoff, saved
+
+    else:
+        raise ValueError(f"Unknown transport: '{mode}'.")
+
+    if save_dir is None:
+        return handoff, []
+
+    return handoff, [(result.index, result.saved_path) for result in results]
+
+
+def save_manifest(step: Step, saved: List[Tuple[int, Path]]):
+    """
+    Make the arrays a transport saved the manifest of a step and save it to the step
+    local staging directory.
+    """
+    step.manifest = pd.DataFrame(
+        {"filepath": [path for _, path in saved]}, index=[i for i, _ in saved]
+    )
+    step.manifest.to_csv(step.step_local_staging_dir / "manifest.csv", index=False)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Tuple, Union
+
+import numpy as np
+
+from .array_io import checksum_bytes, serialize_array, write_bytes_atomic
+
+###############################################################################
+
+log = logging.getLogger(__name__)
+
+###############################################################################
+
+
+class AsyncWriter:
+    """
+    A bounded write-behind queue for step outputs.
+
+    Arrays are serialized in the calling thread, so their size and checksum are known
+    immediately, and written to disk by a thread pool while the caller continues. The
+    total size of the outputs waiting to be written is capped at `max_bytes`: once the
+    budget is used up, `save` blocks until earlier writes complete.
+
+    Errors from background writes are raised by the next call to `save` or `flush`.
+    Always `flush` (or exit the context manager) before writing a manifest that
+    references the outputs.
+
+    Parameters
+    ----------
+    max_bytes: int
+        The maximum total size of the outputs waiting to be written. A single output
+        larger than the budget is still written, but only once nothing else is queued.
+        Use 0 to write every output in the calling thread.
+        Default: 268435456 (256 MiB)
+    max_workers: int
+        The number of threads writing outputs.
+        Default: 4
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, max_workers: int = 4):
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self._executor = None
+        self._condition = threading.Condition()
+        self._pending = set()
+        self._pending_bytes = 0
+        self._errors = []
+
+    def __enter__(self) -> "AsyncWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Don't mask the original error with a write error
+        if exc_type is None:
+            self.close()
+        else:
+            self._shutdown()
+
+    def _raise_errors(self):
+        with self._condition:
+            if self._errors:
+                error = self._errors[0]
+                self._errors = []
+                raise error
+
+    def _done(self, future: Future, nbytes: int):
+        with self._condition:
+            self._pending.discard(future)
+            self._pending_bytes -= nbytes
+            if future.exception() is not None:
+                self._errors.append(future.exception())
+
+            self._condition.notify_all()
+
+    def save(self, save_path: Union[str, Path], arr: np.ndarray) -> Tuple[int, str]:
+        """
+        Queue an array to be atomically saved to a `.npy` file.
+
+        Parameters
+        ----------
+        save_path: Union[str, Path]
+            Where to store the array. Parent directories are created as needed.
+        arr: np.ndarray
+            The array to store.
+
+        Returns
+        -------
+        nbytes: int
+            The size the file will have in bytes.
+        checksum: str
+            The checksum the file will have.
+        """
+        data = serialize_array(arr)
+        nbytes = len(data)
+
+        # Synchronous writes
+        if self.max_bytes <= 0:
+            write_bytes_atomic(save_path, data)
+            return nbytes, checksum_bytes(data)
+
+        # Surface earlier failures as early as possible
+        self._raise_errors()
+
+        # Wait for room in the budget
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._pending_bytes == 0
+                or self._pending_bytes + nbytes <= self.max_bytes
+            )
+            self._pending_bytes += nbytes
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers)
+
+            future = self._executor.submit(write_bytes_atomic, save_path, data)
+            self._pending.add(future)
+
+        future.add_done_callback(lambda f: self._done(f, nbytes))
+
+        return nbytes, checksum_bytes(data)
+
+    def flush(self):
+        """
+        Wait until every queued output is written and raise the first write error.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: len(self._pending) == 0)
+
+        self._raise_errors()
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def close(self):
+        """
+        Flush and stop the writing threads.
+        """
+        try:
+            self.flush()
+        finally:
+            self._shutdown()
+
+
+###############################################################################
+
+# A writer per owner, shared by the tasks of that owner running in this process
+_process_writers: Dict[str, AsyncWriter] = {}
+_process_writers_lock = threading.Lock()
+
+
+def process_writer(
+    owner: Union[str, Path], max_bytes: int = 256 * 1024 * 1024
+) -> AsyncWriter:
+    """
+    Get the write-behind queue of `owner` in this process.
+
+    Mapped kernels queue their outputs here and return immediately, the step then
+    waits for every worker to `flush_process_writer` before writing its manifest.
+    Every step run uses its output directory as owner, so steps running at the same
+    time on a worker keep their own budget and never see each other's write errors.
+
+    Parameters
+    ----------
+    owner: Union[str, Path]
+        What the queued outputs belong to, usually the directory they are saved to.
+    max_bytes: int
+        The budget of the queue, see `AsyncWriter`. Only used when the queue of
+        `owner` is created.
+        Default: 268435456 (256 MiB)
+
+    Returns
+    -------
+    writer: AsyncWriter
+        The writer of `owner` in this process.
+    """
+    with _process_writers_lock:
+        key = str(owner)
+        if key not in _process_writers:
+            _process_writers[key] = AsyncWriter(max_bytes=max_bytes)
+
+        return _process_writers[key]
+
+
+def flush_process_writer(owner: Union[str, Path]):
+    """
+    Flush and close the write-behind queue of `owner` in this process if there is
+    one, raising only the write errors of `owner`.
+    Intended to be run on every worker with `client.run`.
+
+    Parameters
+    ----------
+    owner: Union[str, Path]
+        The owner given to `process_writer`.
+    """
+    with _process_writers_lock:
+        writer = _process_writers.pop(str(owner), None)
+
+    if writer is not None:
+        writer.close()
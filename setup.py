@@ -58,6 +58,7 @@ requirements = [
     "prefect",
     "python-dateutil<=2.8.0",  # need <=2.8.0 for quilt3 in step
     "seaborn",
+    "threadpoolctl",
 ]
 
 extra_requirements = {